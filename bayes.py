@@ -1,9 +1,18 @@
+from collections.abc import Mapping
+from itertools import product
 from networkx import DiGraph, Graph
 import networkx as nx
-import matplotlib.pyplot as plt
+from inference.cache import dependencies, query_cache, query_key
+from inference.factors import compile_network, network_revision, update_compiled
+from inference.junction_tree import posterior_marginals
+from inference.paths import path_free_probability
+from inference.relevance import relevant_network
+from inference.stats import instrument, phase
 
 
 def print_graph(graph: nx.Graph):
+    #matplotlib is only needed to draw, so it is not imported with the module
+    import matplotlib.pyplot as plt
     pos = nx.spring_layout(graph)
     nx.draw_networkx_nodes(graph, pos, nodelist=[node for node in graph.nodes], node_color='r')
     nx.draw_networkx_labels(graph, pos, labels={node: f"{node}" for node in graph.nodes})
@@ -15,20 +24,158 @@ def print_graph(graph: nx.Graph):
     plt.show()
 
 
-def create_bayes_network(graph: Graph,weather:dict,broken_given_weather:dict) -> DiGraph:
+class Table(dict):
+    """A dict of probabilities that bumps the revision of its network whenever it is changed.
+
+    All the tables of a network created by create_bayes_network are Tables, so anything cached
+    on the network (the compiled network, the junction tree, query results) notices the change.
+    """
+
+    def __init__(self, network_attributes: dict, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.network_attributes = network_attributes
+
+    def changed(self):
+        self.network_attributes["revision"] = self.network_attributes.get("revision", 0) + 1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.changed()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.changed()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.changed()
+        return super().setdefault(key, default)
+
+    def pop(self, key, *default):
+        #a missing key raises KeyError or returns the default, the table does not change
+        if key not in self:
+            return super().pop(key, *default)
+        value = super().pop(key)
+        self.changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self.changed()
+        return item
+
+    def clear(self):
+        super().clear()
+        self.changed()
+
+    def __ior__(self, other):
+        #table |= {...} updates the dict in place without going through update
+        super().__ior__(other)
+        self.changed()
+        return self
+
+
+class BayesNetwork(DiGraph):
+    """A DiGraph that bumps graph["revision"] whenever a node or an edge is added or removed.
+
+    With its Tables every change of the network bumps the revision, so network_revision does not
+    have to count the edges of the network (networkx counts them node by node).
+    """
+
+    #network_revision can rely on graph["revision"] alone
+    tracks_structure = True
+
+    def changed(self):
+        self.graph["revision"] = self.graph.get("revision", 0) + 1
+
+    def add_node(self, node_for_adding, **attr):
+        super().add_node(node_for_adding, **attr)
+        self.changed()
+
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        super().add_nodes_from(nodes_for_adding, **attr)
+        self.changed()
+
+    def remove_node(self, n):
+        super().remove_node(n)
+        self.changed()
+
+    def remove_nodes_from(self, nodes):
+        super().remove_nodes_from(nodes)
+        self.changed()
+
+    def add_edge(self, u_of_edge, v_of_edge, **attr):
+        super().add_edge(u_of_edge, v_of_edge, **attr)
+        self.changed()
+
+    def add_edges_from(self, ebunch_to_add, **attr):
+        super().add_edges_from(ebunch_to_add, **attr)
+        self.changed()
+
+    def remove_edge(self, u, v):
+        super().remove_edge(u, v)
+        self.changed()
+
+    def remove_edges_from(self, ebunch):
+        super().remove_edges_from(ebunch)
+        self.changed()
+
+    def clear(self):
+        super().clear()
+        self.changed()
+
+    def clear_edges(self):
+        super().clear_edges()
+        self.changed()
+
+
+class NoisyOrTable(Mapping):
+    """The conditional table P(Ev(i)=state|parents) of a noisy-OR node.
+
+    Keys are in the format "B(1)='0', B(2)='1'" (the parents in the order of inhibitors), the value of a key
+    is computed from the inhibitors when it is looked up, so the 2^len(inhibitors) rows are never stored.
+    """
+
+    def __init__(self, inhibitors: dict, state: str):
+        self.inhibitors = inhibitors
+        self.state = state
+
+    def __getitem__(self, key: str):
+        #probability of no people = product of the inhibitors of the blocked parents
+        prob = 1
+        for parent_state in key.split(", ") if key else []:
+            parent, value = parent_state.split("=")
+            if parent not in self.inhibitors or value.strip("'") not in ("0", "1"):
+                raise KeyError(key)
+            if value.strip("'") == "1":
+                prob *= self.inhibitors[parent]
+        return prob if self.state == "0" else 1-prob
+
+    def __iter__(self):
+        for values in product("01", repeat=len(self.inhibitors)):
+            yield ", ".join(parent+"='"+value+"'" for parent, value in zip(self.inhibitors, values))
+
+    def __len__(self):
+        return 2**len(self.inhibitors)
+
+
+def create_bayes_network(graph: Graph,weather:dict,broken_given_weather:dict,p1:float=0.2,p2:float=0.3) -> DiGraph:
     """Create a bayes network from a graph.
+    To calibrate p1, p2, the weather or x(i) without building the network again for every value,
+    use inference.sweep.ParameterizedNetwork.
     Args:
         graph (Graph): A graph representing a bayes network.
         input (str): The input file name.
+        p1 (float): the inhibitor of a blocked neighbour is min(1, p1*w(i,j)).
+        p2 (float): the inhibitor of the node's own blockage.
 
     Returns:
-        DiGraph: A directed graph representing a bayes network.
+        DiGraph: A directed graph representing a bayes network (a BayesNetwork, which keeps its revision up to date).
     """
-    #query the user for parameters p1 and p2:
-    # p1 = float(input("Enter p1: "))
-    # p2 = float(input("Enter p2: "))
-    p1=0.2
-    p2=0.3
     """Create a directed graph with:
             1. a weather node W with 3 states: mild, stormy, extreme
             2. for each node i in the graph, B(i) is a node representing the breakage of i'th node with 2 states: true, false.
@@ -44,10 +191,12 @@ def create_bayes_network(graph: Graph,weather:dict,broken_given_weather:dict) ->
              
             Ev(i) is connected to B(i) and all other B(j) nodes that are neighbors of i.
     """  
-    #create a directed graph
-    bayes_network = DiGraph()
+    #create a directed graph, p1 and p2 are kept for the edits of the roads (see set_road)
+    bayes_network = BayesNetwork(revision=0, p1=p1, p2=p2)
+    #every table is a Table, so changing a probability bumps bayes_network.graph["revision"]
+    tables = bayes_network.graph
     #add nodes to the graph
-    bayes_network.add_node("W", states=["mild", "stormy", "extreme"], probabilities={})
+    bayes_network.add_node("W", states=["mild", "stormy", "extreme"], probabilities=Table(tables))
     #add to the weather node the probabilities of each state from the dictionary
     for state in weather:
         bayes_network.nodes["W"]["probabilities"][state] = weather[state]
@@ -55,127 +204,215 @@ def create_bayes_network(graph: Graph,weather:dict,broken_given_weather:dict) ->
         
     #add the breakage nodes to the graph
     for node in graph.nodes:
-        bayes_network.add_node("B("+str(node)+")", states=["true", "false"], probabilities={})
-        #add to the breakage node the probabilities of each state from the dictionary this way: dictionary["node"] = x(i)
-        xi = float(broken_given_weather[node])
-        bayes_network.nodes["B("+str(node)+")"]["probabilities"]["B("+str(node)+")=1"] = {"mild": xi, 'stormy': 2*xi, 'extreme': 3*xi}
-        bayes_network.nodes["B("+str(node)+")"]["probabilities"]["B("+str(node)+")=0"] = {"mild": 1-xi, "stormy": 1-2*xi, "extreme": 1-3*xi}
-        #add an edge between the weather node and the breakage node
-        bayes_network.add_edge("W", "B("+str(node)+")")
+        add_blockage_node(bayes_network, node, float(broken_given_weather[node]))
 
     #add the people nodes to the graph
     for node in graph.nodes:
-        bayes_network.add_node("Ev("+str(node)+")", states=["true", "false"], probabilities={})
-        # we want to add the probabilities given the breakage of the node and the breakage of its neighbors
-        # we will use a dictionary to store the probabilities
-        # each key in the dictionary will be a tuple of the states of the breakage of the node and its neighbors
-        # each value in the dictionary will be the probability of the node not containing people given the states of the breakage of the node and its neighbors
-        probabilities_false = {}
-        # we will use a list to store the states of the breakage of the node and its neighbors
-        relevant_nodes = []
-        if bayes_network.nodes["B("+str(node)+")"]["probabilities"]["B("+str(node)+")=1"]['mild'] > 0:
-            relevant_nodes.append("B("+str(node)+")")
+        add_evacuees_node(bayes_network, node)
+        # Ev(i) is a noisy-OR of the breakage of the node and the breakage of its neighbors:
+        # each blocked parent j independently fails to bring people to i with probability inhibitors[j]
+        # (p2 for the node itself, min(1,p1*w(i,j)) for a neighbor), so
+        # P(Ev(i)=0|parents) = the product of the inhibitors of the blocked parents.
+        # only the inhibitors are stored, so the size of the node is linear in its degree
+        inhibitors = bayes_network.nodes["Ev("+str(node)+")"]["inhibitors"]
+        #B(i) can only be blocked if x(i) > 0, otherwise it can't affect Ev(i)
+        if blockage(bayes_network, node) > 0:
+            inhibitors["B("+str(node)+")"] = p2
         for neighbor in graph.neighbors(node):
-            #print(bayes_network.nodes["B("+str(neighbor)+")"]["probabilities"])
-            # if bayes_network.nodes["B("+str(neighbor)+")"]["probabilities"]["B("+str(neighbor)+")=1"]['mild'] > 0:
-            #     relevant_nodes.append("B("+str(neighbor)+")")
-            relevant_nodes.append("B("+str(neighbor)+")")
-            
+            inhibitors["B("+str(neighbor)+")"] = min(1, p1*graph[node][neighbor]["weight"])
+        #connect the node to the breakage node and all the breakage nodes of its neighbors
+        for parent in inhibitors:
+            bayes_network.add_edge(parent, "Ev("+str(node)+")")
+        #the edges of the roads keep their weight, so a road can be removed again (see remove_road)
+        for neighbor in graph.neighbors(node):
+            bayes_network.edges["B("+str(neighbor)+")", "Ev("+str(node)+")"]["weight"] = graph[node][neighbor]["weight"]
 
-        #each node has 2 states: true or false, so we will have 2^len(relevant_nodes) possible states
-        states = [bin(i)[2:].zfill(len(relevant_nodes)) for i in range(2**len(relevant_nodes))]
-        if len(relevant_nodes) == 1:
-            if relevant_nodes[0] == "B("+str(node)+")":
-                probabilities_false[str(list(states[0]))] = p2
-                probabilities_false[str(list(states[1]))] = 1
-            else:
-                curr  = int(relevant_nodes[0][2:-1])
-                probabilities_false[str(list(states[0]))] = min(1,p1*graph[node][curr]["weight"])
-                probabilities_false[str(list(states[1]))] = 1
-        else:    
-            for state in states:
-                #for loop to add base cases probabilities to the table
-
-                #if the breakage of the node is true and all the breakage of the neighbors is false, the probability is p2 and the probability of the node to be broken is greater than 0
-                if state[0] == '1' and state[1:] == '0'*(len(relevant_nodes)-1):
-                    # if bayes_network.nodes["B("+str(node)+")"]["probabilities"]["true"]["mild"] > 0:
-                    probabilities_false[str(list(state))] = p2
-                    # else :
-                    #     probabilities_false[tuple(state)] = 1
-                    
-                #if the breakage of the node is false and only one neighbor is true, the probability is min(1,p1*w(i,j))
-                elif state[0] == '0' and state[1:].count('1') == 1:
-                    
-                    #get the weight of the edge between the node and the neighbor that is true
-                    for i in range(len(state)):
-                        if state[i] == '1':
-                            #check if the B(i) node is not 0
-                            # if bayes_network.nodes[relevant_nodes[i]]["probabilities"]["true"]["mild"] > 0:
-                            w = graph.edges[node, int(relevant_nodes[i][2:-1])]["weight"]
-                            # else:
-                            #     w = 0
-                    # if w == 0: probabilities_false[tuple(state)] = 1
-                    # else: 
-                    probabilities_false[str(list(state))] = min(1, p1*w)
 
-            
-                
-            
-        for state in states:
-            #for loop to add the rest of the probabilities to the table
-            if str(list(state)) not in probabilities_false:
-                #multiply the probabilities of each base case that is true in the state
-                prob = 1
-                for i in range(len(state)):
-                    if state[i] == '1':
-                        base_case=['0']*len(state)
-                        base_case[i] = '1'
-                        base_case = ''.join(base_case)
+    return bayes_network
 
-                    
-                        prob *= probabilities_false[str(list(base_case))]
 
-                probabilities_false[str(list(state))] = prob
+def add_blockage_node(bayes_network: DiGraph, node, xi: float):
+    #B(node) with P(B(node)=1|W) = x(i), 2x(i), 3x(i) for mild, stormy, extreme
+    tables = bayes_network.graph
+    bayes_network.add_node("B("+str(node)+")", states=["true", "false"], probabilities=Table(tables))
+    #add to the breakage node the probabilities of each state from the dictionary this way: dictionary["node"] = x(i)
+    bayes_network.nodes["B("+str(node)+")"]["probabilities"]["B("+str(node)+")=1"] = Table(tables, {"mild": xi, 'stormy': 2*xi, 'extreme': 3*xi})
+    bayes_network.nodes["B("+str(node)+")"]["probabilities"]["B("+str(node)+")=0"] = Table(tables, {"mild": 1-xi, "stormy": 1-2*xi, "extreme": 1-3*xi})
+    #add an edge between the weather node and the breakage node
+    bayes_network.add_edge("W", "B("+str(node)+")")
 
 
-        
-        #we want the probabilities to be in the format of B(i)=0, B(j)=1, B(k)=1, B(l)=1 etc.
-        #so we will change the keys of the dictionary to be in this format
-        # print(probabilities_false)
-        new_probabilities_false = {}
-        for state in probabilities_false:
-            new_state = []
-            #state is in the format of ['0', '1', '1', '1'] we want to run over 0,1,1,1
-            
-            curr_state = state[1:-1].split(', ')
-            
-            for i in range(len(curr_state)):
-                val = curr_state[i]
-                new_state.append(relevant_nodes[i]+"="+val)
-            new_state = ', '.join(new_state)
-            new_probabilities_false[new_state] = probabilities_false[state]
-        
-            
-        # print("TEST")
-        
+def add_evacuees_node(bayes_network: DiGraph, node):
+    #Ev(node) without parents, a parent is added by putting its inhibitor into bayes_network.nodes["Ev(node)"]["inhibitors"]
+    inhibitors = Table(bayes_network.graph)
+    bayes_network.add_node("Ev("+str(node)+")", states=["true", "false"], probabilities=Table(bayes_network.graph), inhibitors=inhibitors)
+    #the rows of the table, in the format of B(i)='0', B(j)='1', are computed when they are looked up
+    bayes_network.nodes["Ev("+str(node)+")"]["probabilities"]["Ev("+str(node)+")=0"] = NoisyOrTable(inhibitors, "0")
+    bayes_network.nodes["Ev("+str(node)+")"]["probabilities"]["Ev("+str(node)+")=1"] = NoisyOrTable(inhibitors, "1")
 
-        probabilities_false = new_probabilities_false
-        
-        #add the probabilities to the node
-        bayes_network.nodes["Ev("+str(node)+")"]["probabilities"]["Ev("+str(node)+")=0"] = probabilities_false
-        probabilities_true = {}
-        for state in probabilities_false:
-            probabilities_true[state] = 1-probabilities_false[state]
-        bayes_network.nodes["Ev("+str(node)+")"]["probabilities"]["Ev("+str(node)+")=1"] = probabilities_true
-        #connect the node to the breakage node and all the breakage nodes of its neighbors
-        for neighbor in relevant_nodes:
-            bayes_network.add_edge(neighbor, "Ev("+str(node)+")")
 
-        
+def blockage(bayes_network: DiGraph, node) -> float:
+    #x(i) of the node, P(B(i)=1|W=mild)
+    return bayes_network.nodes["B("+str(node)+")"]["probabilities"]["B("+str(node)+")=1"]["mild"]
+
+
+def check_vertex(bayes_network: DiGraph, node):
+    if "B("+str(node)+")" not in bayes_network:
+        raise ValueError("the network has no vertex "+str(node))
+
+
+def has_road(bayes_network: DiGraph, node, neighbor) -> bool:
+    edge = ("B("+str(neighbor)+")", "Ev("+str(node)+")")
+    return bayes_network.has_edge(*edge) and "weight" in bayes_network.edges[edge]
+
+
+def road_directions(u, v):
+    #a road between u and v makes B(v) a parent of Ev(u) and B(u) a parent of Ev(v), a self loop only once
+    return [(u, v)] if u == v else [(u, v), (v, u)]
+
+
+def link(bayes_network: DiGraph, node, neighbor, weight: float) -> str:
+    #B(neighbor) becomes a parent of Ev(node) through a road of the given weight, returns the changed node
+    ev = "Ev("+str(node)+")"
+    bayes_network.nodes[ev]["inhibitors"]["B("+str(neighbor)+")"] = min(1, bayes_network.graph["p1"]*weight)
+    bayes_network.add_edge("B("+str(neighbor)+")", ev, weight=weight)
+    return ev
+
+
+def unlink(bayes_network: DiGraph, node, neighbor) -> str:
+    #the road from neighbor stops being a parent of Ev(node), returns the changed node.
+    #without the self loop the own blockage of the node goes back to the inhibitor p2 (if x(i) > 0, as in create_bayes_network)
+    ev = "Ev("+str(node)+")"
+    parent = "B("+str(neighbor)+")"
+    if node == neighbor and blockage(bayes_network, node) > 0:
+        bayes_network.nodes[ev]["inhibitors"][parent] = bayes_network.graph["p2"]
+        del bayes_network.edges[parent, ev]["weight"]
+    else:
+        del bayes_network.nodes[ev]["inhibitors"][parent]
+        bayes_network.remove_edge(parent, ev)
+    return ev
+
+
+def network_edited(bayes_network: DiGraph, revision, changed, removed=()):
+    '''
+    input:
+    bayes_network: the network right after an edit
+    revision: its network_revision before the edit
+    changed: the names of the nodes that were added or whose table or parents changed
+    removed: the names of the nodes that were removed
+    only the tables of the changed nodes are compiled again, and the query cache only drops the results that
+    depend on the changed or removed nodes (if the compiled network or the cache were not up to date before
+    the edit, they are built again when they are used, as after any other change)
+    '''
+    edited = network_revision(bayes_network)
+    update_compiled(bayes_network, revision, edited, changed, removed)
+    cache = bayes_network.graph.get("query_cache")
+    if cache is not None and cache.revision == revision:
+        cache.invalidate(set(changed) | set(removed), edited)
+
+
+def set_road(bayes_network: DiGraph, u, v, weight: float):
+    '''
+    input:
+    bayes_network: a DiGraph object created by create_bayes_network
+    u, v: vertices of the network
+    weight: the weight of the road
+    adds the road between u and v, or changes its weight if it is already there. only Ev(u) and Ev(v) change,
+    so the network is not built again (see network_edited)
+    '''
+    check_vertex(bayes_network, u)
+    check_vertex(bayes_network, v)
+    revision = network_revision(bayes_network)
+    changed = [link(bayes_network, node, neighbor, weight) for node, neighbor in road_directions(u, v)]
+    network_edited(bayes_network, revision, changed)
+
+
+def remove_road(bayes_network: DiGraph, u, v):
+    '''
+    input:
+    bayes_network: a DiGraph object created by create_bayes_network
+    u, v: vertices of the network with a road between them
+    removes the road, only Ev(u) and Ev(v) change
+    '''
+    if not has_road(bayes_network, u, v):
+        raise ValueError("there is no road between "+str(u)+" and "+str(v))
+    revision = network_revision(bayes_network)
+    changed = [unlink(bayes_network, node, neighbor) for node, neighbor in road_directions(u, v)]
+    network_edited(bayes_network, revision, changed)
+
+
+def set_blockage(bayes_network: DiGraph, node, xi: float):
+    '''
+    input:
+    bayes_network: a DiGraph object created by create_bayes_network
+    node: a vertex of the network
+    xi: the new x(i), P(B(i)=1|W) is x(i), 2x(i), 3x(i) for mild, stormy, extreme
+    changes the table of B(i), and the parents of Ev(i) if B(i) can no longer (or now can) be blocked
+    '''
+    check_vertex(bayes_network, node)
+    revision = network_revision(bayes_network)
+    b, ev = "B("+str(node)+")", "Ev("+str(node)+")"
+    probabilities = bayes_network.nodes[b]["probabilities"]
+    probabilities[b+"=1"].update({"mild": xi, 'stormy': 2*xi, 'extreme': 3*xi})
+    probabilities[b+"=0"].update({"mild": 1-xi, "stormy": 1-2*xi, "extreme": 1-3*xi})
+    changed = [b]
+    if xi > 0 and not bayes_network.has_edge(b, ev):
+        bayes_network.nodes[ev]["inhibitors"][b] = bayes_network.graph["p2"]
+        bayes_network.add_edge(b, ev)
+        changed.append(ev)
+    elif xi <= 0 and bayes_network.has_edge(b, ev) and not has_road(bayes_network, node, node):
+        del bayes_network.nodes[ev]["inhibitors"][b]
+        bayes_network.remove_edge(b, ev)
+        changed.append(ev)
+    network_edited(bayes_network, revision, changed)
+
+
+def add_vertex(bayes_network: DiGraph, node, xi: float, roads=None):
+    '''
+    input:
+    bayes_network: a DiGraph object created by create_bayes_network
+    node: the new vertex
+    xi: its x(i)
+    roads: a dictionary of neighbor -> weight of the roads of the new vertex, or None
+    adds B(node) and Ev(node) (and the roads), the existing nodes that change are the Ev nodes of the neighbours
+    '''
+    if "B("+str(node)+")" in bayes_network:
+        raise ValueError("the network already has a vertex "+str(node))
+    roads = {} if roads is None else roads
+    for neighbor in roads:
+        if neighbor != node:
+            check_vertex(bayes_network, neighbor)
+    revision = network_revision(bayes_network)
+    add_blockage_node(bayes_network, node, float(xi))
+    add_evacuees_node(bayes_network, node)
+    if xi > 0:
+        bayes_network.nodes["Ev("+str(node)+")"]["inhibitors"]["B("+str(node)+")"] = bayes_network.graph["p2"]
+        bayes_network.add_edge("B("+str(node)+")", "Ev("+str(node)+")")
+    changed = ["B("+str(node)+")", "Ev("+str(node)+")"]
+    for neighbor, weight in roads.items():
+        for u, v in road_directions(node, neighbor):
+            changed.append(link(bayes_network, u, v, weight))
+    network_edited(bayes_network, revision, list(dict.fromkeys(changed)))
+
+
+def remove_vertex(bayes_network: DiGraph, node):
+    '''
+    input:
+    bayes_network: a DiGraph object created by create_bayes_network
+    node: a vertex of the network
+    removes B(node), Ev(node) and the roads of the vertex, the Ev nodes of its neighbours change
+    '''
+    check_vertex(bayes_network, node)
+    revision = network_revision(bayes_network)
+    b, ev = "B("+str(node)+")", "Ev("+str(node)+")"
+    changed = []
+    for child in list(bayes_network.successors(b)):
+        if child != ev:
+            del bayes_network.nodes[child]["inhibitors"][b]
+            changed.append(child)
+    bayes_network.remove_nodes_from([b, ev])
+    network_edited(bayes_network, revision, changed, [ev, b])
 
-        
-    return bayes_network
-    
 
 def print_weather(bayes_network: DiGraph):
     print("WEATHER:")
@@ -243,210 +480,155 @@ def print_probabalistic_reasoning(bayes_network, evidence,graph):
     # path = path.split(" ")
     path = [int(i) for i in path]
 
-    query4 = []
-    for i in range(len(path)-1):
-        query4.append("B("+str(path[i])+")")
-    
+    #all the marginals come from one calibration of the junction tree
+    marginals = posterior_marginals(evidence, bayes_network, query1 + query2 + query3)
+
     print("What is the probability that each of the vertices contains evacuees?")
     for node in graph.nodes:
-        print("P(Ev("+str(node)+") |", evidence, ") = ", enumeration_ask(["Ev("+str(node)+")"], evidence, bayes_network)["['Ev("+str(node)+")=1']"])
+        print("P(Ev("+str(node)+") |", evidence, ") = ", marginals["Ev("+str(node)+")"]["['Ev("+str(node)+")=1']"])
     print()
 
     print("What is the probability that each of the vertices is blocked?")
     for node in graph.nodes:
-        print("P(B("+str(node)+") |", evidence, ") = ", enumeration_ask(["B("+str(node)+")"], evidence, bayes_network)["['B("+str(node)+")=1']"])
+        print("P(B("+str(node)+") |", evidence, ") = ", marginals["B("+str(node)+")"]["['B("+str(node)+")=1']"])
     print()
 
     print("What is the distribution of the weather variable?")
     if "W" in evidence:
         print("P(W |", evidence, ") = ", {w : 1 if evidence['W']==w else 0 for w in ["mild","stormy","extreme"]})
     else:
-        print("P(W |", evidence, ") = ", enumeration_ask(["W"], evidence, bayes_network))
+        print("P(W |", evidence, ") = ", marginals["W"])
     print()
 
     print("What is the probability that a certain path (set of edges) is free from blockages?")
-    query4_total = 1
-    extended_evidence = evidence.copy()
-    for query in query4:
-        distribution=enumeration_ask([query], evidence, bayes_network)
-        #print("P(", [query], "|", evidence, ") = ", distribution)
-        #multiply by the probability of the node not being blocked
-        query4_total *= distribution.get(str([query+"=0"]))
-        #add the query to the evidence
-        extended_evidence[query] = "0"
+    #one joint query over all the vertices of the path, the blockages are correlated through W
+    query4_total = path_free_probability(path, evidence, bayes_network)
     print("P(",path," is free from blockages |", evidence, ") = ", query4_total)
     print()
     
-def enumeration_all(vars,evidence,bayes_network):
-    if len(vars) == 0:
-        return 1
-    Y = vars[0]
-    parents = ""
-    for parent in bayes_network.predecessors(Y):
-        #evidence[parent] =  EV(1) = 1, EV(2) = 0, W = "stormy"
-        val = evidence[parent]
-        temp = val
-        if Y == "B":
-            temp = "W=" + val
-        if Y[0:2] == "Ev": #val is true or false, we want temp to be in this format: "B(1)='1'" or "B(1)='0'" based on val, the number is the parent = B(1)
-            if val == "1":
-                temp = "B("+str(parent)[2]+")='1'"
-            else:
-                temp = "B("+str(parent)[2]+")='0'"
-                
-                
-        #print("temp:", temp)
-
-        parents += temp + ", "
-    parents = parents[:-2]
-        
-    if Y in evidence.keys():
-        # print("in evidence")
-        # print("Y:", Y)
-        # print('EVIDENCE:', evidence)
-        # print('EVIDENCE[Y]:', evidence[Y])
-        # print('PARENTS:', parents)
-        # print("table: ",bayes_network.nodes[Y]["probabilities"])
-        
-        if parents == "":
-            #print("P(y): ",bayes_network.nodes[Y]["probabilities"][evidence[Y]])
-            return bayes_network.nodes[Y]["probabilities"][evidence[Y]] * enumeration_all(vars[1:],evidence,bayes_network)
-        else:
-            # print('P1: ',bayes_network.nodes[Y]["probabilities"][Y+'='+evidence[Y]])
-            # print('P2: ',str(parents))
-            # print("P(y|Pa(Y)): ",bayes_network.nodes[Y]["probabilities"][Y+'='+evidence[Y]][str(parents)])
-            return bayes_network.nodes[Y]["probabilities"][Y+'='+evidence[Y]][str(parents)] * enumeration_all(vars[1:],evidence,bayes_network)
-    else:
-        sum = 0
-        for state in bayes_network.nodes[Y]["probabilities"]:
-            #add the state to a copy of the evidence
-            extended_evidence = evidence.copy()
-            if len(state.split('='))>1:
-                #state is in format e.x B(1)=1, so we will retrieve the 1
-                extended_evidence[Y] = state.split('=')[1]
-            else:
-                extended_evidence[Y] = state
-            # print("Y:", Y)
-            # print('STATE:', state)
-            # print('PARENTS:', parents)
-            # print("table: ",bayes_network.nodes[Y]["probabilities"])
-            # print('Ext_EVIDENCE[Y]:', extended_evidence[Y])
-            if parents == [] or parents == "":
-                #print("P(y|Pa(Y)): ",bayes_network.nodes[Y]["probabilities"][extended_evidence[Y]])
-                sum += bayes_network.nodes[Y]["probabilities"][state] * enumeration_all(vars[1:],extended_evidence,bayes_network)
-            else:
-                #print("P(y|Pa(Y)): ",bayes_network.nodes[Y]["probabilities"][extended_evidence[Y]])
-                #print("P(y|Pa(Y)): ",bayes_network.nodes[Y]["probabilities"][extended_evidence[Y]][str(parents)])
-                sum += bayes_network.nodes[Y]["probabilities"][state][str(parents)] * enumeration_all(vars[1:],extended_evidence,bayes_network)
-        return sum
-
-
-def enumeration_ask(query, evidence, bayes_network):
+def enumeration_all(vars,assignment,compiled,start=0,stats=None):
+    '''
+    input:
+    vars: variable ids of the compiled network in topological order
+    assignment: a list with the state index of every variable, -1 for variables that are not assigned yet
+    compiled: a CompiledNetwork
+    start: position in vars of the next variable to enumerate
+    stats: an InferenceStats that counts the nodes of the search tree, or None
+    output:
+    the probability of the assignment, summing over the unassigned variables.
+    the assignments are walked depth first like an odometer over the unassigned variables instead of by
+    recursion, so the depth is not limited by the Python stack and the memory stays linear in len(vars)
+    '''
+    free = [assignment[Y] == -1 for Y in vars]
+    #weights[i] is the product of the probabilities of the variables at positions start..i-1 of the current branch
+    weights = [1] * (len(vars)+1)
+    sum = 0
+    position = start
+    while True:
+        #go down to a leaf, the unassigned variables take their first state
+        while position < len(vars):
+            if stats is not None:
+                stats.calls += 1
+            Y = vars[position]
+            if free[position]:
+                assignment[Y] = 0
+            weights[position+1] = weights[position] * compiled.probability(Y, assignment)
+            position += 1
+        if stats is not None:
+            stats.calls += 1
+        sum += weights[position]
+        #go back up to the last unassigned variable that has a next state, the ones below it are unassigned again
+        position -= 1
+        while position >= start and (not free[position] or assignment[vars[position]] == compiled.cardinality[vars[position]]-1):
+            if free[position]:
+                assignment[vars[position]] = -1
+            position -= 1
+        if position < start:
+            return sum
+        Y = vars[position]
+        assignment[Y] += 1
+        weights[position+1] = weights[position] * compiled.probability(Y, assignment)
+        position += 1
+
+
+def enumeration_ask(query, evidence, bayes_network, stats=None, trace=None):
     '''
     input:
     query: a list of strings, each string is a query variable
     evidence: a dictionary of strings, each string is an evidence variable
     bayes_network: a DiGraph object
+    stats: an InferenceStats to fill with the counters and timings of the query
+    trace: a callback trace(event, details), see InferenceStats
     output:
-    a distribution of the query variables
+    a distribution of the query variables, raises ValueError if the evidence has probability 0
     '''
 
     distribution = {}
 
-    # query = {B(1), B(2), B(3)}
-    # xi = {B(1)=0, B(2)=1, B(3)=1}
-    #check if the evidence includes the query than the probability is 1 or 0
-    #distribution is in this format {"['B(1)=0']": 0.6, "['B(1)=1']": 0.4000000000000001}
-    for q in query:
-        #q is str int the format of "key" : "value"
-        if q in evidence.keys():
-            
-            if evidence[q] == "1":
-                distribution["['"+q+"=1']"] = 1
-                distribution["['"+q+"=0']"] = 0
-            else:
-                distribution["['"+q+"=1']"] = 0
-                distribution["['"+q+"=0']"] = 1
-
-            
-                
-
-                
-    
-    if distribution != {}:
-        print ("distribution:", distribution)
-        return distribution
-        
-    
-    
-    #iterate over all possible states of the query variables
-    for state in all_possible_states(query, bayes_network):
-        #if state is not list, make it a list
-        if not isinstance(state, list):
-            state = [state]
-        #print ("state:", state)
-        extended_evidence = evidence.copy()
-        #add the state to the evidence
-        #print("query:", query)
-        for i in range(len(query)):
-            extended_evidence[state[i].split('=')[0]] = state[i].split('=')[1]
-        #we need to topological sort the evidence
-        #TODO:
-        #extended_evidence = topological_sort(extended_evidence, bayes_network)
-        #create vars : all the variables in the bayes network 
-        vars = []
-        for node in bayes_network.nodes:
-            if node.startswith("W"):
-                vars.append(node)
-        for node in bayes_network.nodes:
-            if node.startswith("B"):
-                vars.append(node)
-        for node in bayes_network.nodes:
-            if node.startswith("Ev"):
-                vars.append(node)
-        # print("vars:", vars)
-        # print("extended_evidence:", extended_evidence)
-        distribution[str(state)] = enumeration_all(vars,extended_evidence,bayes_network)
+    #the same query may have been answered already for the same tables
+    stats = instrument(stats, trace)
+    cache = query_cache(bayes_network)
+    key = query_key("enumeration", query, evidence)
+    cached = cache.get(key)
+    if stats is not None:
+        stats.cache(cached is not None)
+    if cached is not None:
+        return dict(cached)
+
+    with phase(stats, "compile"):
+        compiled = compile_network(bayes_network)
+        evidence_ids = compiled.evidence_ids(evidence)
+    #only the variables that are not barren or d-separated from the query given the evidence are enumerated
+    query_ids = [compiled.index[q] for q in query]
+    with phase(stats, "prune"):
+        variables, relevant_evidence = relevant_network(compiled, query_ids, evidence_ids)
+    #the result only depends on the requisite variables, an edit elsewhere keeps it in the cache
+    depends = dependencies(compiled, variables, evidence_ids, query_ids)
+    if stats is not None:
+        stats.engine = "enumeration"
+    #iterate over all possible states of the query variables, they are generated one at a time
+    with phase(stats, "enumerate"):
+        for state in all_possible_states(query, bayes_network):
+            #add the evidence and the state to the assignment
+            assignment = [-1] * len(compiled)
+            for var, value in relevant_evidence.items():
+                assignment[var] = value
+            consistent = True
+            for label in state:
+                name, value = label.split('=')
+                var = compiled.index[name]
+                #a query variable that is also observed only keeps the observed state
+                if assignment[var] not in (-1, compiled.state_index[var][value]):
+                    consistent = False
+                assignment[var] = compiled.state_index[var][value]
+            distribution[str(state)] = enumeration_all(variables,assignment,compiled,0,stats) if consistent else 0
 
     #normalize the distribution
-    sum = 0
-    for state in distribution:
-        sum += distribution[str(state)]
-    for state in distribution:
-        distribution[str(state)] /= sum
-    
+    with phase(stats, "normalize"):
+        sum = 0
+        for state in distribution:
+            sum += distribution[str(state)]
+        if sum <= 0:
+            raise ValueError("the evidence has probability 0")
+        for state in distribution:
+            distribution[str(state)] /= sum
+
+    cache.put(key, dict(distribution), depends)
     return distribution
 
 def all_possible_states(query, bayes_network):
     '''
     input:
-    query: a list of strings, each string is a query variable
-    evidence: a dictionary of strings, each string is an evidence variable
+    query: a list of strings, each string is a query variable (any mix of W, B and Ev variables)
     bayes_network: a DiGraph object
     output:
-    a list of all possible states of the query variables
+    a generator of all the joint states of the query variables, each one a list in the format
+    ["W=mild", "B(2)=0", "Ev(3)=1"] with the last variable changing fastest (the order of the enumeration_ask keys).
+    the states are generated one at a time, so a query over many variables never holds all of them in memory
     '''
     if len(query) == 0:
-        return []
-
-    
-    if query[0] == "W":
-        return [["W=mild"],["W=stormy"], ["W=extreme"]]
-
-    if query[0][0] == "E":
-        return [["Ev("+query[0][3:-1]+")=0"],["Ev("+query[0][3:-1]+")=1"]]
-
-    # query is the type of {B(1), B(2), B(3)}
-    # than we need to return all the possible states of the query variables
-    # like [[0,0,0],[0,0,1],[0,1,0],[0,1,1],[1,0,0],[1,0,1],[1,1,0],[1,1,1]]
-    if query[0][0] == "B":
-        states = [bin(i)[2:].zfill(len(query)) for i in range(2**len(query))]
-        for i in range(len(states)):
-            states[i] = "B("+query[0][2:-1]+")="+states[i]
-        return states
-    
-        
-
-       
-
-
+        return
+    compiled = compile_network(bayes_network)
+    labels = [[q+"="+state for state in compiled.states[compiled.index[q]]] for q in query]
+    for state in product(*labels):
+        yield list(state)
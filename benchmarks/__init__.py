@@ -0,0 +1 @@
+"""Benchmarks of the inference engines, see suite.py (scaling) and startup.py (import time)."""
@@ -0,0 +1,122 @@
+"""Synthetic road networks in the input format of pirsur.parse (#V/#E/#W).
+
+Every generator returns (x, edges): x[v] is the blockage probability of vertex v given mild weather
+(vertices are 1..n) and edges is a list of (u, v, weight). write_instance writes them to a file.
+"""
+import math
+import random
+
+
+#P(B=1 | extreme) = 3x must stay a probability
+MAX_BLOCKAGE = 1/3
+
+
+def blockage_probabilities(n: int, rng, blockable: float = 0.5):
+    #a fraction of the vertices can be blocked at all, the others get x = 0
+    return {v: round(rng.uniform(0.01, MAX_BLOCKAGE), 3) if rng.random() < blockable else 0 for v in range(1, n+1)}
+
+
+def grid(rows: int, cols: int, seed=None, max_weight: int = 5):
+    '''
+    input:
+    rows, cols: the size of the grid, vertex (r, c) is r*cols + c + 1
+    output:
+    (x, edges) of a grid where every vertex is connected to its 4 neighbours
+    '''
+    rng = random.Random(seed)
+    edges = []
+    for r in range(rows):
+        for c in range(cols):
+            v = r*cols + c + 1
+            if c+1 < cols:
+                edges.append((v, v+1, rng.randint(1, max_weight)))
+            if r+1 < rows:
+                edges.append((v, v+cols, rng.randint(1, max_weight)))
+    return blockage_probabilities(rows*cols, rng), edges
+
+
+def random_geometric(n: int, degree: float = 6, seed=None, max_weight: int = 5):
+    '''
+    input:
+    n: the number of vertices, placed uniformly in the unit square
+    degree: the expected degree, vertices closer than sqrt(degree / (pi n)) are connected
+    output:
+    (x, edges) of the random geometric graph
+    '''
+    rng = random.Random(seed)
+    radius = math.sqrt(degree / (math.pi * n))
+    points = [(rng.random(), rng.random()) for _ in range(n)]
+    #buckets of side radius, so only the neighbouring buckets are compared
+    buckets = {}
+    for v, (px, py) in enumerate(points, 1):
+        buckets.setdefault((int(px/radius), int(py/radius)), []).append(v)
+    edges = []
+    for (bx, by), members in buckets.items():
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for u in members:
+                    for v in buckets.get((bx+dx, by+dy), []):
+                        if u < v and math.dist(points[u-1], points[v-1]) < radius:
+                            edges.append((u, v, rng.randint(1, max_weight)))
+    return blockage_probabilities(n, rng), edges
+
+
+def scale_free(n: int, attach: int = 2, seed=None, max_weight: int = 5):
+    '''
+    input:
+    n: the number of vertices
+    attach: the number of edges of every new vertex
+    output:
+    (x, edges) of a Barabasi-Albert graph: new vertices attach to existing ones with a probability
+    proportional to their degree, which grows a few hubs with a very large degree
+    '''
+    rng = random.Random(seed)
+    edges = []
+    #every vertex appears once per edge end, so a uniform pick is a pick proportional to the degree
+    ends = list(range(1, attach+2))
+    for v in range(2, attach+2):
+        for u in range(1, v):
+            edges.append((u, v, rng.randint(1, max_weight)))
+            ends += [u, v]
+    for v in range(attach+2, n+1):
+        targets = set()
+        while len(targets) < attach:
+            targets.add(rng.choice(ends))
+        for u in targets:
+            edges.append((u, v, rng.randint(1, max_weight)))
+            ends += [u, v]
+    return blockage_probabilities(n, rng), edges
+
+
+def max_degree(n: int, edges) -> int:
+    degree = [0] * (n+1)
+    for u, v, _ in edges:
+        degree[u] += 1
+        degree[v] += 1
+    return max(degree)
+
+
+def write_instance(path: str, x: dict, edges, weather=(0.5, 0.3, 0.2)):
+    with open(path, "w") as f:
+        f.write("#V "+str(len(x))+"\n")
+        for v, xv in x.items():
+            f.write("#V "+str(v)+" F "+str(xv)+"\n" if xv else "#V "+str(v)+"\n")
+        for i, (u, v, weight) in enumerate(edges, 1):
+            f.write("#E"+str(i)+" "+str(u)+" "+str(v)+" W"+str(weight)+"\n")
+        f.write("#W "+" ".join(str(p) for p in weather)+"\n")
+
+
+def random_evidence(x: dict, density: float, positive: float = 0.1, seed=None):
+    '''
+    input:
+    x: the blockage probabilities of the instance
+    density: the fraction of the vertices with an evacuee report Ev(v)
+    positive: the fraction of the reports that found people (Ev(v) = 1)
+    output:
+    evidence in the format of enumeration_ask. people are only reported at vertices that can be blocked
+    themselves (x(v) > 0), so the evidence never has probability 0
+    '''
+    rng = random.Random(seed)
+    vertices = sorted(x)
+    reported = rng.sample(vertices, int(round(density * len(vertices))))
+    return {"Ev("+str(v)+")": "1" if x[v] > 0 and rng.random() < positive else "0" for v in reported}
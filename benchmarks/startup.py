@@ -0,0 +1,71 @@
+"""Startup time of the entry points, each measured in a fresh interpreter.
+
+    python benchmarks/startup.py [--repeat 5] [--input input.txt]
+
+Every case runs `repeat` times in a new python process. The median wall time is reported,
+together with the heavy libraries the case ended up importing.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+#libraries whose import time dominates a short-lived worker
+HEAVY = ["numpy", "networkx", "matplotlib"]
+
+CASES = {
+    "python": "pass",
+    "import inference": "import inference",
+    "import inference.junction_tree": "import inference.junction_tree",
+    "import bayes": "import bayes",
+    "one query, read_network": (
+        "from inference import read_network, posterior_marginals\n"
+        "posterior_marginals({'Ev(1)': '1'}, read_network(INPUT), ['W'])"),
+    "one query, create_bayes_network": (
+        "from pirsur import parse\n"
+        "from bayes import create_bayes_network\n"
+        "from inference import posterior_marginals\n"
+        "posterior_marginals({'Ev(1)': '1'}, create_bayes_network(*parse(INPUT)), ['W'])"),
+}
+
+
+def run_case(code: str, input_file: str):
+    '''
+    input:
+    code: the python code of the case, INPUT is the name of the input file
+    input_file: the input file of the cases that build a network
+    output:
+    (seconds, the heavy libraries that were imported) of one run in a fresh interpreter
+    '''
+    report = "\nimport sys, json\nprint(json.dumps([name for name in HEAVY if name in sys.modules]))"
+    program = "INPUT = "+repr(input_file)+"\nHEAVY = "+repr(HEAVY)+"\n"+code+report
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", program], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return time.perf_counter() - start, json.loads(output.strip().splitlines()[-1])
+
+
+def startup_benchmark(repeat: int = 5, input_file: str = "input.txt"):
+    results = {}
+    for name, code in CASES.items():
+        times = []
+        for _ in range(repeat):
+            seconds, imported = run_case(code, input_file)
+            times.append(seconds)
+        results[name] = {"median_seconds": statistics.median(times), "min_seconds": min(times), "imports": imported}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the startup time of the entry points.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--input", default="input.txt", help="input file of the cases that answer a query")
+    args = parser.parse_args()
+    results = startup_benchmark(args.repeat, args.input)
+    width = max(len(name) for name in results)
+    for name, result in results.items():
+        print(name.ljust(width), "%.3fs" % result["median_seconds"], " imports:", ", ".join(result["imports"]) or "-")
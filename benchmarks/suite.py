@@ -0,0 +1,302 @@
+"""Scaling benchmark of building and querying the network on synthetic instances.
+
+    python benchmarks/suite.py [--families grid geometric scale_free] [--sizes 16 64 256]
+                               [--densities 0 0.1 0.5] [--output results.json] [--compare baseline.json]
+
+Every instance is written in the input format, then every step is timed on it: parsing, building and
+compiling the network, and each inference engine on evidence of several densities. Inference steps
+start cold (no cached results, junction tree or layout), the compiled network is reused.
+Peak memory comes from a second run under tracemalloc, so the timings are not slowed by it.
+Steps above their size limit (see ENGINES) are skipped, steps that fail are recorded with their error.
+
+The results are written as json: the environment (git commit, python, numpy) and one record per
+(instance, evidence density, step). --compare prints the ratio of every time to the same record of
+an earlier run, so a regression between two versions shows up as a ratio above 1.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from bayes import create_bayes_network, enumeration_ask
+from benchmarks.generators import grid, max_degree, random_evidence, random_geometric, scale_free, write_instance
+from inference.batch import batch_ask
+from inference.elimination import variable_elimination_ask
+from inference.factors import compile_network
+from inference.junction_tree import InferenceSession, posterior_marginals
+from inference.network_file import read_network
+from inference.paths import path_free_probability
+from inference.sampling import approximate_ask
+from pirsur import parse
+
+
+#a time above this ratio to the baseline is reported as a regression
+REGRESSION_RATIO = 1.25
+#a step that takes longer than this many seconds is timed once, faster steps keep the best of a few runs
+SLOW_STEP = 1.0
+#number of evidence scenarios answered by the batch_ask step
+BATCH_SCENARIOS = 1000
+#errors are cut to this many characters in the records
+MAX_ERROR_LENGTH = 120
+
+
+class Instance:
+    """A synthetic instance and the objects the steps share.
+
+    Args:
+        family (str): the generator that made it.
+        size (int): the size argument of the generator.
+        x (dict): blockage probabilities, vertex -> x(v).
+        edges (list): (u, v, weight) tuples.
+        path (str): the input file the instance was written to.
+    """
+
+    def __init__(self, family: str, size: int, x: dict, edges, path: str):
+        self.family = family
+        self.size = size
+        self.x = x
+        self.edges = edges
+        self.path = path
+        self.n = len(x)
+        self.max_degree = max_degree(self.n, edges)
+        self.graph = None
+        self.bayes_network = None
+        self.evidence = {}
+
+
+def make_instance(family: str, size: int, directory: str, seed: int = 0) -> Instance:
+    if family == "grid":
+        x, edges = grid(size, size, seed)
+    elif family == "geometric":
+        x, edges = random_geometric(size, seed=seed)
+    elif family == "scale_free":
+        x, edges = scale_free(size, seed=seed)
+    else:
+        raise ValueError("unknown family "+family+", expected grid, geometric or scale_free")
+    path = os.path.join(directory, family+"_"+str(size)+".txt")
+    write_instance(path, x, edges)
+    return Instance(family, size, x, edges, path)
+
+
+def cold(bayes_network):
+    #drop everything an inference step leaves behind, except the compiled network itself
+    for key in ("query_cache", "junction_tree"):
+        bayes_network.graph.pop(key, None)
+    compile_network(bayes_network).annotations.clear()
+
+
+def build_network(instance):
+    instance.graph, weather, x = parse(instance.path)
+    return create_bayes_network(instance.graph, weather, x)
+
+
+def compile_again(instance):
+    instance.bayes_network.graph.pop("compiled", None)
+    return compile_network(instance.bayes_network)
+
+
+def session_update(instance):
+    #one new report on top of the evidence, answered incrementally
+    session = InferenceSession(instance.bayes_network, instance.evidence)
+    session.marginal("W")
+    session.observe("Ev(1)", "1" if instance.evidence.get("Ev(1)") != "1" else "0")
+    return session.marginal("W")
+
+
+def batch_scenarios(instance):
+    #the reports of the evidence in every scenario, each one read wrong (a failed sensor) with probability 0.1
+    names = list(instance.evidence)
+    reports = np.array([int(instance.evidence[name]) for name in names], dtype=np.int64)
+    failed = np.random.default_rng(0).random((BATCH_SCENARIOS, len(names))) < 0.1
+    return batch_ask(["W"], names, np.where(failed, 1 - reports, reports), instance.bayes_network)
+
+
+#step name -> (function of the instance, the largest number of vertices it runs on or None, needs the evidence)
+ENGINES = {
+    "parse": (lambda instance: parse(instance.path), None, False),
+    "create_bayes_network": (build_network, None, False),
+    "compile_network": (compile_again, None, False),
+    "read_network": (lambda instance: read_network(instance.path), None, False),
+    "enumeration_ask": (lambda instance: enumeration_ask(["W"], instance.evidence, instance.bayes_network), 6, True),
+    "variable_elimination_ask": (lambda instance: variable_elimination_ask(["W", "B(1)"], instance.evidence, instance.bayes_network), 1024, True),
+    "posterior_marginals": (lambda instance: posterior_marginals(instance.evidence, instance.bayes_network), 256, True),
+    "path_free_probability": (lambda instance: path_free_probability([1, 2, 3], instance.evidence, instance.bayes_network), 1024, True),
+    "session_update": (session_update, 256, True),
+    "batch_ask": (batch_scenarios, 256, True),
+    "approximate_ask": (lambda instance: approximate_ask(["W"], instance.evidence, instance.bayes_network, n_samples=2000, seed=0), None, True),
+}
+
+
+def measure(function, instance, memory: bool = True, repeat: int = 3):
+    '''
+    input:
+    function: a step of ENGINES
+    instance: the Instance it runs on
+    memory: also measure the peak memory, in a separate run
+    repeat: the step runs up to this many times (fewer if a run takes more than SLOW_STEP) and the fastest run counts
+    output:
+    (seconds, peak bytes or None) of the step
+    '''
+    seconds = None
+    for _ in range(repeat):
+        if instance.bayes_network is not None:
+            cold(instance.bayes_network)
+        gc.collect()
+        start = time.perf_counter()
+        function(instance)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+        if elapsed > SLOW_STEP:
+            break
+    peak = None
+    if memory:
+        if instance.bayes_network is not None:
+            cold(instance.bayes_network)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function(instance)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+def run_suite(families, sizes, densities, engines=None, memory: bool = True, seed: int = 0, log=None):
+    '''
+    input:
+    families: generator names (grid, geometric, scale_free)
+    sizes: the number of vertices of the instances (grids get the closest square)
+    densities: fractions of the vertices with an evacuee report
+    engines: names of ENGINES to run, all of them if None
+    memory: measure the peak memory of every step
+    seed: seed of the instances and the evidence
+    log: a function called with every record as soon as it is measured
+    output:
+    a list of records, one per (instance, density, step)
+    '''
+    engines = list(ENGINES) if engines is None else engines
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        for family in families:
+            for size in sizes:
+                instance = make_instance(family, max(2, round(size**0.5)) if family == "grid" else size, directory, seed)
+                instance.bayes_network = build_network(instance)
+                compile_network(instance.bayes_network)
+                #steps without evidence run once per instance, the others once per density
+                for density in [None] + list(densities):
+                    instance.evidence = {} if density is None else random_evidence(instance.x, density, seed=seed)
+                    for name in engines:
+                        function, limit, needs_evidence = ENGINES[name]
+                        if needs_evidence != (density is not None):
+                            continue
+                        record = {"family": family, "n": instance.n, "edges": len(instance.edges),
+                                  "max_degree": instance.max_degree, "density": density,
+                                  "reports": len(instance.evidence), "step": name}
+                        if limit is not None and instance.n > limit:
+                            record["skipped"] = "more than "+str(limit)+" vertices"
+                        else:
+                            try:
+                                record["seconds"], record["peak_bytes"] = measure(function, instance, memory)
+                            except (MemoryError, ValueError, ZeroDivisionError) as error:
+                                record["error"] = (type(error).__name__+": "+str(error))[:MAX_ERROR_LENGTH]
+                        records.append(record)
+                        if log is not None:
+                            log(record)
+    return records
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit or None, "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def record_key(record):
+    return (record["family"], record["n"], record["density"], record["step"])
+
+
+def print_scaling(records):
+    #one table per step: the time and peak memory against the size and the max degree of the instances
+    steps = list(dict.fromkeys(record["step"] for record in records))
+    for step in steps:
+        print(step)
+        print("  family      n      edges  max_deg  density  seconds     peak MB")
+        for record in records:
+            if record["step"] != step:
+                continue
+            density = "-" if record["density"] is None else str(record["density"])
+            if "seconds" in record:
+                result = "%-10.4f  %s" % (record["seconds"], "-" if record["peak_bytes"] is None else "%.1f" % (record["peak_bytes"]/2**20))
+            else:
+                result = record.get("skipped") or record.get("error")
+            print("  %-10s %6d %6d %8d  %-7s  %s" % (record["family"], record["n"], record["edges"], record["max_degree"], density, result))
+        print()
+
+
+def compare(records, baseline, threshold: float = REGRESSION_RATIO):
+    '''
+    input:
+    records: the records of this run
+    baseline: the json of an earlier run
+    threshold: the time ratio above which a record is a regression
+    output:
+    prints the time ratio (this run / baseline) of every record both runs measured,
+    and returns the records slower than threshold
+    '''
+    earlier = {record_key(record): record for record in baseline["records"] if "seconds" in record}
+    regressions = []
+    print("compared to", baseline["environment"].get("commit"), "from", baseline["environment"].get("time"))
+    for record in records:
+        old = earlier.get(record_key(record))
+        if old is None or "seconds" not in record or old["seconds"] == 0:
+            continue
+        ratio = record["seconds"] / old["seconds"]
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print("  %-24s %-10s n=%-6d density=%-5s %.2fx%s" % (record["step"], record["family"], record["n"], record["density"], ratio, flag))
+        if flag:
+            regressions.append(record)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the steps of the model on synthetic instances.")
+    parser.add_argument("--families", nargs="+", default=["grid", "geometric", "scale_free"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[4, 16, 64, 256, 1024])
+    parser.add_argument("--densities", nargs="+", type=float, default=[0.0, 0.1, 0.5])
+    parser.add_argument("--steps", nargs="+", choices=list(ENGINES), help="the steps to run, all of them by default")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run of every step")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--compare", help="a json file of an earlier run to compare the times with")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_RATIO, help="time ratio reported as a regression by --compare")
+    args = parser.parse_args()
+
+    def log(record):
+        print(record["step"], record["family"], record["n"], record["density"],
+              record.get("seconds", record.get("skipped") or record.get("error")), file=sys.stderr)
+
+    records = run_suite(args.families, args.sizes, args.densities, args.steps, not args.no_memory, args.seed, log)
+    print_scaling(records)
+    results = {"environment": environment(), "records": records}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(records, json.load(f), args.threshold)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,61 @@
+"""Exact and approximate inference for the networks of create_bayes_network.
+
+The package only needs numpy: it works on networks built by bayes.create_bayes_network (networkx)
+and on networks read by read_network or load_network, which don't import networkx at all.
+Submodules are imported when one of their names is first used, so `import inference` is cheap
+and a short-lived worker only pays for the engines it calls.
+"""
+import importlib
+
+
+#public name -> the submodule that defines it
+EXPORTS = {
+    "batch_ask": "batch",
+    "QueryCache": "cache",
+    "query_cache": "cache",
+    "variable_elimination_ask": "elimination",
+    "evidence_probability": "elimination",
+    "MemoryBudgetExceeded": "elimination",
+    "factorized_posterior": "factorized",
+    "CompiledNetwork": "factors",
+    "Factor": "factors",
+    "NoisyOr": "factors",
+    "compile_network": "factors",
+    "InferenceSession": "junction_tree",
+    "JointTable": "joint",
+    "joint_ask": "joint",
+    "JunctionTree": "junction_tree",
+    "posterior_marginals": "junction_tree",
+    "PrebuiltNetwork": "network_file",
+    "load_network": "network_file",
+    "read_network": "network_file",
+    "save_network": "network_file",
+    "map_ask": "mpe",
+    "mpe_ask": "mpe",
+    "top_map_ask": "mpe",
+    "parallel_ask": "parallel",
+    "parse_stream": "parser",
+    "relevant_network": "relevance",
+    "most_probably_free_paths": "paths",
+    "path_free_probability": "paths",
+    "Estimate": "sampling",
+    "InferenceStats": "stats",
+    "ParameterizedNetwork": "sweep",
+    "parameter_grid": "sweep",
+    "parameter_sweep": "sweep",
+    "approximate_ask": "sampling",
+}
+
+__all__ = list(EXPORTS)
+
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError("module "+__name__+" has no attribute "+name)
+    value = getattr(importlib.import_module("."+EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,175 @@
+import numpy as np
+
+from .elimination import elimination_order, evidence_factors, largest_product
+from .factors import compile_network
+from .relevance import ancestors, relevant_network
+from .stats import instrument, phase
+
+
+#state index of an evidence variable that is not observed in a scenario
+MISSING = -1
+#a chunk of scenarios is small enough that its largest intermediate table has at most this many entries
+MAX_BATCH_ENTRIES = 2**24
+
+
+def evidence_matrix(compiled, evidence_variables, evidence):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    evidence_variables: the names of the columns of evidence
+    evidence: a 2-D array with one row per scenario and one column per evidence variable, the entries are
+    state labels ("1", "mild") or state indices (in the order of compiled.states). None, "" or MISSING
+    mean the variable is not observed in that scenario. an integer is always a state index, also in an
+    object array that mixes it with labels or None (1 is "stormy" for W)
+    output:
+    a (scenarios, evidence variables) int64 array of state indices, MISSING where not observed
+    '''
+    evidence = np.asarray(evidence)
+    if evidence.ndim != 2 or evidence.shape[1] != len(evidence_variables):
+        raise ValueError("evidence must be a 2-D array with one column per evidence variable, got shape "+str(evidence.shape))
+    ids = [compiled.index[name] for name in evidence_variables]
+    if evidence.dtype.kind in "iu":
+        states = evidence.astype(np.int64)
+    else:
+        states = np.full(evidence.shape, MISSING, dtype=np.int64)
+        for column, var in enumerate(ids):
+            labels = evidence[:, column]
+            for label in set(labels.tolist()):
+                if label is None or label == "":
+                    continue
+                if isinstance(label, (int, np.integer)) and not isinstance(label, bool):
+                    #a state index, checked with the others below
+                    states[labels == label, column] = label
+                    continue
+                if str(label) not in compiled.state_index[var]:
+                    raise ValueError("unknown state "+str(label)+" of "+evidence_variables[column]+", expected one of "+str(compiled.states[var]))
+                states[labels == label, column] = compiled.state_index[var][str(label)]
+    cardinality = compiled.cardinality[ids]
+    if np.any((states < MISSING) | (states >= cardinality)):
+        raise ValueError("state indices must be in range(cardinality) or "+str(MISSING))
+    return states
+
+
+def expand(variables, table, scope, cardinality):
+    #the table (batch axis first) with its variable axes in the order of scope, missing variables get an axis of size 1
+    axes = [0] + [1 + variables.index(var) for var in sorted(variables, key=scope.index)]
+    shape = [table.shape[0]] + [cardinality[var] if var in variables else 1 for var in scope]
+    return table.transpose(axes).reshape(shape)
+
+
+def eliminate_batch(factors, order, cardinality, stats=None):
+    '''
+    input:
+    factors: a list of (variables, table) pairs, table has a batch axis of size 1 or scenarios before the variable axes
+    order: the variables to sum out, in order
+    cardinality: a dictionary of variable id -> number of states
+    output:
+    the factors left after summing out the variables of order, every product broadcasts over the batch axis
+    '''
+    for var in order:
+        related = [factor for factor in factors if var in factor[0]]
+        if len(related) == 0:
+            continue
+        factors = [factor for factor in factors if var not in factor[0]]
+        scope = tuple(dict.fromkeys(v for variables, _ in related for v in variables))
+        product = expand(*related[0], scope, cardinality)
+        for variables, table in related[1:]:
+            product = product * expand(variables, table, scope, cardinality)
+        position = scope.index(var)
+        factors.append((scope[:position] + scope[position+1:], product.sum(axis=1+position)))
+        if stats is not None:
+            stats.factor_products += len(related) - 1
+            stats.factor_sums += 1
+            stats.largest_factor = max(stats.largest_factor, int(product.size))
+            stats.width = max(stats.width, len(scope))
+    return factors
+
+
+def batch_distributions(factors, query_ids, cardinality, batch: int):
+    '''
+    input:
+    factors: the (variables, table) pairs left by eliminate_batch, they only mention query variables
+    query_ids: ids of the query variables
+    cardinality: a dictionary of variable id -> number of states
+    batch: the size of the batch axis
+    output:
+    a (batch, joint query states) array, every row normalized (nan if it sums to 0)
+    '''
+    joint = np.ones([batch] + [cardinality[var] for var in query_ids])
+    for variables, table in factors:
+        joint = joint * expand(variables, table, tuple(query_ids), cardinality)
+    #the noisy-OR decomposition uses negative values, so a zero can come back as a tiny negative number
+    joint = np.maximum(joint.reshape(batch, -1), 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return joint / joint.sum(axis=1, keepdims=True)
+
+
+def batch_ask(query, evidence_variables, evidence, bayes_network, max_entries=MAX_BATCH_ENTRIES, stats=None, trace=None):
+    '''
+    input:
+    query: a list of strings, each string is a query variable
+    evidence_variables: a list of strings, the evidence variables (the columns of evidence)
+    evidence: a 2-D array with one row per scenario and one column per evidence variable (see evidence_matrix),
+    for example [["1", "0"], ["0", "0"]] for evidence_variables ["Ev(1)", "Ev(2)"]
+    bayes_network: a DiGraph object created by create_bayes_network
+    max_entries: the scenarios are answered in chunks whose largest intermediate table has at most this many entries
+    stats, trace: instrumentation, as in variable_elimination_ask
+    output:
+    a (scenarios, joint query states) array, row s is the distribution of the query given scenario s with the
+    columns in the order of compile_network(bayes_network).keys(query) (the order of the enumeration_ask keys).
+    a row whose evidence is impossible is nan.
+
+    all the scenarios observe the same variables, so the elimination order is computed once and every table
+    gets a batch axis: the conditional tables have a batch axis of size 1, the evidence of a variable is a
+    (scenarios, states) indicator table, and every product and sum of the elimination broadcasts over all the
+    scenarios of a chunk at once.
+    '''
+    stats = instrument(stats, trace)
+    if stats is not None:
+        stats.engine = "batch"
+    with phase(stats, "compile"):
+        compiled = compile_network(bayes_network)
+        query_ids = [compiled.index[q] for q in query]
+        states = evidence_matrix(compiled, evidence_variables, evidence)
+        evidence_ids = [compiled.index[name] for name in evidence_variables]
+
+    with phase(stats, "prune"):
+        if np.any(states == MISSING):
+            #a variable that some scenarios do not observe cannot block the ball, only the barren part is left out
+            variables = ancestors(compiled, query_ids + evidence_ids)
+        else:
+            #which variables are requisite only depends on which variables are observed, not on their states
+            variables, kept = relevant_network(compiled, query_ids, {var: 0 for var in evidence_ids})
+            columns = [column for column, var in enumerate(evidence_ids) if var in kept]
+            states = states[:, columns]
+            evidence_ids = [evidence_ids[column] for column in columns]
+    if stats is not None:
+        stats.event("prune", variables=len(variables), evidence=len(evidence_ids))
+
+    with phase(stats, "order"):
+        #the evidence variables are kept like query variables, their indicator tables are added per chunk
+        factors = evidence_factors(compiled, query_ids + evidence_ids, {}, variables)
+        hidden = {var for factor in factors for var in factor.variables if var not in query_ids} | set(evidence_ids)
+        hidden -= set(query_ids)
+        order = elimination_order(factors, hidden)
+        cardinality = {var: int(card) for factor in factors for var, card in zip(factor.variables, factor.cardinality)}
+        cardinality.update({var: int(compiled.cardinality[var]) for var in query_ids + evidence_ids})
+        chunk = max(1, max_entries // max(largest_product(factors, order), int(np.prod(compiled.cardinality[query_ids]))))
+    tables = [(factor.variables, factor.table()[np.newaxis]) for factor in factors]
+
+    scenarios = len(states)
+    result = np.empty((scenarios, int(np.prod(compiled.cardinality[query_ids]))))
+    for start in range(0, scenarios, chunk):
+        rows = states[start:start+chunk]
+        with phase(stats, "eliminate"):
+            chunk_factors = list(tables)
+            for column, var in enumerate(evidence_ids):
+                #one-hot rows for the scenarios that observe var, all ones for the others
+                observed = rows[:, column] != MISSING
+                indicators = np.ones((len(rows), cardinality[var]))
+                indicators[observed] = np.eye(cardinality[var])[rows[observed, column]]
+                chunk_factors.append(((var,), indicators))
+            chunk_factors = eliminate_batch(chunk_factors, order, cardinality, stats)
+        with phase(stats, "normalize"):
+            result[start:start+chunk] = batch_distributions(chunk_factors, query_ids, cardinality, len(rows))
+    return result
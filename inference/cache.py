@@ -0,0 +1,123 @@
+from collections import OrderedDict
+
+from .factors import network_revision
+
+
+#number of results a network keeps by default
+DEFAULT_CACHE_SIZE = 1024
+
+
+def evidence_key(evidence: dict):
+    """A hashable key of the evidence that does not depend on the order it was given in."""
+    return tuple(sorted((name, str(state)) for name, state in evidence.items()))
+
+
+def query_key(method: str, query, evidence: dict):
+    '''
+    input:
+    method: the name of the inference routine, results of different routines are kept apart
+    query: a list of strings, each string is a query variable (the order matters, it is the order of the result)
+    evidence: a dictionary of strings, each string is an evidence variable
+    output:
+    a hashable key of the query
+    '''
+    return (method, tuple(query), evidence_key(evidence))
+
+
+def dependencies(compiled, variables, evidence_ids, query_ids=()):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    variables: the variable ids whose tables a result was computed from (the requisite variables of relevant_network
+    or the ancestors of the evidence)
+    evidence_ids, query_ids: the evidence and the query of the result, as variable ids
+    output:
+    the names of the variables the result depends on. the evidence is included as a whole: a leaf that is not
+    requisite only becomes requisite when it gets a new parent and is observed, so with the evidence an edit of
+    the tables or the parents of leaves (the Ev nodes) never leaves a result behind that depends on it
+    '''
+    ids = set(variables) | set(evidence_ids) | set(query_ids)
+    return frozenset(compiled.names[var] for var in ids)
+
+
+class QueryCache:
+    """A bounded cache of query results that evicts the least recently used result.
+
+    The cache remembers the network_revision it was filled for and empties itself
+    when the network changed, so it never returns results of old tables. An edit that knows
+    which nodes it changed (see bayes.set_road) calls invalidate instead, which only drops the
+    results that depend on them.
+
+    Args:
+        maxsize (int): the maximal number of results kept.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        #key -> the names of the variables the result depends on, None for the whole network
+        self.dependencies = {}
+        self.revision = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.results)
+
+    def __repr__(self):
+        return "QueryCache(size="+str(len(self))+", maxsize="+str(self.maxsize)+", hits="+str(self.hits)+", misses="+str(self.misses)+")"
+
+    def validate(self, revision):
+        if revision != self.revision:
+            self.results.clear()
+            self.dependencies.clear()
+            self.revision = revision
+
+    def invalidate(self, names, revision):
+        '''
+        input:
+        names: the names of the variables whose table or parents were changed, added or removed
+        revision: the network_revision of the network after the change
+        drops the results that depend on one of names and keeps the others for revision
+        '''
+        names = set(names)
+        stale = [key for key, depends in self.dependencies.items() if depends is None or not depends.isdisjoint(names)]
+        for key in stale:
+            del self.results[key]
+            del self.dependencies[key]
+        self.revision = revision
+
+    def get(self, key):
+        """The cached result of key or None, counting a hit or a miss."""
+        if key not in self.results:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return self.results[key]
+
+    def put(self, key, result, depends=None):
+        """Keep result, depends are the names of the variables it depends on (see dependencies), None for all of them."""
+        self.results[key] = result
+        self.dependencies[key] = None if depends is None else frozenset(depends)
+        self.results.move_to_end(key)
+        while len(self.results) > self.maxsize:
+            evicted, _ = self.results.popitem(last=False)
+            del self.dependencies[evicted]
+
+    def clear(self):
+        self.results.clear()
+        self.dependencies.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def query_cache(bayes_network) -> QueryCache:
+    """The result cache attached to the network (bayes_network.graph["query_cache"]), checked against its revision."""
+    cache = bayes_network.graph.get("query_cache")
+    if cache is None:
+        cache = QueryCache()
+        bayes_network.graph["query_cache"] = cache
+    cache.validate(network_revision(bayes_network))
+    return cache
+
@@ -0,0 +1,400 @@
+import heapq
+import warnings
+from itertools import count, product
+
+import numpy as np
+
+from .cache import dependencies, query_cache, query_key
+from .factorized import factorized_joint, factorized_posterior
+from .factors import Factor, NoisyOr, compile_network, indicator, multiply_all
+from .relevance import ancestors, relevant_network
+from .sampling import approximate_ask, estimate_evidence_probability
+from .stats import instrument, phase
+
+
+#above this degree the fill-in of a variable is not counted (see fill_in)
+MAX_FILL_DEGREE = 64
+#the memory budget of exact inference: no factor above this many entries (8 bytes each) is built,
+#a bigger elimination is conditioned on a cutset (see sum_product) or answered approximately
+MAX_FACTOR_ENTRIES = 2**25
+#conditioning on a cutset with more joint states than this takes too many passes, sampling is used instead
+MAX_CUTSET_STATES = 2**12
+#number of samples of the approximate answer when exact inference does not fit the memory budget
+FALLBACK_SAMPLES = 100000
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """Raised instead of building a factor above the memory budget when conditioning does not bring it under."""
+
+
+def interaction_graph(factors):
+    #two variables are neighbours if they appear together in some factor
+    neighbours = {}
+    for factor in factors:
+        for var in factor.variables:
+            neighbours.setdefault(var, set()).update(v for v in factor.variables if v != var)
+    return neighbours
+
+
+def fill_in(neighbours, var):
+    #number of edges that eliminating var would add between its neighbours.
+    #counting it costs degree^2, so for hubs the upper bound degree*(degree-1)/2 is used instead
+    adjacent = list(neighbours[var])
+    if len(adjacent) > MAX_FILL_DEGREE:
+        return len(adjacent) * (len(adjacent)-1) // 2
+    fill = 0
+    for i in range(len(adjacent)):
+        for j in range(i+1, len(adjacent)):
+            if adjacent[j] not in neighbours[adjacent[i]]:
+                fill += 1
+    return fill
+
+
+def elimination_order(factors, variables):
+    '''
+    input:
+    factors: a list of factors
+    variables: the variables that need to be eliminated
+    output:
+    a greedy elimination order of the variables, choosing at each step the variable with
+    the minimal fill-in, breaking ties by the minimal degree (min-fill / min-degree).
+    the scores are kept in a heap and only the neighbours of the eliminated variable are
+    rescored (eliminating a variable can only lower the fill-in of the other variables).
+    '''
+    neighbours = interaction_graph(factors)
+    remaining = set(variables)
+    for var in remaining:
+        neighbours.setdefault(var, set())
+    scores = {var: (fill_in(neighbours, var), len(neighbours[var]), var) for var in remaining}
+    heap = list(scores.values())
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        score = heapq.heappop(heap)
+        var = score[2]
+        if var not in remaining or scores[var] != score:
+            continue
+        #connect all the neighbours of var to each other and remove var from the graph
+        adjacent = neighbours.pop(var)
+        for neighbour in adjacent:
+            neighbours[neighbour].discard(var)
+            neighbours[neighbour].update(adjacent - {neighbour})
+        remaining.remove(var)
+        order.append(var)
+        for neighbour in adjacent:
+            if neighbour in remaining:
+                scores[neighbour] = (fill_in(neighbours, neighbour), len(neighbours[neighbour]), neighbour)
+                heapq.heappush(heap, scores[neighbour])
+    return order
+
+
+def eliminate(factors, order, stats=None):
+    #sum out the variables one by one, multiplying only the factors that mention them
+    for var in order:
+        related = [factor for factor in factors if var in factor.variables]
+        if len(related) == 0:
+            continue
+        factors = [factor for factor in factors if var not in factor.variables]
+        product = multiply_all(related)
+        factors.append(product.sum_out(var))
+        if stats is not None:
+            stats.factor_products += len(related)
+            stats.factor_sums += 1
+            stats.factor(product)
+            stats.event("eliminate", variable=var, size=int(product.values.size), width=len(product.variables))
+    return factors
+
+
+def largest_product(factors, order):
+    #the number of entries of the largest product the elimination builds, without building it.
+    #scopes are indexed by variable so every step only looks at the scopes that mention its variable
+    cardinality = {var: int(card) for factor in factors for var, card in zip(factor.variables, factor.cardinality)}
+    scopes = {}
+    containing = {}
+    for i, factor in enumerate(factors):
+        scopes[i] = set(factor.variables)
+        for var in factor.variables:
+            containing.setdefault(var, set()).add(i)
+    ids = count(len(factors))
+    largest = 1
+    for var in order:
+        related = containing.pop(var, set())
+        if len(related) == 0:
+            continue
+        scope = set().union(*[scopes.pop(i) for i in related])
+        largest = max(largest, int(np.prod([cardinality[v] for v in scope], dtype=np.float64)))
+        scope.discard(var)
+        new = next(ids)
+        scopes[new] = scope
+        for v in scope:
+            containing[v] -= related
+            containing[v].add(new)
+    #the factors that are left are multiplied into the result
+    return max(largest, int(np.prod([cardinality[v] for v in set().union(*scopes.values())], dtype=np.float64)))
+
+
+def check_budget(largest: int, max_entries: int, what: str):
+    #raises MemoryBudgetExceeded if what needs a factor of more than max_entries entries
+    if largest > max_entries:
+        raise MemoryBudgetExceeded(what+" needs a factor of "+str(largest)+" entries, more than the budget of "+str(max_entries))
+
+
+def restrict_all(factors, assignment):
+    #the factors with the variables of assignment (variable id -> state index) fixed
+    restricted = []
+    for factor in factors:
+        for var in factor.variables:
+            if var in assignment:
+                factor = factor.restrict(var, assignment[var])
+        restricted.append(factor)
+    return restricted
+
+
+def cutset(factors, variables, max_entries: int, max_states: int = MAX_CUTSET_STATES):
+    '''
+    input:
+    factors: a list of factors
+    variables: the variables to sum out
+    max_entries: the memory budget, see MAX_FACTOR_ENTRIES
+    max_states: the largest number of joint states of the cutset
+    output:
+    (cutset, order): the variables to condition on and an elimination order of the other ones whose largest factor
+    has at most max_entries entries once the cutset is fixed, or None if that needs more than max_states joint states.
+    the cutset is chosen greedily, the variable with the most neighbours among the factors left (a hub of the dense
+    part of the network) until the elimination fits
+    '''
+    cardinality = {var: int(card) for factor in factors for var, card in zip(factor.variables, factor.cardinality)}
+    remaining = set(variables)
+    chosen = []
+    states = 1
+    while True:
+        order = elimination_order(factors, remaining)
+        if largest_product(factors, order) <= max_entries:
+            return chosen, order
+        neighbours = interaction_graph(factors)
+        candidates = [var for var in remaining if var in neighbours]
+        if len(candidates) == 0:
+            return None
+        var = max(candidates, key=lambda v: (len(neighbours[v]), v))
+        states *= cardinality[var]
+        if states > max_states:
+            return None
+        chosen.append(var)
+        remaining.discard(var)
+        #the structure does not depend on the state, the first one stands for all of them
+        factors = restrict_all(factors, {var: 0})
+
+
+def sum_product(factors, variables, max_entries: int = MAX_FACTOR_ENTRIES, stats=None):
+    '''
+    input:
+    factors: a list of factors
+    variables: the variables to sum out
+    max_entries: the memory budget, see MAX_FACTOR_ENTRIES
+    stats: an InferenceStats to fill, or None
+    output:
+    the product of the factors with the variables summed out.
+    the largest factor of the elimination order is estimated before anything is multiplied. if it is above
+    max_entries, the elimination runs once for every joint state of a cutset (see cutset) and the results are
+    added up: the memory stays under the budget and the time grows with the number of states of the cutset.
+    raises MemoryBudgetExceeded if the cutset would need more than MAX_CUTSET_STATES passes
+    '''
+    with phase(stats, "order"):
+        order = elimination_order(factors, variables)
+        largest = largest_product(factors, order)
+    if stats is not None:
+        stats.event("plan", largest=largest, max_entries=max_entries)
+    if largest <= max_entries:
+        with phase(stats, "eliminate"):
+            return multiply_all(eliminate(factors, order, stats))
+
+    with phase(stats, "order"):
+        plan = cutset(factors, variables, max_entries)
+    if plan is None:
+        raise MemoryBudgetExceeded("variable elimination needs a factor of "+str(largest)+" entries, more than the budget of "
+                                   + str(max_entries)+" even when conditioning on up to "+str(MAX_CUTSET_STATES)+" states")
+    conditioned, order = plan
+    cardinality = {var: int(card) for factor in factors for var, card in zip(factor.variables, factor.cardinality)}
+    if stats is not None:
+        stats.event("condition", variables=conditioned, passes=int(np.prod([cardinality[var] for var in conditioned])))
+    total = None
+    with phase(stats, "eliminate"):
+        for states in product(*[range(cardinality[var]) for var in conditioned]):
+            result = multiply_all(eliminate(restrict_all(factors, dict(zip(conditioned, states))), order, stats))
+            if total is None:
+                total = result
+            else:
+                #every pass ends with the same variables, possibly in another order
+                total = Factor(total.variables, total.cardinality,
+                               total.table() + result.expand(total.variables, total.cardinality))
+    return total
+
+
+def evidence_factors(compiled, query_ids, evidence_ids, variables=None):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    query_ids: ids of the query variables
+    evidence_ids: a dictionary of variable id -> observed state index
+    variables: the variables whose tables are used (see relevant_network), all of them if None
+    output:
+    the conditional tables of the network with the evidence absorbed into them
+    (observed query variables are kept and get an indicator factor, so they get a point mass).
+    noisy-OR tables are replaced by their decomposition, an unobserved noisy-OR leaf that
+    is not queried sums to 1 and is left out.
+    '''
+    observed = {var: state for var, state in evidence_ids.items() if var not in query_ids}
+    factors = []
+    for cpt in (compiled.cpts if variables is None else [compiled.cpts[var] for var in variables]):
+        if isinstance(cpt, NoisyOr):
+            if cpt.var not in query_ids and cpt.var not in observed and len(compiled.children[cpt.var]) == 0:
+                continue
+            factors.extend(cpt.restrict_parents(observed).decompose(observed.get(cpt.var)))
+            continue
+        for var in cpt.variables:
+            if var in observed:
+                cpt = cpt.restrict(var, observed[var])
+        factors.append(cpt)
+    for var in query_ids:
+        if var in evidence_ids:
+            factors.append(indicator(var, compiled.cardinality[var], evidence_ids[var]))
+    return factors
+
+
+def query_factor(compiled, query_ids, evidence_ids, stats=None, relevant=None, max_entries: int = MAX_FACTOR_ENTRIES):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    query_ids: ids of the query variables
+    evidence_ids: a dictionary of variable id -> observed state index
+    stats: an InferenceStats to fill, or None
+    relevant: the output of relevant_network for the query, if it is already known
+    max_entries: the memory budget of the elimination, see sum_product
+    output:
+    an unnormalized factor over the query variables (their joint with the evidence, up to a constant).
+    raises MemoryBudgetExceeded if the elimination does not fit max_entries
+    '''
+    #only the part of the network that is not barren or d-separated from the query given the evidence
+    if relevant is None:
+        with phase(stats, "prune"):
+            relevant = relevant_network(compiled, query_ids, evidence_ids)
+    variables, evidence_ids = relevant
+    if stats is not None:
+        stats.event("prune", variables=len(variables), evidence=len(evidence_ids))
+
+    #networks with the W -> B -> Ev layout are answered in closed form over W when possible
+    with phase(stats, "factorized"):
+        joint = factorized_joint(compiled, evidence_ids, query_ids)
+    if joint is not None:
+        if stats is not None:
+            stats.engine = "factorized"
+        return joint
+
+    if stats is not None:
+        stats.engine = "variable_elimination"
+    with phase(stats, "order"):
+        factors = evidence_factors(compiled, query_ids, evidence_ids, variables)
+        #the hidden variables include the auxiliary variables of the noisy-OR decompositions
+        hidden = {var for factor in factors for var in factor.variables if var not in query_ids}
+    #the result only mentions query variables
+    return sum_product(factors, hidden, max_entries, stats)
+
+
+def variable_elimination_ask(query, evidence, bayes_network, stats=None, trace=None, max_entries: int = MAX_FACTOR_ENTRIES):
+    '''
+    input:
+    query: a list of strings, each string is a query variable
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    stats: an InferenceStats to fill with the counters and timings of the query
+    trace: a callback trace(event, details), see InferenceStats
+    max_entries: the memory budget, no factor above this many entries is built (see sum_product)
+    output:
+    a distribution of the query variables, in the same format as enumeration_ask
+    (for example {"['B(1)=0']": 0.6, "['B(1)=1']": 0.4}).
+    if exact inference does not fit max_entries even with conditioning, a RuntimeWarning is issued and the
+    distribution is estimated by likelihood weighting (it is not cached).
+    raises ValueError if the evidence has probability 0, nothing is cached then
+    '''
+    stats = instrument(stats, trace)
+    cache = query_cache(bayes_network)
+    key = query_key("variable_elimination", query, evidence)
+    cached = cache.get(key)
+    if stats is not None:
+        stats.cache(cached is not None)
+    if cached is not None:
+        return dict(cached)
+
+    with phase(stats, "compile"):
+        compiled = compile_network(bayes_network)
+        query_ids = [compiled.index[q] for q in query]
+        evidence_ids = compiled.evidence_ids(evidence)
+    with phase(stats, "prune"):
+        relevant = relevant_network(compiled, query_ids, evidence_ids)
+    try:
+        joint = query_factor(compiled, query_ids, evidence_ids, stats, relevant, max_entries)
+    except MemoryBudgetExceeded as error:
+        warnings.warn(str(error)+", the answer is estimated by likelihood weighting", RuntimeWarning)
+        if stats is not None:
+            stats.engine = "approximate"
+        with phase(stats, "sample"):
+            return approximate_ask(query, evidence, bayes_network, FALLBACK_SAMPLES).distribution
+    with phase(stats, "normalize"):
+        distribution = compiled.distribution(query, joint)
+    #an edit of the network only drops the result if it changes one of the requisite variables
+    cache.put(key, dict(distribution), dependencies(compiled, relevant[0], evidence_ids, query_ids))
+    return distribution
+
+
+def evidence_probability(evidence, bayes_network, stats=None, trace=None, max_entries: int = MAX_FACTOR_ENTRIES):
+    '''
+    input:
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    stats, trace, max_entries: as in variable_elimination_ask
+    output:
+    P(evidence), all the other variables are summed out. like variable_elimination_ask, it falls back to
+    likelihood weighting with a RuntimeWarning if the elimination does not fit max_entries
+    '''
+    stats = instrument(stats, trace)
+    cache = query_cache(bayes_network)
+    key = query_key("evidence_probability", [], evidence)
+    cached = cache.get(key)
+    if stats is not None:
+        stats.cache(cached is not None)
+    if cached is not None:
+        return cached
+
+    with phase(stats, "compile"):
+        compiled = compile_network(bayes_network)
+        evidence_ids = compiled.evidence_ids(evidence)
+    with phase(stats, "prune"):
+        #P(evidence) only depends on the evidence variables and their ancestors
+        variables = ancestors(compiled, evidence_ids)
+    depends = dependencies(compiled, variables, evidence_ids)
+    with phase(stats, "factorized"):
+        posterior = factorized_posterior(compiled, evidence_ids)
+    if posterior is not None:
+        if stats is not None:
+            stats.engine = "factorized"
+        probability = posterior.evidence_probability()
+        cache.put(key, probability, depends)
+        return probability
+
+    if stats is not None:
+        stats.engine = "variable_elimination"
+    with phase(stats, "order"):
+        factors = evidence_factors(compiled, [], evidence_ids, variables)
+        hidden = {var for factor in factors for var in factor.variables}
+    try:
+        result = sum_product(factors, hidden, max_entries, stats)
+    except MemoryBudgetExceeded as error:
+        warnings.warn(str(error)+", the probability is estimated by likelihood weighting", RuntimeWarning)
+        if stats is not None:
+            stats.engine = "approximate"
+        with phase(stats, "sample"):
+            return estimate_evidence_probability(compiled, evidence_ids, FALLBACK_SAMPLES)
+    #the noisy-OR decomposition uses negative values, so a zero can come back as a tiny negative number
+    probability = max(float(result.values[0]), 0.0)
+    cache.put(key, probability, depends)
+    return probability
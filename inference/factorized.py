@@ -0,0 +1,229 @@
+from itertools import combinations
+
+import numpy as np
+
+from .factors import Factor, NoisyOr
+
+
+#above this number of Ev(i)=1 reports the inclusion-exclusion sum has too many terms (2^reports)
+#and the general engine is used instead
+MAX_POSITIVE_REPORTS = 12
+
+
+class WeatherStructure:
+    """The layout of a network created by create_bayes_network: W -> B(i) -> Ev(i).
+
+    W is the only root, every B(i) is binary with W as its only parent and every other variable
+    is a noisy-OR leaf whose parents are B variables. Given W the B variables are independent,
+    which is what the closed form inference of this module relies on.
+
+    Args:
+        compiled (CompiledNetwork): a network with this layout (see weather_structure).
+    """
+
+    def __init__(self, compiled, weather: int, blockages, noisy):
+        self.weather = weather
+        self.blockages = np.array(blockages, dtype=np.int64)
+        self.column = {var: i for i, var in enumerate(blockages)}
+        #blocked[w, i] = P(B=1 | W=w) of the i'th blockage variable
+        tables = np.array([compiled.cpts[var].values for var in blockages]).reshape(len(blockages), compiled.cardinality[weather], 2)
+        self.blocked = tables[:, :, 1].T.reshape(compiled.cardinality[weather], len(blockages))
+        self.prior = compiled.cpts[weather].values
+        self.noisy = noisy
+        self.noisy_position = {cpt.var: j for j, cpt in enumerate(noisy)}
+        #the parents of all the noisy-OR nodes in one array, segment[k] is the noisy-OR node of parents[k]
+        self.parents = np.array([self.column[p] for cpt in noisy for p in cpt.parents], dtype=np.int64)
+        self.inhibitors = np.concatenate([cpt.inhibitors for cpt in noisy]) if noisy else np.zeros(0)
+        self.segment = np.repeat(np.arange(len(noisy)), [len(cpt.parents) for cpt in noisy])
+        self.leak = np.array([cpt.leak for cpt in noisy])
+
+
+def weather_structure(compiled):
+    """The WeatherStructure of the compiled network, or None if it does not have that layout."""
+    if "weather_structure" in compiled.annotations:
+        return compiled.annotations["weather_structure"]
+    structure = None
+    roots = [var for var in range(len(compiled)) if len(compiled.parents[var]) == 0
+             and not isinstance(compiled.cpts[var], NoisyOr)]
+    if len(roots) == 1:
+        weather = roots[0]
+        blockages = [var for var in range(len(compiled)) if compiled.parents[var] == (weather,)
+                     and not isinstance(compiled.cpts[var], NoisyOr) and compiled.cardinality[var] == 2]
+        noisy = [cpt for cpt in compiled.cpts if isinstance(cpt, NoisyOr)]
+        layout_ok = len(blockages) + len(noisy) + 1 == len(compiled)
+        blockage_set = set(blockages)
+        for cpt in noisy:
+            if not blockage_set.issuperset(cpt.parents) or len(compiled.children[cpt.var]) > 0:
+                layout_ok = False
+        if layout_ok:
+            structure = WeatherStructure(compiled, weather, blockages, noisy)
+    compiled.annotations["weather_structure"] = structure
+    return structure
+
+
+def inclusion_exclusion_terms(structure, evidence_ids):
+    '''
+    input:
+    structure: a WeatherStructure
+    evidence_ids: a dictionary of variable id -> observed state index
+    output:
+    None if there are more than MAX_POSITIVE_REPORTS Ev(i)=1 reports, otherwise (offset, terms) where terms is a list
+    of (z, r) pairs: z[w] is a signed weight of weather w and r[w, i] is the probability that the i'th blockage
+    variable is 1 in that term, with the blockage variables independent. P(evidence, W=w) = exp(offset) * sum of z[w],
+    and any quantity that factorizes over the blockages is a z-weighted sum over the terms.
+
+    given W the evidence on B and the Ev(i)=0 reports multiply every blockage by its own factor. an Ev(i)=1 report
+    multiplies by 1 - leak * product of q^B over the parents, which couples them, so the product of those reports is
+    expanded: product over i of (1 - a_i) = sum over subsets S of (-1)^|S| product over i in S of a_i.
+    every subset is a term where all the factors are again per blockage variable.
+    '''
+    weights = structure.prior.copy()
+    if structure.weather in evidence_ids:
+        weights = np.zeros(len(weights))
+        weights[evidence_ids[structure.weather]] = structure.prior[evidence_ids[structure.weather]]
+    #unnormalized weight of B=0 and B=1 for every weather state and blockage variable
+    off = 1 - structure.blocked
+    on = structure.blocked.copy()
+    for var, state in evidence_ids.items():
+        if var in structure.column:
+            column = structure.column[var]
+            if state == 0:
+                on[:, column] = 0
+            else:
+                off[:, column] = 0
+
+    positive = []
+    for j, cpt in enumerate(structure.noisy):
+        if cpt.var not in evidence_ids:
+            continue
+        columns = [structure.column[parent] for parent in cpt.parents]
+        if evidence_ids[cpt.var] == 0:
+            on[:, columns] *= cpt.inhibitors
+            weights = weights * cpt.leak
+        else:
+            positive.append((cpt.leak, columns, cpt.inhibitors))
+    if len(positive) > MAX_POSITIVE_REPORTS:
+        return None
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_weights = np.log(weights)
+        #every other term is smaller than the empty subset term, so it sets the scale
+        offset = np.max(log_weights + np.log(off + on).sum(axis=1))
+        if not np.isfinite(offset):
+            offset = 0.0
+        terms = []
+        for size in range(len(positive)+1):
+            for subset in combinations(positive, size):
+                term_on = on
+                constant = (-1.0)**size
+                if size:
+                    term_on = on.copy()
+                    for leak, columns, inhibitors in subset:
+                        term_on[:, columns] *= inhibitors
+                        constant *= leak
+                total = off + term_on
+                z = constant * np.exp(log_weights + np.log(total).sum(axis=1) - offset)
+                r = np.where(total > 0, term_on / total, 0)
+                terms.append((np.nan_to_num(z), r))
+    return offset, terms
+
+
+class FactorizedPosterior:
+    """Exact marginals of every variable of a WeatherStructure network, computed in closed form over W.
+
+    The cost is O(terms * |W| * (n + |E|)) where terms = 2^(number of Ev(i)=1 reports).
+    """
+
+    def __init__(self, structure, evidence_ids, offset, terms):
+        self.structure = structure
+        self.evidence_ids = evidence_ids
+        self.offset = offset
+        weather = np.zeros(len(structure.prior))
+        blocked = np.zeros(len(structure.blockages))
+        people_off = np.zeros(len(structure.noisy))
+        for z, r in terms:
+            weather += z
+            blocked += z @ r
+            #P(Ev(i)=0 | W, term) = leak * the product over its parents of E[q^B] = 1 - r + r*q
+            with np.errstate(divide="ignore"):
+                logs = np.log(1 - r[:, structure.parents] + r[:, structure.parents] * structure.inhibitors)
+            products = np.exp(np.array([np.bincount(structure.segment, weights=row, minlength=len(structure.noisy)) for row in logs]))
+            people_off += z @ products * structure.leak
+        self.total = weather.sum()
+        self.weather = np.maximum(weather, 0)
+        self.blocked = blocked
+        self.people_off = people_off
+
+    def evidence_probability(self):
+        return max(float(self.total * np.exp(self.offset)), 0.0)
+
+    def marginal(self, var: int):
+        """The normalized marginal of a variable as an array over its states, ValueError if the evidence has probability 0."""
+        if self.total <= 0 or self.weather.sum() <= 0:
+            raise ValueError("the evidence has probability 0")
+        structure = self.structure
+        if var == structure.weather:
+            return self.weather / self.weather.sum()
+        if var in structure.column:
+            p = min(max(self.blocked[structure.column[var]] / self.total, 0.0), 1.0)
+        else:
+            position = structure.noisy_position[var]
+            if var in self.evidence_ids:
+                p = float(self.evidence_ids[var])
+            else:
+                p = min(max(1 - self.people_off[position] / self.total, 0.0), 1.0)
+        return np.array([1-p, p])
+
+
+def factorized_posterior(compiled, evidence_ids):
+    """The FactorizedPosterior of the evidence, or None if the fast path does not apply and the general engine is needed."""
+    structure = weather_structure(compiled)
+    if structure is None:
+        return None
+    expansion = inclusion_exclusion_terms(structure, evidence_ids)
+    if expansion is None:
+        return None
+    return FactorizedPosterior(structure, evidence_ids, *expansion)
+
+
+def factorized_joint(compiled, evidence_ids, query_ids):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    evidence_ids: a dictionary of variable id -> observed state index
+    query_ids: ids of the query variables
+    output:
+    an unnormalized Factor over the query variables, or None if the fast path does not apply
+    (the query has to be W and B variables, or a single variable).
+    '''
+    structure = weather_structure(compiled)
+    if structure is None:
+        return None
+    if len(query_ids) == 1:
+        posterior = factorized_posterior(compiled, evidence_ids)
+        if posterior is None:
+            return None
+        var = query_ids[0]
+        return Factor((var,), (compiled.cardinality[var],), posterior.marginal(var))
+    if any(var != structure.weather and var not in structure.column for var in query_ids):
+        return None
+    expansion = inclusion_exclusion_terms(structure, evidence_ids)
+    if expansion is None:
+        return None
+
+    blockages = [var for var in query_ids if var != structure.weather]
+    columns = [structure.column[var] for var in blockages]
+    table = np.zeros([len(structure.prior)] + [2]*len(blockages))
+    for z, r in expansion[1]:
+        #given W and the term the query blockages are independent, so their joint is an outer product
+        joint = z.reshape([-1] + [1]*len(blockages))
+        for axis, column in enumerate(columns):
+            shape = [len(structure.prior)] + [1]*len(blockages)
+            shape[axis+1] = 2
+            joint = joint * np.stack([1 - r[:, column], r[:, column]], axis=1).reshape(shape)
+        table += joint
+    variables = [structure.weather] + blockages
+    factor = Factor(variables, [len(structure.prior)] + [2]*len(blockages), table)
+    if structure.weather not in query_ids:
+        factor = factor.sum_out(structure.weather)
+    return factor
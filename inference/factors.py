@@ -0,0 +1,518 @@
+import copy
+from itertools import product
+
+import numpy as np
+
+
+class Factor:
+    """A factor over discrete variables stored as a flat probability table.
+
+    Args:
+        variables (tuple): integer ids of the variables in the factor's scope.
+        cardinality (array): number of states of each variable, in scope order.
+        values (array): flat table of the factor, the last variable changes fastest,
+            so the entry of an assignment is values[sum(assignment * strides)].
+    """
+
+    def __init__(self, variables, cardinality, values):
+        self.variables = tuple(variables)
+        self.cardinality = np.asarray(cardinality, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64).reshape(-1)
+        #stride of variable i is the product of the cardinalities of the variables after it
+        self.strides = np.ones(len(self.variables), dtype=np.int64)
+        for i in range(len(self.variables)-2, -1, -1):
+            self.strides[i] = self.strides[i+1] * self.cardinality[i+1]
+
+    def __repr__(self):
+        return "Factor(variables="+str(self.variables)+", size="+str(self.values.size)+")"
+
+    def table(self):
+        #a view of the values with one axis per variable
+        return self.values.reshape(self.cardinality)
+
+    def index(self, assignment):
+        return int(np.dot(assignment, self.strides))
+
+    def expand(self, variables, cardinality):
+        #view of the table with the axes in the order of variables (a superset of the scope),
+        #variables that are not in the scope get an axis of size 1 so numpy can broadcast
+        axes = sorted(range(len(self.variables)), key=lambda i: variables.index(self.variables[i]))
+        table = self.table().transpose(axes)
+        shape = [card if var in self.variables else 1 for var, card in zip(variables, cardinality)]
+        return table.reshape(shape)
+
+    def multiply(self, other):
+        variables = self.variables + tuple(var for var in other.variables if var not in self.variables)
+        cardinality = list(self.cardinality) + [other.cardinality[other.variables.index(var)]
+                                                for var in variables[len(self.variables):]]
+        values = self.expand(variables, cardinality) * other.expand(variables, cardinality)
+        return Factor(variables, cardinality, values)
+
+    def sum_out(self, var):
+        position = self.variables.index(var)
+        values = self.table().sum(axis=position)
+        return Factor(self.variables[:position] + self.variables[position+1:],
+                      np.delete(self.cardinality, position), values)
+
+    def max_out(self, var):
+        #like sum_out, keeping the largest entry instead of the sum (max-product)
+        position = self.variables.index(var)
+        values = self.table().max(axis=position)
+        return Factor(self.variables[:position] + self.variables[position+1:],
+                      np.delete(self.cardinality, position), values)
+
+    def restrict(self, var, state: int):
+        position = self.variables.index(var)
+        values = np.take(self.table(), state, axis=position)
+        return Factor(self.variables[:position] + self.variables[position+1:],
+                      np.delete(self.cardinality, position), values)
+
+
+def multiply_all(factors):
+    result = Factor((), (), [1.0])
+    for factor in factors:
+        result = result.multiply(factor)
+    return result
+
+
+def indicator(var: int, cardinality: int, state: int):
+    """A factor over a single variable that is 1 at the given state and 0 elsewhere."""
+    values = np.zeros(cardinality)
+    values[state] = 1
+    return Factor((var,), (cardinality,), values)
+
+
+def auxiliary_id(var: int) -> int:
+    #the id of the auxiliary variable of the noisy-OR node var. it is negative, so it never collides with a
+    #variable id, also when variables are added to or removed from a compiled network (see update_compiled)
+    return -1 - var
+
+
+class NoisyOr:
+    """The conditional table of a binary noisy-OR variable, stored as one inhibitor per parent.
+
+    Every parent in state 1 independently fails to turn var on with probability inhibitors[k], so
+    P(var=0 | parents) = leak * the product of the inhibitors of the parents in state 1,
+    and P(var=1 | parents) = 1 - P(var=0 | parents).
+
+    Args:
+        var (int): id of the variable.
+        parents (tuple): ids of the binary parents.
+        inhibitors (array): inhibitor of each parent.
+        aux (int): id of the auxiliary variable used by decompose.
+        leak (float): P(var=0) when no parent is on.
+    """
+
+    def __init__(self, var, parents, inhibitors, aux, leak=1.0):
+        self.var = var
+        self.parents = tuple(parents)
+        self.inhibitors = np.asarray(inhibitors, dtype=np.float64)
+        self.aux = aux
+        self.leak = leak
+        self.variables = self.parents + (var,)
+
+    def __repr__(self):
+        return "NoisyOr(var="+str(self.var)+", parents="+str(self.parents)+")"
+
+    def probability(self, assignment):
+        #assignment is a list of state indices of all the variables of the network
+        prob = self.leak
+        for parent, inhibitor in zip(self.parents, self.inhibitors):
+            if assignment[parent] == 1:
+                prob *= inhibitor
+        return float(prob if assignment[self.var] == 0 else 1-prob)
+
+    def restrict_parents(self, evidence_ids: dict):
+        """The same node with the observed parents removed, a parent that is on moves its inhibitor into the leak."""
+        leak = self.leak
+        parents = []
+        inhibitors = []
+        for parent, inhibitor in zip(self.parents, self.inhibitors):
+            if parent not in evidence_ids:
+                parents.append(parent)
+                inhibitors.append(inhibitor)
+            elif evidence_ids[parent] == 1:
+                leak *= inhibitor
+        return NoisyOr(self.var, parents, inhibitors, self.aux, leak)
+
+    def decompose(self, state=None):
+        """Factors whose product (summed over aux) equals the table of the node, without building the table.
+
+        If var is observed to be 0 the table is a product of one factor per parent.
+        Otherwise P(var | parents) = sum over aux of h(var, aux) * the product of f_k(parent_k, aux), where
+        f_k(parent_k, aux=0) = 1, f_k(parent_k, aux=1) = inhibitor_k^parent_k and h has the rows
+        h(0, aux) = [0, leak], h(1, aux) = [1, -leak] (so the sum gives 1 - leak * product for var=1).
+        The size of the factors is linear in the number of parents.
+
+        Args:
+            state (int): the observed state of var, or None if it is not observed.
+        """
+        if state == 0:
+            factors = [Factor((parent,), (2,), [1, inhibitor]) for parent, inhibitor in zip(self.parents, self.inhibitors)]
+            return factors + [Factor((), (), [self.leak])]
+        factors = [Factor((parent, self.aux), (2, 2), [1, 1, 1, inhibitor])
+                   for parent, inhibitor in zip(self.parents, self.inhibitors)]
+        h = Factor((self.var, self.aux), (2, 2), [0, self.leak, 1, -self.leak])
+        if state is not None:
+            h = h.restrict(self.var, state)
+        return factors + [h]
+
+    def factor(self) -> Factor:
+        """The full table of the node as a Factor over parents + (var,), its size is 2^(parents+1)."""
+        values = np.full([2]*len(self.parents), self.leak)
+        for k, inhibitor in enumerate(self.inhibitors):
+            shape = [1]*len(self.parents)
+            shape[k] = 2
+            values = values * np.array([1, inhibitor]).reshape(shape)
+        return Factor(self.variables, [2]*len(self.variables), np.stack([values, 1-values], axis=-1))
+
+
+def renumbered(cpt, old: int, new: int):
+    #the same table with the id old replaced by new (the values are shared)
+    if cpt is None:
+        return None
+    if isinstance(cpt, NoisyOr):
+        var = new if cpt.var == old else cpt.var
+        parents = [new if parent == old else parent for parent in cpt.parents]
+        return NoisyOr(var, parents, cpt.inhibitors, auxiliary_id(var), cpt.leak)
+    return Factor([new if v == old else v for v in cpt.variables], cpt.cardinality, cpt.values)
+
+
+#the attributes of a CompiledNetwork that describe its variables and their parents
+STRUCTURE = ("names", "states", "parents", "cardinality", "index", "state_index", "children", "order")
+
+
+class CompiledNetwork:
+    """The bayes network from create_bayes_network with integer ids instead of names.
+
+    Variable i has the name names[i], the states states[i] (state labels like "mild" or "1")
+    and the conditional table cpts[i], a Factor over parents[i] + (i,) or a NoisyOr.
+    order is a topological order of the variables, it is computed if it is not given.
+    """
+
+    def __init__(self, names, states, parents, cpts, order=None):
+        self.names = list(names)
+        self.states = [tuple(var_states) for var_states in states]
+        self.parents = [tuple(var_parents) for var_parents in parents]
+        self.cpts = list(cpts)
+        self.cardinality = np.array([len(var_states) for var_states in self.states], dtype=np.int64)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        #variables with the same states share one (read only) lookup table
+        lookups = {}
+        for var_states in self.states:
+            if var_states not in lookups:
+                lookups[var_states] = {state: j for j, state in enumerate(var_states)}
+        self.state_index = [lookups[var_states] for var_states in self.states]
+        self.children = [[] for _ in self.names]
+        for var, var_parents in enumerate(self.parents):
+            for parent in var_parents:
+                self.children[parent].append(var)
+        self.order = self.topological_order() if order is None else list(order)
+        #things derived from the network by other modules (like its layout), computed once per compiled network
+        self.annotations = {}
+        #the attributes shared with another compiled network (see detached), they are copied before they are changed
+        self.shared = set()
+
+    def __len__(self):
+        return len(self.names)
+
+    def with_tables(self, cpts):
+        """A network with the same variables and parents and other conditional tables (the structure is shared, not copied)."""
+        compiled = copy.copy(self)
+        compiled.cpts = list(cpts)
+        compiled.shared = set(STRUCTURE)
+        compiled.annotations = {}
+        return compiled
+
+    def detached(self):
+        """A copy that can be changed (add_variable, set_table, remove_variable) without changing this network.
+
+        The copy shares the lists of this network until it changes one of them, then it copies that list first,
+        so an edit of a few variables does not copy the whole network.
+        """
+        compiled = copy.copy(self)
+        compiled.shared = set(STRUCTURE) | {"cpts"}
+        compiled.annotations = {}
+        return compiled
+
+    def writable(self, *attributes):
+        #copy the lists that are still shared with the network this one was detached from
+        for attribute in attributes:
+            if attribute in self.shared:
+                setattr(self, attribute, copy.copy(getattr(self, attribute)))
+                self.shared.discard(attribute)
+
+    def add_variable(self, name: str, states) -> int:
+        """Add a variable without parents (and without a table, see set_table) at the end of the order, returns its id."""
+        self.writable(*STRUCTURE, "cpts")
+        var = len(self.names)
+        self.names.append(name)
+        self.states.append(tuple(states))
+        self.parents.append(())
+        self.cpts.append(None)
+        self.cardinality = np.append(self.cardinality, len(self.states[var]))
+        self.index[name] = var
+        self.state_index.append({state: j for j, state in enumerate(self.states[var])})
+        self.children.append([])
+        self.order.append(var)
+        return var
+
+    def set_table(self, var: int, parents, cpt):
+        """Replace the parents and the conditional table of var, the children and the topological order follow."""
+        self.writable("cpts")
+        old = self.parents[var]
+        if tuple(parents) != old:
+            self.writable("parents", "children", "order")
+        for parent in old:
+            if parent not in parents:
+                self.children[parent] = [child for child in self.children[parent] if child != var]
+        added = [parent for parent in parents if parent not in old]
+        for parent in added:
+            self.children[parent] = self.children[parent] + [var]
+        self.parents[var] = tuple(parents)
+        self.cpts[var] = cpt
+        if len(added) == 0:
+            return
+        if len(self.children[var]) == 0:
+            #a leaf can always move to the end of the order
+            self.order.remove(var)
+            self.order.append(var)
+        elif max(self.order.index(parent) for parent in added) > self.order.index(var):
+            self.order = self.topological_order()
+
+    def remove_variable(self, var: int):
+        """Remove a variable without children, the last variable takes over its id."""
+        if len(self.children[var]) > 0:
+            raise ValueError(self.names[var]+" still has children, they have to be removed or changed first")
+        self.writable(*STRUCTURE, "cpts")
+        self.set_table(var, (), None)
+        self.order.remove(var)
+        last = len(self.names) - 1
+        del self.index[self.names[var]]
+        if var != last:
+            name = self.names[last]
+            self.names[var], self.states[var], self.state_index[var] = name, self.states[last], self.state_index[last]
+            self.cardinality[var] = self.cardinality[last]
+            self.index[name] = var
+            self.parents[var], self.children[var] = self.parents[last], self.children[last]
+            self.cpts[var] = renumbered(self.cpts[last], last, var)
+            for parent in self.parents[var]:
+                self.children[parent] = [var if child == last else child for child in self.children[parent]]
+            for child in self.children[var]:
+                self.parents[child] = tuple(var if parent == last else parent for parent in self.parents[child])
+                self.cpts[child] = renumbered(self.cpts[child], last, var)
+            self.order[self.order.index(last)] = var
+        for values in (self.names, self.states, self.state_index, self.parents, self.children, self.cpts):
+            values.pop()
+        self.cardinality = self.cardinality[:-1]
+
+    def topological_order(self):
+        order = []
+        visited = set()
+        for var in range(len(self.names)):
+            stack = [(var, False)]
+            while stack:
+                current, expanded = stack.pop()
+                if expanded:
+                    order.append(current)
+                elif current not in visited:
+                    visited.add(current)
+                    stack.append((current, True))
+                    stack.extend((parent, False) for parent in self.parents[current] if parent not in visited)
+        return order
+
+    def probability(self, var: int, assignment):
+        """P(var = assignment[var] | the states of its parents in assignment)."""
+        cpt = self.cpts[var]
+        if isinstance(cpt, NoisyOr):
+            return cpt.probability(assignment)
+        #offset of the row in the flat table, var is the last variable of its table so its stride is 1
+        row = 0
+        for i, parent in enumerate(self.parents[var]):
+            row += assignment[parent] * cpt.strides[i]
+        return float(cpt.values[row + assignment[var]])
+
+    def evidence_ids(self, evidence: dict):
+        '''
+        input:
+        evidence: a dictionary of strings, for example {"Ev(1)": "1", "W": "mild"}
+        output:
+        the same evidence as a dictionary of variable id -> state index
+        '''
+        ids = {}
+        for name, state in evidence.items():
+            var = self.index[name]
+            if state not in self.state_index[var]:
+                raise ValueError("unknown state "+str(state)+" of "+name+", expected one of "+str(self.states[var]))
+            ids[var] = self.state_index[var][state]
+        return ids
+
+    def distribution(self, query, factor: Factor):
+        '''
+        input:
+        query: a list of variable names
+        factor: a factor over the ids of the query variables
+        output:
+        the normalized factor in the format of enumeration_ask, for example {"['B(1)=0']": 0.6, "['B(1)=1']": 0.4}.
+        raises ValueError if the factor sums to 0 (the evidence has probability 0)
+        '''
+        ids = [self.index[q] for q in query]
+        table = factor.expand(ids, self.cardinality[ids]) if len(ids) else factor.table()
+        #the noisy-OR decomposition uses negative values, so a zero can come back as a tiny negative number
+        table = np.maximum(np.broadcast_to(table, tuple(self.cardinality[ids])), 0)
+        total = table.sum()
+        if total <= 0:
+            raise ValueError("the evidence has probability 0")
+        return {key: float(value / total) for key, value in zip(self.keys(query), table.reshape(-1))}
+
+    def keys(self, query):
+        """The keys of the joint states of the query variables in the format of enumeration_ask, last variable fastest."""
+        ids = [self.index[q] for q in query]
+        keys = []
+        for assignment in product(*[range(self.cardinality[var]) for var in ids]):
+            keys.append(str([self.names[var]+"="+self.states[var][state] for var, state in zip(ids, assignment)]))
+        return keys
+
+
+def variable_states(bayes_network, var: str):
+    '''
+    input:
+    var: a node of the bayes network
+    output:
+    the states of the variable, in the same order enumeration_ask lists them
+    (W: mild, stormy, extreme. B and Ev: 0, 1)
+    '''
+    states = []
+    for key in bayes_network.nodes[var]["probabilities"]:
+        #keys are either a state ("mild") or in the format "B(1)=1"
+        states.append(key.split('=')[1] if '=' in key else key)
+    if all(state.isdigit() for state in states):
+        states.sort()
+    return states
+
+
+def parent_key(var: str, parents, assignment):
+    '''build the key of the conditional table of var, the same way create_bayes_network does:
+    for B nodes the key is the weather state ("mild"), for Ev nodes it is in the format "B(1)='0', B(2)='1"'
+    '''
+    if var.startswith("Ev"):
+        return ", ".join(parent+"='"+state+"'" for parent, state in zip(parents, assignment))
+    return ", ".join(assignment)
+
+
+def network_revision(bayes_network):
+    """A value that changes whenever a table or the structure of the network changes.
+
+    create_bayes_network keeps bayes_network.graph["revision"] up to date (its tables bump it when they
+    are changed), the number of nodes and edges cover nodes and edges added or removed. A network that
+    bumps the revision for those too (tracks_structure, see bayes.BayesNetwork) is not counted, counting
+    the edges of a large network takes longer than an edit of it.
+    """
+    if getattr(bayes_network, "tracks_structure", False):
+        return (bayes_network.graph.get("revision", 0),)
+    return (bayes_network.graph.get("revision", 0), bayes_network.number_of_nodes(), bayes_network.number_of_edges())
+
+
+def compile_table(bayes_network, name: str, index: dict, states):
+    '''
+    input:
+    name: a node of the bayes network
+    index: variable name -> id
+    states: the states of every variable id (see variable_states)
+    output:
+    (parents, cpt): the ids of the parents of the node and its conditional table, a Factor or a NoisyOr
+    '''
+    var = index[name]
+    if "inhibitors" in bayes_network.nodes[name]:
+        #noisy-OR nodes keep only their inhibitors
+        inhibitors = bayes_network.nodes[name]["inhibitors"]
+        var_parents = [index[parent] for parent in inhibitors]
+        return var_parents, NoisyOr(var, var_parents, list(inhibitors.values()), auxiliary_id(var))
+    var_parents = list(bayes_network.predecessors(name))
+    probabilities = bayes_network.nodes[name]["probabilities"]
+    variables = [index[parent] for parent in var_parents] + [var]
+    cardinality = [len(states[v]) for v in variables]
+    values = np.zeros(cardinality)
+    for state, label in enumerate(states[var]):
+        key = label if label in probabilities else name+"="+label
+        if len(var_parents) == 0:
+            values[state] = probabilities[key]
+            continue
+        #the only place where the parent strings are built, once per table row
+        for assignment in product(*[range(len(states[index[parent]])) for parent in var_parents]):
+            labels = [states[index[parent]][i] for parent, i in zip(var_parents, assignment)]
+            values[assignment + (state,)] = probabilities[key][parent_key(name, var_parents, labels)]
+    return variables[:-1], Factor(variables, cardinality, values)
+
+
+def compile_network(bayes_network) -> CompiledNetwork:
+    """Compile the string keyed tables of a network created by create_bayes_network into factors.
+
+    The compiled network is kept in bayes_network.graph["compiled"] and reused by the next calls,
+    as long as the network_revision of the network did not change since it was compiled.
+
+    Args:
+        bayes_network (DiGraph): a bayes network created by create_bayes_network.
+
+    Returns:
+        CompiledNetwork: the network with integer variable ids and flat conditional tables.
+    """
+    revision = network_revision(bayes_network)
+    cached = bayes_network.graph.get("compiled")
+    if cached is not None and cached[0] == revision:
+        return cached[1]
+
+    names = list(bayes_network.nodes)
+    index = {name: i for i, name in enumerate(names)}
+    states = [variable_states(bayes_network, name) for name in names]
+    parents = []
+    cpts = []
+    for name in names:
+        var_parents, cpt = compile_table(bayes_network, name, index, states)
+        parents.append(var_parents)
+        cpts.append(cpt)
+
+    compiled = CompiledNetwork(names, states, parents, cpts)
+    bayes_network.graph["compiled"] = (revision, compiled)
+    return compiled
+
+
+def update_compiled(bayes_network, before, after, changed, removed=()):
+    '''
+    input:
+    bayes_network: a network created by create_bayes_network right after an edit
+    before, after: the network_revision of the network before and after the edit
+    changed: the names of the nodes that were added or whose table or parents changed (their states stay the same)
+    removed: the names of the nodes that were removed
+    output:
+    the compiled network of the edited network, or None if the network was not compiled at before (compile_network
+    then compiles it when it is needed). only the tables of changed are compiled, the rest of the compiled network
+    is shared with the old one, which is left as it was for whoever still uses it.
+    '''
+    cached = bayes_network.graph.get("compiled")
+    if cached is None or cached[0] != before:
+        return None
+    compiled = cached[1].detached()
+    changed = [name for name in changed if name not in removed]
+    #the changed children of a removed node let go of it first
+    for name in removed:
+        var = compiled.index[name]
+        for child in compiled.children[var]:
+            if compiled.names[child] in changed:
+                compiled.set_table(child, [parent for parent in compiled.parents[child] if parent != var], compiled.cpts[child])
+    pending = list(removed)
+    while pending:
+        leaves = [name for name in pending if len(compiled.children[compiled.index[name]]) == 0]
+        if len(leaves) == 0:
+            raise ValueError("the children of the removed nodes "+str(pending)+" have to be removed or changed too")
+        for name in leaves:
+            compiled.remove_variable(compiled.index[name])
+            pending.remove(name)
+    for name in changed:
+        if name not in compiled.index:
+            compiled.add_variable(name, variable_states(bayes_network, name))
+    for name in changed:
+        var_parents, cpt = compile_table(bayes_network, name, compiled.index, compiled.states)
+        compiled.set_table(compiled.index[name], var_parents, cpt)
+    bayes_network.graph["compiled"] = (after, compiled)
+    return compiled
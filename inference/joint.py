@@ -0,0 +1,122 @@
+from itertools import product
+
+import numpy as np
+
+from .elimination import MAX_FACTOR_ENTRIES, query_factor
+from .factors import compile_network
+from .stats import instrument, phase
+
+
+#a joint table above this many entries (8 bytes each) is refused instead of filling the memory
+MAX_JOINT_ENTRIES = 2**27
+
+
+class JointTable:
+    """The joint distribution of some variables as a dense table.
+
+    Unlike the dictionaries of enumeration_ask there is no string per joint state: the probabilities are one
+    numpy array with an axis per variable, and a state is only turned into labels when it is asked for.
+
+    Args:
+        variables (list): the names of the variables, in the order of the axes.
+        states (list): the state labels of every variable, in the order of its axis.
+        table (array): table[i, j, ...] is the probability of the i'th state of the first variable,
+            the j'th state of the second one, and so on.
+    """
+
+    def __init__(self, variables, states, table):
+        self.variables = list(variables)
+        self.states = [tuple(var_states) for var_states in states]
+        self.table = np.asarray(table, dtype=np.float64)
+
+    def __repr__(self):
+        return "JointTable(variables="+str(self.variables)+", shape="+str(self.table.shape)+")"
+
+    def __len__(self):
+        return self.table.size
+
+    def axis(self, var: str) -> int:
+        return self.variables.index(var)
+
+    def probability(self, assignment: dict) -> float:
+        '''
+        input:
+        assignment: a dictionary of variable -> state label, for example {"W": "mild", "B(2)": "1"}.
+        the variables that are not in it are summed out
+        output:
+        the probability of the assignment
+        '''
+        index = tuple(self.states[i].index(assignment[var]) if var in assignment else slice(None)
+                      for i, var in enumerate(self.variables))
+        return float(self.table[index].sum())
+
+    def marginal(self, variables):
+        """The JointTable of some of the variables, the others summed out."""
+        axes = [self.axis(var) for var in variables]
+        others = tuple(i for i in range(len(self.variables)) if i not in axes)
+        table = self.table.sum(axis=others)
+        #the remaining axes are in the order of self.variables, move them to the order asked for
+        kept = sorted(axes)
+        table = np.transpose(table, [kept.index(axis) for axis in axes])
+        return JointTable(variables, [self.states[axis] for axis in axes], table)
+
+    def state(self, index: int):
+        """The joint state at a flat index of the table (last variable fastest), as a list like ["W=mild", "B(2)=0"]."""
+        indices = np.unravel_index(index, self.table.shape)
+        return [var+"="+self.states[i][int(j)] for i, (var, j) in enumerate(zip(self.variables, indices))]
+
+    def items(self):
+        #a generator of (state, probability) pairs, the states are built one at a time
+        labels = [[var+"="+state for state in var_states] for var, var_states in zip(self.variables, self.states)]
+        for state, value in zip(product(*labels), self.table.reshape(-1)):
+            yield list(state), float(value)
+
+    def most_probable(self, k: int = 1):
+        """The k most probable joint states, as a list of (state, probability) from the most probable one."""
+        flat = self.table.reshape(-1)
+        k = min(k, flat.size)
+        top = np.argpartition(-flat, k-1)[:k] if k > 0 else np.zeros(0, dtype=np.int64)
+        top = top[np.argsort(-flat[top], kind="stable")]
+        return [(self.state(int(index)), float(flat[index])) for index in top]
+
+    def to_dict(self):
+        """The distribution in the format of enumeration_ask, for example {"['W=mild', 'B(2)=0']": 0.3, ...}."""
+        return {str(state): value for state, value in self.items()}
+
+
+def joint_ask(query, evidence, bayes_network, max_entries: int = MAX_JOINT_ENTRIES, stats=None, trace=None,
+              max_factor_entries: int = MAX_FACTOR_ENTRIES):
+    '''
+    input:
+    query: a list of strings, the query variables, any mix like ["W", "B(2)", "Ev(3)"]
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    max_entries: the largest joint table that is built, a bigger query raises ValueError
+    stats, trace: instrumentation, as in variable_elimination_ask
+    max_factor_entries: the memory budget of the elimination (see sum_product), MemoryBudgetExceeded is raised
+    if it does not fit even with conditioning
+    output:
+    the JointTable of the query variables given the evidence, computed by variable elimination
+    (or in closed form over W, see factorized_joint). raises ValueError if the evidence has probability 0
+    '''
+    stats = instrument(stats, trace)
+    with phase(stats, "compile"):
+        compiled = compile_network(bayes_network)
+        query_ids = [compiled.index[q] for q in query]
+        evidence_ids = compiled.evidence_ids(evidence)
+    if len(set(query_ids)) != len(query_ids):
+        raise ValueError("a variable appears more than once in the query "+str(query))
+    cardinality = compiled.cardinality[query_ids]
+    entries = int(np.prod(cardinality, dtype=np.float64))
+    if entries > max_entries:
+        raise ValueError("the joint table of "+str(len(query))+" variables has "+str(entries)+" entries, more than "
+                         + str(max_entries)+" (ask for fewer variables or for their marginals)")
+    joint = query_factor(compiled, query_ids, evidence_ids, stats, max_entries=max_factor_entries)
+    with phase(stats, "normalize"):
+        table = joint.expand(query_ids, cardinality) if len(query_ids) else joint.table()
+        #the noisy-OR decomposition uses negative values, so a zero can come back as a tiny negative number
+        table = np.maximum(np.broadcast_to(table, tuple(cardinality)), 0)
+        total = table.sum()
+        if total <= 0:
+            raise ValueError("the evidence has probability 0")
+    return JointTable(query, [compiled.states[var] for var in query_ids], table / total)
@@ -0,0 +1,311 @@
+import copy
+import warnings
+
+import numpy as np
+
+from .elimination import MAX_FACTOR_ENTRIES, MemoryBudgetExceeded, check_budget, elimination_order, interaction_graph, variable_elimination_ask
+from .factorized import factorized_posterior
+from .factors import Factor, NoisyOr, compile_network, multiply_all
+from .stats import instrument, phase
+
+
+class JunctionTree:
+    """A clique tree of a compiled network, calibrated with Shafer-Shenoy message passing.
+
+    The cliques are the ones created by eliminating the variables in a min-fill order: clique i holds
+    the eliminated variable and its neighbours at that point, and its parent is the clique of the first
+    variable of its separator to be eliminated after it. Every CPT (noisy-OR nodes by their decomposition)
+    is assigned to one clique. Evidence is not absorbed into the CPTs, it is a likelihood vector
+    per variable multiplied into the clique that eliminates the variable, so the tree never changes.
+
+    Args:
+        compiled (CompiledNetwork): the network to build the tree for.
+        max_entries (int): the memory budget, MemoryBudgetExceeded is raised before any potential is built
+            if a clique has more joint states than this.
+    """
+
+    def __init__(self, compiled, max_entries: int = MAX_FACTOR_ENTRIES):
+        self.compiled = compiled
+        factors = []
+        for cpt in compiled.cpts:
+            factors.extend(cpt.decompose() if isinstance(cpt, NoisyOr) else [cpt])
+        self.cardinality = {}
+        for factor in factors:
+            for var, card in zip(factor.variables, factor.cardinality):
+                self.cardinality[var] = int(card)
+
+        order = elimination_order(factors, list(self.cardinality))
+        position = {var: i for i, var in enumerate(order)}
+        #simulate the elimination to get the cliques
+        neighbours = interaction_graph(factors)
+        self.cliques = []
+        for var in order:
+            adjacent = neighbours.pop(var, set())
+            for neighbour in adjacent:
+                neighbours[neighbour].discard(var)
+                neighbours[neighbour].update(adjacent - {neighbour})
+            self.cliques.append((var,) + tuple(sorted(adjacent, key=position.get)))
+        #the number of states of the largest clique, the size of the largest belief
+        self.largest = max((int(np.prod([self.cardinality[v] for v in clique], dtype=np.float64)) for clique in self.cliques), default=1)
+        check_budget(self.largest, max_entries, "the junction tree")
+        self.parent = []
+        self.children = [[] for _ in self.cliques]
+        for i, clique in enumerate(self.cliques):
+            separator = clique[1:]
+            parent = position[separator[0]] if len(separator) else None
+            self.parent.append(parent)
+            if parent is not None:
+                self.children[parent].append(i)
+
+        #every factor goes to the clique of its first eliminated variable, it contains the whole scope
+        self.factors = [[] for _ in self.cliques]
+        for factor in factors:
+            if len(factor.variables):
+                self.factors[min(position[var] for var in factor.variables)].append(factor)
+        self.home = position
+        self.potentials = [multiply_all(clique_factors) for clique_factors in self.factors]
+        self.likelihood = {}
+        self.messages = {}
+
+    def neighbours(self, clique: int):
+        if self.parent[clique] is None:
+            return self.children[clique]
+        return self.children[clique] + [self.parent[clique]]
+
+    def copy(self):
+        """A tree with the same structure and CPTs (shared, they never change) and its own evidence and messages."""
+        tree = copy.copy(self)
+        tree.likelihood = dict(self.likelihood)
+        tree.messages = dict(self.messages)
+        return tree
+
+    def invalidate(self, clique: int):
+        """Drop the messages that depend on the potential of clique, the ones directed away from it.
+
+        If a message is missing, all the messages after it (further away from clique) are missing too,
+        so the walk stops there and the cost is proportional to the number of messages dropped.
+        """
+        stack = [(clique, k) for k in self.neighbours(clique)]
+        while stack:
+            source, target = stack.pop()
+            if self.messages.pop((source, target), None) is None:
+                continue
+            stack.extend((target, k) for k in self.neighbours(target) if k != source)
+
+    def observe(self, var: int, state: int):
+        values = np.zeros(self.cardinality[var])
+        values[state] = 1
+        if var in self.likelihood and np.array_equal(self.likelihood[var].values, values):
+            return
+        self.likelihood[var] = Factor((var,), (self.cardinality[var],), values)
+        self.invalidate(self.home[var])
+
+    def retract(self, var: int):
+        if self.likelihood.pop(var, None) is not None:
+            self.invalidate(self.home[var])
+
+    def set_evidence(self, evidence_ids: dict):
+        """Replace the evidence, a dictionary of variable id -> observed state index.
+
+        Only the variables whose evidence changed invalidate messages, so calling it again with
+        almost the same evidence keeps most of the calibration.
+        """
+        for var in list(self.likelihood):
+            if var not in evidence_ids:
+                self.retract(var)
+        for var, state in evidence_ids.items():
+            self.observe(var, state)
+
+    def potential(self, clique: int):
+        #the CPTs of the clique times the likelihood of the variable it eliminates
+        var = self.cliques[clique][0]
+        if var in self.likelihood:
+            return self.potentials[clique].multiply(self.likelihood[var])
+        return self.potentials[clique]
+
+    def message(self, source: int, target: int, stats=None):
+        """The message from source to target (computed once and kept until evidence behind it changes).
+
+        Args:
+            stats (InferenceStats): counts the factor operations of the messages computed.
+        """
+        if (source, target) not in self.messages:
+            #the tree can be deep, so the messages source depends on are computed first, bottom up
+            stack = [(source, target, False)]
+            while stack:
+                i, j, ready = stack.pop()
+                if (i, j) in self.messages:
+                    continue
+                incoming = [k for k in self.neighbours(i) if k != j]
+                if not ready:
+                    stack.append((i, j, True))
+                    stack.extend((k, i, False) for k in incoming if (k, i) not in self.messages)
+                    continue
+                belief = multiply_all([self.potential(i)] + [self.messages[(k, i)] for k in incoming])
+                if stats is not None:
+                    stats.factor_products += len(incoming) + 1
+                    stats.factor(belief)
+                separator = set(self.cliques[i]) & set(self.cliques[j])
+                for var in belief.variables:
+                    if var not in separator:
+                        belief = belief.sum_out(var)
+                        if stats is not None:
+                            stats.factor_sums += 1
+                self.messages[(i, j)] = belief
+        return self.messages[(source, target)]
+
+    def calibrate(self, stats=None):
+        """Compute all the messages: one pass towards the roots and one pass back."""
+        for i in range(len(self.cliques)):
+            if self.parent[i] is not None:
+                self.message(i, self.parent[i], stats)
+        for i in range(len(self.cliques)-1, -1, -1):
+            for child in self.children[i]:
+                self.message(i, child, stats)
+
+    def belief(self, clique: int):
+        return multiply_all([self.potential(clique)] + [self.message(k, clique) for k in self.neighbours(clique)])
+
+    def marginal(self, var: int):
+        """The normalized marginal of a variable given the evidence, ValueError if the evidence has probability 0."""
+        belief = self.belief(self.home[var])
+        for other in belief.variables:
+            if other != var:
+                belief = belief.sum_out(other)
+        #the noisy-OR decomposition uses negative values, so a zero can come back as a tiny negative number
+        values = np.maximum(belief.values, 0)
+        total = values.sum()
+        if total <= 0:
+            raise ValueError("the evidence has probability 0")
+        return values / total
+
+
+def junction_tree(bayes_network, max_entries: int = MAX_FACTOR_ENTRIES) -> JunctionTree:
+    """The junction tree of a network created by create_bayes_network.
+
+    Like the compiled network, it is kept in bayes_network.graph["junction_tree"] and reused
+    as long as the network_revision of the network did not change. Raises MemoryBudgetExceeded
+    if a clique has more than max_entries states, also when the tree is cached.
+    """
+    compiled = compile_network(bayes_network)
+    cached = bayes_network.graph.get("junction_tree")
+    if cached is not None and cached.compiled is compiled:
+        check_budget(cached.largest, max_entries, "the junction tree")
+        return cached
+    tree = JunctionTree(compiled, max_entries)
+    bayes_network.graph["junction_tree"] = tree
+    return tree
+
+
+def posterior_marginals(evidence, bayes_network, variables=None, stats=None, trace=None, max_entries: int = MAX_FACTOR_ENTRIES):
+    '''
+    input:
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    variables: a list of the variables to return, all the variables of the network if None
+    stats: an InferenceStats to fill with the counters and timings of the query
+    trace: a callback trace(event, details), see InferenceStats
+    max_entries: the memory budget, see variable_elimination_ask
+    output:
+    a dictionary of variable -> its distribution given the evidence, in the same format as enumeration_ask,
+    for example {"B(1)": {"['B(1)=0']": 0.6, "['B(1)=1']": 0.4}, ...}.
+    all the marginals come from one pass: the closed form over W of factorized_posterior,
+    or one calibration of the junction tree if the network does not have that layout.
+    if a clique of the tree does not fit max_entries, a RuntimeWarning is issued and every marginal is
+    computed on its own by variable_elimination_ask, which conditions within the budget.
+    raises ValueError if the evidence has probability 0
+    '''
+    stats = instrument(stats, trace)
+    with phase(stats, "compile"):
+        compiled = compile_network(bayes_network)
+        if variables is None:
+            variables = compiled.names
+        evidence_ids = compiled.evidence_ids(evidence)
+    #networks with the W -> B -> Ev layout are answered in closed form over W when possible
+    with phase(stats, "factorized"):
+        engine = factorized_posterior(compiled, evidence_ids)
+    if engine is None:
+        with phase(stats, "tree"):
+            try:
+                engine = junction_tree(bayes_network, max_entries)
+            except MemoryBudgetExceeded as error:
+                warnings.warn(str(error)+", the marginals are computed one at a time by variable elimination", RuntimeWarning)
+                return {name: variable_elimination_ask([name], evidence, bayes_network, stats, max_entries=max_entries)
+                        for name in variables}
+            engine.set_evidence(evidence_ids)
+        with phase(stats, "calibrate"):
+            engine.calibrate(stats)
+        if stats is not None:
+            stats.width = max(stats.width, max((len(clique) for clique in engine.cliques), default=0))
+    if stats is not None:
+        stats.engine = "junction_tree" if isinstance(engine, JunctionTree) else "factorized"
+
+    marginals = {}
+    with phase(stats, "normalize"):
+        for name in variables:
+            var = compiled.index[name]
+            values = engine.marginal(var)
+            marginals[name] = {str([name+"="+state]): float(p) for state, p in zip(compiled.states[var], values)}
+    return marginals
+
+
+class InferenceSession:
+    """Answers queries about a network while the evidence changes one observation at a time.
+
+    The session keeps its own copy of the junction tree of the network. Adding or retracting an
+    observation only drops the messages that depend on it, and the next query recomputes only the
+    messages it needs, so a new report costs a fraction of a full calibration.
+
+    Args:
+        bayes_network (DiGraph): a bayes network created by create_bayes_network. Raises MemoryBudgetExceeded
+            if its junction tree has a clique above MAX_FACTOR_ENTRIES states.
+        evidence (dict): the initial evidence, for example {"Ev(1)": "1", "W": "mild"}.
+
+    Example:
+        session = InferenceSession(bayes_network)
+        session.observe("B(3)", 1)
+        session.marginal("W")
+        session.retract("B(3)")
+    """
+
+    def __init__(self, bayes_network, evidence=None):
+        self.bayes_network = bayes_network
+        self.evidence = {}
+        self.tree = junction_tree(bayes_network).copy()
+        self.tree.set_evidence({})
+        for name, state in (evidence or {}).items():
+            self.observe(name, state)
+
+    def _sync(self):
+        #if the tables of the network changed since the tree was built, start over with the same evidence
+        if compile_network(self.bayes_network) is not self.tree.compiled:
+            self.tree = junction_tree(self.bayes_network).copy()
+            self.tree.set_evidence(self.tree.compiled.evidence_ids(self.evidence))
+        return self.tree
+
+    def observe(self, name: str, state):
+        """Add or change the observation of a variable, state is a state label like "mild", "1" or 1."""
+        tree = self._sync()
+        state = str(state)
+        for var, index in tree.compiled.evidence_ids({name: state}).items():
+            tree.observe(var, index)
+        self.evidence[name] = state
+
+    def retract(self, name: str):
+        """Remove the observation of a variable."""
+        tree = self._sync()
+        tree.retract(tree.compiled.index[name])
+        self.evidence.pop(name, None)
+
+    def marginal(self, name: str):
+        """The distribution of a variable given the current evidence, in the format of enumeration_ask."""
+        tree = self._sync()
+        var = tree.compiled.index[name]
+        values = tree.marginal(var)
+        return {str([name+"="+state]): float(p) for state, p in zip(tree.compiled.states[var], values)}
+
+    def marginals(self, variables=None):
+        """The distributions of the variables (all of them if None), like posterior_marginals."""
+        if variables is None:
+            variables = self._sync().compiled.names
+        return {name: self.marginal(name) for name in variables}
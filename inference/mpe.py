@@ -0,0 +1,263 @@
+import heapq
+import math
+
+import numpy as np
+
+from .elimination import (MAX_FACTOR_ENTRIES, check_budget, eliminate, elimination_order, evidence_factors, evidence_probability,
+                          largest_product)
+from .factors import Factor, compile_network, multiply_all
+from .relevance import relevant_network
+from .stats import instrument, phase
+
+
+class MapProblem:
+    """A MAP query solved by max-product: argmax over the query variables of P(query | evidence).
+
+    The other variables are summed out first (a MAP query has to sum before it maximizes, so the elimination
+    order is constrained), this includes the auxiliary variables of the noisy-OR decompositions and leaves
+    nonnegative factors over the query variables. Then the query variables are maximized out one by one in an
+    elimination order, keeping the product of every step for the traceback, which assigns them in reverse order.
+
+    When every hidden variable is a barren leaf or a noisy-OR auxiliary variable (like W and the B variables of
+    mpe_ask) the cost is the cost of variable elimination. A hidden variable with query variables on several
+    sides (summing W out of a query over the B variables) joins them into one factor, which is what makes
+    MAP harder than marginals in general.
+
+    Args:
+        compiled (CompiledNetwork): the network.
+        query_ids (list): ids of the query variables.
+        evidence_ids (dict): variable id -> observed state index.
+        stats (InferenceStats): filled with the counters and timings, or None.
+        max_entries (int): the memory budget, MemoryBudgetExceeded is raised before the elimination if it
+            would build a factor above it (the maximization can't be conditioned like a sum, see sum_product).
+    """
+
+    def __init__(self, compiled, query_ids, evidence_ids, stats=None, max_entries: int = MAX_FACTOR_ENTRIES):
+        self.compiled = compiled
+        self.query_ids = list(query_ids)
+        with phase(stats, "prune"):
+            variables, evidence_ids = relevant_network(compiled, self.query_ids, evidence_ids)
+        with phase(stats, "order"):
+            factors = evidence_factors(compiled, self.query_ids, evidence_ids, variables)
+            hidden = {var for factor in factors for var in factor.variables if var not in self.query_ids}
+            order = elimination_order(factors, hidden)
+            check_budget(largest_product(factors, order), max_entries, "summing out the hidden variables")
+        with phase(stats, "eliminate"):
+            factors = eliminate(factors, order, stats)
+            #the noisy-OR decomposition uses negative values, so a zero can come back as a tiny negative number.
+            #new factors, the ones left untouched by the elimination are the tables of the compiled network
+            factors = [Factor(factor.variables, factor.cardinality, np.maximum(factor.values, 0)) for factor in factors]
+        with phase(stats, "order"):
+            self.order = elimination_order(factors, self.query_ids)
+            check_budget(largest_product(factors, self.order), max_entries, "maximizing over the query variables")
+        with phase(stats, "eliminate"):
+            #P(evidence), to turn the max-product values into probabilities given the evidence
+            self.evidence_probability = max(float(multiply_all(eliminate(list(factors), self.order)).values[0]), 0.0)
+
+        #max-product, every factor remembers the step it is available from (birth) and the step that uses it (death)
+        with phase(stats, "maximize"):
+            self.factors = list(factors)
+            self.birth = [0] * len(factors)
+            self.death = [len(self.order)] * len(factors)
+            self.products = []
+            alive = list(range(len(factors)))
+            for step, var in enumerate(self.order):
+                related = [i for i in alive if var in self.factors[i].variables]
+                alive = [i for i in alive if var not in self.factors[i].variables]
+                for i in related:
+                    self.death[i] = step
+                product = multiply_all([self.factors[i] for i in related])
+                self.products.append(product)
+                self.factors.append(product.max_out(var))
+                self.birth.append(step + 1)
+                self.death.append(len(self.order))
+                alive.append(len(self.factors) - 1)
+                if stats is not None:
+                    stats.factor_products += len(related)
+                    stats.factor(product)
+            self.value = float(multiply_all([self.factors[i] for i in alive]).values[0])
+
+    def traceback(self, assignment, step: int):
+        '''
+        input:
+        assignment: a dictionary of query variable id -> state index with the variables of the steps after step
+        step: the last step that is not assigned yet
+        output:
+        assignment completed with the best state of the variables of step, step-1, ..., 0 (in that order every
+        other variable of the product of a step is eliminated later, so it is already assigned)
+        '''
+        if step < 0:
+            return assignment
+        for var, product in zip(self.order[step::-1], self.products[step::-1]):
+            index = tuple(slice(None) if v == var else assignment[v] for v in product.variables)
+            assignment[var] = int(np.argmax(product.table()[index]))
+        return assignment
+
+    def rest(self, assignment):
+        '''
+        input:
+        assignment: a state index for every query variable
+        output:
+        (logs, zeros): at every step, the sum of the logs of the positive values at assignment of the factors that are
+        available at the step and not multiplied by it, and the number of those values that are 0
+        '''
+        steps = len(self.order)
+        logs = np.zeros(steps + 1)
+        zeros = np.zeros(steps + 1, dtype=np.int64)
+        for factor, birth, death in zip(self.factors, self.birth, self.death):
+            if birth >= death:
+                continue
+            value = factor.values[factor.index([assignment[var] for var in factor.variables])] if factor.variables else factor.values[0]
+            if value > 0:
+                logs[birth] += math.log(value)
+                logs[death] -= math.log(value)
+            else:
+                zeros[birth] += 1
+                zeros[death] -= 1
+        return np.cumsum(logs)[:steps], np.cumsum(zeros)[:steps]
+
+    def partitions(self, assignment, last: int, allowed):
+        '''
+        input:
+        assignment: the best assignment of a set of assignments: the variables of the steps after last are fixed,
+        the variable of step last can take the states of the mask allowed and the earlier variables are free
+        output:
+        yields (log value, step, state, mask) for the best assignment of every part of the set without assignment:
+        the part of step k fixes the variables of the steps after k to assignment, forbids the state of assignment
+        at step k and leaves the earlier variables free. its best assignment differs from assignment at step k
+        (state) and is completed by the traceback.
+
+        every part only constrains variables that are eliminated after the free ones, so the max-product of the
+        unconstrained problem still holds for them: the best value of a state at step k is the product of step k
+        at the fixed variables times the other factors available at step k.
+        '''
+        logs, zeros = self.rest(assignment)
+        for step in range(last, -1, -1):
+            var = self.order[step]
+            mask = allowed.copy() if step == last else np.ones(self.compiled.cardinality[var], dtype=bool)
+            mask[assignment[var]] = False
+            if not mask.any() or zeros[step] > 0:
+                continue
+            product = self.products[step]
+            index = tuple(slice(None) if v == var else assignment[v] for v in product.variables)
+            row = np.where(mask, product.table()[index], 0)
+            state = int(np.argmax(row))
+            if row[state] > 0:
+                yield logs[step] + math.log(row[state]), step, state, mask
+
+    def explanation(self, assignment, log_value: float):
+        #the assignment with names and state labels, and its probability given the evidence
+        compiled = self.compiled
+        named = {compiled.names[var]: compiled.states[var][assignment[var]] for var in self.query_ids}
+        if self.evidence_probability <= 0:
+            return named, float("nan")
+        return named, math.exp(log_value - math.log(self.evidence_probability))
+
+
+def map_problem(query, evidence, bayes_network, stats=None, max_entries: int = MAX_FACTOR_ENTRIES):
+    with phase(stats, "compile"):
+        compiled = compile_network(bayes_network)
+        query_ids = [compiled.index[q] for q in query]
+        evidence_ids = compiled.evidence_ids(evidence)
+    if stats is not None:
+        stats.engine = "map"
+    return MapProblem(compiled, query_ids, evidence_ids, stats, max_entries)
+
+
+def map_ask(query, evidence, bayes_network, stats=None, trace=None, max_entries: int = MAX_FACTOR_ENTRIES):
+    '''
+    input:
+    query: a list of strings, the variables to explain
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    stats, trace: instrumentation, as in variable_elimination_ask
+    max_entries: the memory budget, MemoryBudgetExceeded is raised if the elimination does not fit it
+    output:
+    (assignment, probability): the most probable joint state of the query variables given the evidence,
+    for example ({"W": "stormy", "B(1)": "1", "B(2)": "0"}, 0.31), and its probability given the evidence.
+    the other variables are summed out. raises ValueError if the evidence has probability 0.
+    an empty query (everything that could be explained is observed) gives ({}, P(evidence))
+    '''
+    stats = instrument(stats, trace)
+    if len(query) == 0:
+        probability = evidence_probability(evidence, bayes_network, stats, max_entries=max_entries)
+        if probability <= 0:
+            raise ValueError("the evidence has probability 0")
+        return {}, probability
+    problem = map_problem(query, evidence, bayes_network, stats, max_entries)
+    if problem.value <= 0:
+        raise ValueError("the evidence has probability 0")
+    with phase(stats, "traceback"):
+        assignment = problem.traceback({}, len(problem.order) - 1)
+    return problem.explanation(assignment, math.log(problem.value))
+
+
+def top_map_ask(query, evidence, bayes_network, k: int, stats=None, trace=None, max_entries: int = MAX_FACTOR_ENTRIES):
+    '''
+    input:
+    query, evidence, bayes_network, max_entries: as in map_ask
+    k: the number of assignments
+    output:
+    the k most probable joint states of the query variables given the evidence (fewer if there are fewer with
+    a probability above 0), as a list of (assignment, probability) from the most probable one.
+
+    Lawler's partitioning (Nilsson's k-best MAP): the best assignment of a set of assignments is taken out by
+    splitting the rest of the set into disjoint parts (see MapProblem.partitions), the best assignment of every
+    part goes into a heap and the next best assignment overall is the best one in the heap. the variables are
+    split in the reverse of the elimination order, so a part never constrains a variable that is eliminated
+    before a free one and one max-product pass answers all of them: every further assignment costs one
+    evaluation of the factors at it and a traceback, instead of a max-product per part.
+    an empty query has the single explanation ({}, P(evidence))
+    '''
+    stats = instrument(stats, trace)
+    if len(query) == 0:
+        probability = evidence_probability(evidence, bayes_network, stats, max_entries=max_entries)
+        return [({}, probability)] if probability > 0 and k > 0 else []
+    problem = map_problem(query, evidence, bayes_network, stats, max_entries)
+    if problem.value <= 0 or k <= 0:
+        return []
+    last = len(problem.order) - 1
+    solutions = []
+    with phase(stats, "traceback"):
+        #(-log value, tie breaker, assignment the part was split from, step, state of step or None for the best one,
+        #mask of the states of step). the rest of the assignment is only traced back when it is taken out
+        heap = [(-math.log(problem.value), 0, {}, last, None, np.ones(problem.compiled.cardinality[problem.order[last]], dtype=bool))]
+        count = 1
+        while heap and len(solutions) < k:
+            log_value, _, base, step, state, allowed = heapq.heappop(heap)
+            assignment = {var: base[var] for var in problem.order[step+1:]}
+            if state is None:
+                assignment = problem.traceback(assignment, step)
+            else:
+                assignment[problem.order[step]] = state
+                assignment = problem.traceback(assignment, step - 1) if step > 0 else assignment
+            solutions.append(problem.explanation(assignment, -log_value))
+            if len(solutions) == k:
+                break
+            for part_log, part_step, part_state, mask in problem.partitions(assignment, step, allowed):
+                heapq.heappush(heap, (-part_log, count, assignment, part_step, part_state, mask))
+                count += 1
+    return solutions
+
+
+def explained_variables(compiled, evidence_ids):
+    #the unobserved variables that have children: W and the B variables of a network from create_bayes_network.
+    #unobserved leaves (Ev reports that were not made) are barren, they do not change the explanation
+    return [compiled.names[var] for var in compiled.order if var not in evidence_ids and len(compiled.children[var]) > 0]
+
+
+def mpe_ask(evidence, bayes_network, k: int = 1, stats=None, trace=None, max_entries: int = MAX_FACTOR_ENTRIES):
+    '''
+    input:
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    k: the number of explanations
+    stats, trace, max_entries: as in map_ask
+    output:
+    the k most probable explanations of the evidence (see top_map_ask): joint states of the weather and every
+    blockage variable that is not observed. the reports that were not made are summed out, so the cost is the
+    cost of variable elimination on the network.
+    '''
+    compiled = compile_network(bayes_network)
+    query = explained_variables(compiled, compiled.evidence_ids(evidence))
+    return top_map_ask(query, evidence, bayes_network, k, stats, trace, max_entries)
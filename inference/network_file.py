@@ -0,0 +1,277 @@
+import json
+import struct
+import sys
+
+import numpy as np
+
+from .factors import CompiledNetwork, Factor, NoisyOr, auxiliary_id, compile_network, network_revision
+from .parser import parse_stream
+
+
+#first bytes of a network file, followed by the format version and the length of the json header
+MAGIC = b"BAYESNET"
+#version of the layout written by save_network, load_network refuses files of other versions
+FORMAT_VERSION = 1
+#every array starts at a multiple of this many bytes, so the memory mapped views are aligned
+ALIGNMENT = 64
+#the weather states in the order of create_bayes_network and their factor in P(B(i)=1 | W=w) = factor * x(i)
+WEATHER_SCALE = {"mild": 1, "stormy": 2, "extreme": 3}
+
+
+def road_parents(vertices, edges, own):
+    '''
+    input:
+    vertices, edges: the arrays of parse_stream
+    own: own[i] is True if B(i) is a parent of Ev(i) (create_bayes_network only adds it if x(i) > 0)
+    output:
+    (indptr, parent_ids, weights): the parents of the i'th Ev node are parent_ids[indptr[i]:indptr[i+1]], in the order
+    create_bayes_network adds them: B(i) first, then the neighbours in the order their first edge appears in the file.
+    weights[k] is the weight of the edge to parent k, nan for B(i) itself (its inhibitor is p2).
+    the parents of all the nodes are built at once with numpy.
+    '''
+    n = len(vertices)
+    sources = np.searchsorted(vertices, edges[0])
+    targets = np.searchsorted(vertices, edges[1])
+    blockage_id = 1 + np.arange(n)
+
+    #both directions of every edge, an edge given twice keeps its first position and its last weight
+    src = np.concatenate([sources, targets])
+    dst = np.concatenate([targets, sources])
+    weight = np.concatenate([edges[2], edges[2]]).astype(np.float64)
+    position = np.concatenate([np.arange(len(sources)), np.arange(len(sources))])
+    pair = src * n + dst
+    order = np.lexsort((position, pair))
+    pair = pair[order]
+    #without edges there are no pairs, and every node only has its own B(i) as a parent
+    starts = np.flatnonzero(np.r_[True, pair[1:] != pair[:-1]]) if len(pair) else np.zeros(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(pair)] - 1 if len(pair) else starts
+    src, dst = src[order][starts], dst[order][starts]
+    first, weight = position[order][starts], weight[order][ends]
+
+    #a self loop replaces the inhibitor of B(i) itself
+    own_weight = np.full(n, np.nan)
+    loops = src == dst
+    own_weight[src[loops & own[src]]] = weight[loops & own[src]]
+    keep = ~(loops & own[src])
+    src, dst, first, weight = src[keep], dst[keep], first[keep], weight[keep]
+    order = np.lexsort((first, src))
+    src, dst, weight = src[order], dst[order], weight[order]
+
+    counts = own.astype(np.int64) + np.bincount(src, minlength=n)
+    indptr = np.r_[0, np.cumsum(counts)]
+    parent_ids = np.zeros(indptr[-1], dtype=np.int64)
+    weights = np.zeros(indptr[-1])
+    parent_ids[indptr[:-1][own]] = blockage_id[own]
+    weights[indptr[:-1][own]] = own_weight[own]
+    rank = np.arange(len(src)) - np.searchsorted(src, src)
+    slots = indptr[src] + own[src] + rank
+    parent_ids[slots] = blockage_id[dst]
+    weights[slots] = weight
+    return indptr, parent_ids, weights
+
+
+def road_inhibitors(weights, p1: float, p2: float):
+    #p2 for B(i) itself, min(1, p1*w(i,j)) for the other parents
+    with np.errstate(invalid="ignore"):
+        return np.where(np.isnan(weights), p2, np.minimum(1, p1 * weights))
+
+
+def weather_states(weather: dict):
+    #the states of the weather dictionary in the order of create_bayes_network, whatever the order of its keys
+    if set(weather) != set(WEATHER_SCALE):
+        raise ValueError("the weather must give the states "+str(tuple(WEATHER_SCALE))+", got "+str(tuple(weather)))
+    return tuple(WEATHER_SCALE)
+
+
+def blockage_tables(blockage, states):
+    #blocked[i, w, b] = P(B(i)=b | W=w) with P(B(i)=1 | W=w) = WEATHER_SCALE[w] * x(i)
+    scale = np.array([WEATHER_SCALE[state] for state in states], dtype=np.float64)
+    return np.stack([1 - np.outer(blockage, scale), np.outer(blockage, scale)], axis=-1)
+
+
+def compile_road_network(vertices, blockage, edges, weather: dict, p1: float = 0.2, p2: float = 0.3) -> CompiledNetwork:
+    '''
+    input:
+    vertices, blockage, edges, weather: the arrays of parse_stream
+    p1, p2: the noisy-OR parameters of create_bayes_network
+    output:
+    the CompiledNetwork that compile_network(create_bayes_network(...)) gives for the same file,
+    built from the arrays without networkx or string keyed tables (see road_parents).
+    '''
+    n = len(vertices)
+    names = ["W"] + ["B("+str(v)+")" for v in vertices.tolist()] + ["Ev("+str(v)+")" for v in vertices.tolist()]
+    indptr, parent_ids, weights = road_parents(vertices, edges, blockage > 0)
+    inhibitors = road_inhibitors(weights, p1, p2)
+
+    weather_order = weather_states(weather)
+    prior = np.array([weather[state] for state in weather_order], dtype=np.float64)
+    blocked = blockage_tables(blockage, weather_order)
+    states = [weather_order] + [("0", "1")] * (2*n)
+    parents = [()] + [(0,)] * n
+    cpts = [Factor((0,), (len(prior),), prior)]
+    cpts += [Factor((0, 1+i), (len(prior), 2), blocked[i]) for i in range(n)]
+    parent_lists = parent_ids.tolist()
+    bounds = indptr.tolist()
+    for i in range(n):
+        var = 1 + n + i
+        var_parents = parent_lists[bounds[i]:bounds[i+1]]
+        parents.append(var_parents)
+        cpts.append(NoisyOr(var, var_parents, inhibitors[bounds[i]:bounds[i+1]], auxiliary_id(var)))
+    return CompiledNetwork(names, states, parents, cpts)
+
+
+class PrebuiltNetwork:
+    """A compiled network without networkx (from load_network or read_network), usable wherever the inference routines take a network from create_bayes_network.
+
+    It only has what those routines use: the graph dictionary that holds the compiled network and the caches,
+    the number of nodes and edges, and nodes (name -> variable id). Its tables are read only, a changed
+    model is built again with save_network.
+
+    Args:
+        compiled (CompiledNetwork): the network.
+    """
+
+    def __init__(self, compiled: CompiledNetwork):
+        self.graph = {"revision": 0}
+        self.nodes = compiled.index
+        self.edges = sum(len(var_parents) for var_parents in compiled.parents)
+        self.graph["compiled"] = (network_revision(self), compiled)
+
+    def __repr__(self):
+        return "PrebuiltNetwork(nodes="+str(self.number_of_nodes())+", edges="+str(self.number_of_edges())+")"
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return self.edges
+
+
+def network_arrays(compiled: CompiledNetwork):
+    """The compiled network as flat arrays (the parents and the tables in compressed sparse row form) and a json header."""
+    state_sets = []
+    state_set = np.zeros(len(compiled), dtype=np.int32)
+    for var, var_states in enumerate(compiled.states):
+        if list(var_states) not in state_sets:
+            state_sets.append(list(var_states))
+        state_set[var] = state_sets.index(list(var_states))
+    noisy = np.array([isinstance(cpt, NoisyOr) for cpt in compiled.cpts], dtype=np.int8)
+    tables = [cpt.inhibitors if isinstance(cpt, NoisyOr) else cpt.values for cpt in compiled.cpts]
+    arrays = {
+        "names": np.frombuffer("\n".join(compiled.names).encode(), dtype=np.uint8),
+        "state_set": state_set,
+        "parent_indptr": np.r_[0, np.cumsum([len(var_parents) for var_parents in compiled.parents])].astype(np.int64),
+        "parent_ids": np.array([parent for var_parents in compiled.parents for parent in var_parents], dtype=np.int64),
+        "noisy": noisy,
+        "value_indptr": np.r_[0, np.cumsum([len(table) for table in tables])].astype(np.int64),
+        "values": np.concatenate(tables) if tables else np.zeros(0),
+        "leak": np.array([cpt.leak if isinstance(cpt, NoisyOr) else 0.0 for cpt in compiled.cpts]),
+        "aux": np.array([cpt.aux if isinstance(cpt, NoisyOr) else 0 for cpt in compiled.cpts], dtype=np.int64),
+        "order": np.array(compiled.order, dtype=np.int64),
+    }
+    return arrays, {"state_sets": state_sets}
+
+
+def save_network(bayes_network, path: str):
+    '''
+    input:
+    bayes_network: a DiGraph object created by create_bayes_network, a CompiledNetwork or a PrebuiltNetwork
+    path: the file to write
+    output:
+    writes the compiled network in the binary format of load_network:
+    MAGIC, the format version and the length of the header (two little endian uint32), a json header with the
+    dtype, shape and offset of every array, then the arrays, each aligned to ALIGNMENT bytes.
+    '''
+    compiled = bayes_network if isinstance(bayes_network, CompiledNetwork) else compile_network(bayes_network)
+    arrays, header = network_arrays(compiled)
+    header["arrays"] = {}
+    offset = 0
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder("<"))
+        arrays[name] = values
+        header["arrays"][name] = {"dtype": values.dtype.str, "shape": list(values.shape), "offset": offset}
+        offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+    encoded = json.dumps(header).encode()
+    start = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<II", FORMAT_VERSION, len(encoded)) + encoded)
+        for name, values in arrays.items():
+            f.seek(start + header["arrays"][name]["offset"])
+            f.write(values.tobytes())
+        f.truncate(start + offset)
+
+
+def read_header(data):
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError("not a network file (the file does not start with "+str(MAGIC)+")")
+    version, length = struct.unpack("<II", bytes(data[len(MAGIC):len(MAGIC)+8]))
+    if version != FORMAT_VERSION:
+        raise ValueError("network file version "+str(version)+" is not supported, expected "+str(FORMAT_VERSION))
+    header = json.loads(bytes(data[len(MAGIC)+8:len(MAGIC)+8+length]))
+    start = -(-(len(MAGIC) + 8 + length) // ALIGNMENT) * ALIGNMENT
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        begin = start + spec["offset"]
+        arrays[name] = data[begin:begin + count*dtype.itemsize].view(dtype).reshape(spec["shape"])
+    return header, arrays
+
+
+def is_network_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load_network(path: str, mmap: bool = True) -> PrebuiltNetwork:
+    '''
+    input:
+    path: a file written by save_network
+    mmap: map the file into memory instead of reading it, the tables are then views of the file
+    and the pages are only read when inference touches them
+    output:
+    a PrebuiltNetwork, without parsing the input file or building a networkx graph
+    '''
+    #a plain ndarray view of the map, slicing a np.memmap object is much slower
+    data = np.asarray(np.memmap(path, dtype=np.uint8, mode="r")) if mmap else np.fromfile(path, dtype=np.uint8)
+    header, arrays = read_header(data)
+    names = arrays["names"].tobytes().decode().split("\n")
+    state_sets = [tuple(states) for states in header["state_sets"]]
+    states = [state_sets[i] for i in arrays["state_set"].tolist()]
+    parent_ids = arrays["parent_ids"].tolist()
+    parent_bounds = arrays["parent_indptr"].tolist()
+    value_bounds = arrays["value_indptr"].tolist()
+    noisy = arrays["noisy"].tolist()
+    leak = arrays["leak"].tolist()
+    aux = arrays["aux"].tolist()
+    values = arrays["values"]
+    parents = []
+    cpts = []
+    for var in range(len(names)):
+        var_parents = parent_ids[parent_bounds[var]:parent_bounds[var+1]]
+        table = values[value_bounds[var]:value_bounds[var+1]]
+        parents.append(var_parents)
+        if noisy[var]:
+            cpts.append(NoisyOr(var, var_parents, table, aux[var], leak[var]))
+        else:
+            variables = var_parents + [var]
+            cpts.append(Factor(variables, [len(states[v]) for v in variables], table))
+    return PrebuiltNetwork(CompiledNetwork(names, states, parents, cpts, arrays["order"].tolist()))
+
+
+def read_network(path: str) -> PrebuiltNetwork:
+    """The network of a file written by save_network, or of an input file in the #V/#E/#W format, without networkx."""
+    if is_network_file(path):
+        return load_network(path)
+    return PrebuiltNetwork(compile_road_network(*parse_stream(path)))
+
+
+def build_network_file(input_file: str, path: str):
+    """Parse an input file in the #V/#E/#W format and save its network for load_network."""
+    vertices, blockage, edges, weather = parse_stream(input_file)
+    save_network(compile_road_network(vertices, blockage, edges, weather), path)
+
+
+if __name__ == "__main__":
+    #python -m inference.network_file input.txt roads.bnet
+    build_network_file(sys.argv[1], sys.argv[2])
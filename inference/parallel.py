@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+
+from .elimination import variable_elimination_ask
+from .factors import compile_network
+
+
+#the network and the inference routine of a worker process, set once when the worker starts
+worker_network = None
+worker_ask = None
+
+
+def init_worker(bayes_network, ask):
+    global worker_network, worker_ask
+    worker_network = bayes_network
+    worker_ask = ask
+
+
+def run_job(job):
+    query, evidence = job
+    return worker_ask(query, evidence, worker_network)
+
+
+def worker_pool(processes: int, initializer, initargs):
+    #fork where the platform has it, so the workers inherit the initargs instead of unpickling them
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    return context.Pool(processes, initializer=initializer, initargs=initargs)
+
+
+def parallel_ask(jobs, bayes_network, processes=None, ask=variable_elimination_ask, chunksize=None):
+    '''
+    input:
+    jobs: a list of (query, evidence) pairs, in the format of enumeration_ask
+    bayes_network: a DiGraph object created by create_bayes_network
+    processes: the number of worker processes, the number of cores if None
+    ask: the inference routine, a module level function like variable_elimination_ask or enumeration_ask
+    chunksize: the number of jobs sent to a worker at a time, chosen from the number of jobs if None
+    output:
+    the distribution of every job, in the order of jobs.
+
+    the network is compiled once in this process and handed to every worker when it starts:
+    with the fork start method the workers inherit it without pickling, with spawn it is pickled
+    once per worker. jobs only carry their query and evidence.
+    '''
+    jobs = [(list(query), dict(evidence)) for query, evidence in jobs]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(jobs)))
+    #the compiled network (and everything cached on it) is part of the network the workers get
+    compile_network(bayes_network)
+    if processes == 1:
+        return [ask(query, evidence, bayes_network) for query, evidence in jobs]
+
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // (processes * 4))
+    with worker_pool(processes, init_worker, (bayes_network, ask)) as pool:
+        return pool.map(run_job, jobs, chunksize)
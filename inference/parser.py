@@ -0,0 +1,57 @@
+from array import array
+
+import numpy as np
+
+
+def parse_stream(file:str):
+    '''
+    input:
+    file: the name of an input file in the #V/#E/#W format
+    output:
+    (vertices, blockage, edges, weather) as arrays, without building a graph:
+    vertices: the vertex ids (1..n)
+    blockage: blockage[i] is the probability that vertices[i] is blocked given mild weather (0 if not given)
+    edges: (sources, targets, weights), one entry per #E line in the order of the file
+    weather: {'mild': p, 'stormy': p, 'extreme': p}
+
+    the file is read one line at a time and the edges are collected in flat arrays,
+    so the memory is a few numbers per edge even for millions of edges.
+    '''
+    num_nodes = None
+    blocked_vertices = array('q')
+    blocked_probabilities = array('d')
+    sources = array('q')
+    targets = array('q')
+    weights = array('d')
+    weather = None
+    with open(file, 'r') as f:
+        for line in f:
+            #everything after ';' is a comment
+            tokens = line.split(';', 1)[0].split()
+            if not tokens:
+                continue
+            kind = tokens[0]
+            if kind.startswith('#E'):
+                sources.append(int(tokens[1]))
+                targets.append(int(tokens[2]))
+                weights.append(float(tokens[3][1:]))
+            elif kind == '#V':
+                if num_nodes is None:
+                    #the first #V line is the number of vertices
+                    num_nodes = int(tokens[1])
+                else:
+                    blocked_vertices.append(int(tokens[1]))
+                    blocked_probabilities.append(float(tokens[tokens.index('F')+1]) if 'F' in tokens else 0.0)
+            elif kind == '#W':
+                weather = {'mild': float(tokens[1]), 'stormy': float(tokens[2]), 'extreme': float(tokens[3])}
+    if num_nodes is None or weather is None:
+        raise ValueError(file+" is missing the #V number of vertices or the #W weather line")
+
+    vertices = np.arange(1, num_nodes+1, dtype=np.int64)
+    edges = (np.frombuffer(sources, dtype=np.int64), np.frombuffer(targets, dtype=np.int64), np.frombuffer(weights, dtype=np.float64))
+    for ids in (edges[0], edges[1], np.frombuffer(blocked_vertices, dtype=np.int64)):
+        if len(ids) and (ids.min() < 1 or ids.max() > num_nodes):
+            raise ValueError(file+" uses a vertex that is not between 1 and "+str(num_nodes))
+    blockage = np.zeros(num_nodes)
+    blockage[np.frombuffer(blocked_vertices, dtype=np.int64)-1] = np.frombuffer(blocked_probabilities, dtype=np.float64)
+    return vertices, blockage, edges, weather
@@ -0,0 +1,127 @@
+import heapq
+
+from .cache import query_cache, query_key
+from .elimination import evidence_probability
+from .junction_tree import posterior_marginals
+
+
+def path_free_probability(path, evidence, bayes_network):
+    '''
+    input:
+    path: a list of vertices, for example [2, 3, 4]
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    output:
+    the probability that no vertex of the path is blocked given the evidence,
+    P(B(v)=0 for every v in path | evidence) = P(evidence, B(v)=0 for every v in path) / P(evidence).
+    the blockages are not independent (they all depend on W), so this is one joint query
+    and not the product of the marginals. raises ValueError if the evidence has probability 0
+    '''
+    probability = evidence_probability(evidence, bayes_network)
+    if probability <= 0:
+        raise ValueError("the evidence has probability 0")
+    extended_evidence = evidence.copy()
+    for vertex in path:
+        if extended_evidence.get("B("+str(vertex)+")", "0") != "0":
+            #a vertex of the path is known to be blocked
+            return 0.0
+        extended_evidence["B("+str(vertex)+")"] = "0"
+    return evidence_probability(extended_evidence, bayes_network) / probability
+
+
+def weather_conditionals(evidence, bayes_network):
+    '''
+    input:
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    output:
+    (weights, free) where weights[w] = P(W=w | evidence) and free[w][name] = P(name=0 | W=w, evidence)
+    for every blockage variable name ("B(1)", ...). the result is kept in the query cache of the network.
+    '''
+    cache = query_cache(bayes_network)
+    key = query_key("weather_conditionals", [], evidence)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    blockages = [name for name in bayes_network.nodes if name.startswith("B(")]
+    weather = posterior_marginals(evidence, bayes_network, ["W"])["W"]
+    weights = {}
+    free = {}
+    for state, probability in weather.items():
+        #state is in the format "['W=mild']"
+        w = state[2:-2].split("=")[1]
+        if probability == 0:
+            continue
+        weights[w] = probability
+        marginals = posterior_marginals(dict(evidence, W=w), bayes_network, blockages)
+        free[w] = {name: marginals[name][str([name+"=0"])] for name in blockages}
+    cache.put(key, (weights, free))
+    return weights, free
+
+
+def most_probably_free_paths(graph, source, target, evidence, bayes_network, k=1):
+    '''
+    input:
+    graph: the graph returned by parse
+    source, target: vertices of the graph
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    k: the number of paths to return
+    output:
+    a list of up to k (path, probability) pairs, the simple paths from source to target with the
+    highest probability to be free from blockages, best first (paths with probability 0 are left out).
+
+    the search is best-first over path prefixes, a prefix is scored by the probability that it and the target
+    are free. extending a prefix can only lower that probability, so the score bounds every path that extends
+    it and the paths come out of the queue in order. without Ev(i)=1 reports the blockages are independent
+    given W and the evidence, and the score is computed from the cached weather conditionals:
+    sum over w of P(w|e) * the product of P(B(v)=0|w,e) over the vertices. an Ev(i)=1 report couples
+    the parents of Ev(i), the product is not even a bound then, so every prefix is scored
+    with path_free_probability.
+    '''
+    coupled = any(name.startswith("Ev(") and str(state) != "0" for name, state in evidence.items())
+    if coupled:
+        def score(path, products):
+            #a path that extends the prefix still has to go through the target
+            return path_free_probability(path if path[-1] == target else path + [target], evidence, bayes_network)
+
+        def extend(products, vertex):
+            return None
+        products = None
+    else:
+        weights, free = weather_conditionals(evidence, bayes_network)
+        weathers = list(weights)
+
+        def terms(vertex):
+            return [free[w]["B("+str(vertex)+")"] for w in weathers]
+
+        def score(path, products):
+            if path[-1] != target:
+                products = [p * t for p, t in zip(products, terms(target))]
+            return sum(weights[w] * p for w, p in zip(weathers, products))
+
+        def extend(products, vertex):
+            return [p * t for p, t in zip(products, terms(vertex))]
+        products = terms(source)
+
+    paths = []
+    counter = 0
+    queue = [(-score([source], products), counter, [source], products)]
+    while queue and len(paths) < k:
+        bound, _, path, products = heapq.heappop(queue)
+        if bound >= 0:
+            break
+        if path[-1] == target:
+            paths.append(path)
+            continue
+        for neighbor in graph.neighbors(path[-1]):
+            if neighbor in path:
+                continue
+            extended = extend(products, neighbor)
+            counter += 1
+            heapq.heappush(queue, (-score(path + [neighbor], extended), counter, path + [neighbor], extended))
+
+    ranked = [(path, path_free_probability(path, evidence, bayes_network)) for path in paths]
+    ranked.sort(key=lambda item: -item[1])
+    return ranked
@@ -0,0 +1,76 @@
+def ancestors(compiled, ids):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    ids: variable ids
+    output:
+    the variables of ids and all their ancestors, in topological order. the rest of the network
+    is barren (its tables sum to 1 whatever the ancestors are), so P(ids) only depends on these.
+    '''
+    relevant = set()
+    stack = list(ids)
+    while stack:
+        var = stack.pop()
+        if var not in relevant:
+            relevant.add(var)
+            stack.extend(compiled.parents[var])
+    return [var for var in compiled.order if var in relevant]
+
+
+def bayes_ball(compiled, query_ids, evidence_ids):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    query_ids: ids of the query variables
+    evidence_ids: a dictionary of variable id -> observed state index
+    output:
+    (requisite, visited): the variables whose tables are needed for P(query | evidence) and the observed
+    variables whose evidence is needed (Shachter's Bayes-ball).
+
+    a ball starts at every query variable and bounces through the network: an unobserved variable passes a ball
+    coming from a child to its parents and children and a ball coming from a parent to its children, an observed
+    variable bounces a ball coming from a parent back to its parents and blocks the others. the variables the ball
+    leaves through their parents (marked top) are the requisite ones, the rest is barren or d-separated from the query.
+    '''
+    top = set()
+    bottom = set()
+    visited = set()
+    #(variable, True if the ball comes from a child)
+    stack = [(var, True) for var in query_ids]
+    while stack:
+        var, from_child = stack.pop()
+        visited.add(var)
+        observed = var in evidence_ids
+        if from_child and not observed:
+            if var not in top:
+                top.add(var)
+                stack.extend((parent, True) for parent in compiled.parents[var])
+            if var not in bottom:
+                bottom.add(var)
+                stack.extend((child, False) for child in compiled.children[var])
+        elif not from_child:
+            if observed and var not in top:
+                top.add(var)
+                stack.extend((parent, True) for parent in compiled.parents[var])
+            if not observed and var not in bottom:
+                bottom.add(var)
+                stack.extend((child, False) for child in compiled.children[var])
+    return top, {var for var in visited if var in evidence_ids}
+
+
+def relevant_network(compiled, query_ids, evidence_ids):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    query_ids: ids of the query variables
+    evidence_ids: a dictionary of variable id -> observed state index
+    output:
+    (variables, evidence_ids): the requisite variables in topological order and the evidence restricted to the
+    requisite observations. P(query | evidence) is the same when only the tables of these variables are multiplied
+    and only this evidence is used, which is usually a small neighbourhood of the query in a big network.
+    an observed query variable is treated as unobserved, its evidence is kept.
+    '''
+    observed = {var: state for var, state in evidence_ids.items() if var not in query_ids}
+    requisite, visited = bayes_ball(compiled, query_ids, observed)
+    evidence = {var: state for var, state in evidence_ids.items() if var in visited or var in query_ids}
+    return [var for var in compiled.order if var in requisite], evidence
@@ -0,0 +1,264 @@
+import time
+
+import numpy as np
+
+from .factors import NoisyOr, compile_network
+from .relevance import ancestors
+
+
+#number of samples drawn together in one numpy batch by likelihood weighting
+BATCH_SIZE = 10000
+#a batch holds at most this many states (one byte each), so big networks get smaller batches
+MAX_BATCH_CELLS = 2**24
+#number of Gibbs chains run side by side
+GIBBS_CHAINS = 256
+#with a time budget the first batch is this small, the next ones are sized from the rate it was drawn at
+FIRST_BATCH = 256
+
+
+class Estimate:
+    """An approximate distribution and the standard error of each of its entries.
+
+    Args:
+        distribution (dict): the estimate, in the format of enumeration_ask.
+        stderr (dict): the standard error of every entry of distribution.
+        n_samples (int): the number of samples the estimate is based on.
+        elapsed (float): the time it took, in seconds.
+    """
+
+    def __init__(self, distribution, stderr, n_samples, elapsed):
+        self.distribution = distribution
+        self.stderr = stderr
+        self.n_samples = n_samples
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return "Estimate("+str(self.distribution)+", stderr="+str(self.stderr)+", n_samples="+str(self.n_samples)+")"
+
+
+def conditional(compiled, var: int, samples):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    var: a variable id
+    samples: a (batch, variables) array of state indices, the parents of var must be filled
+    output:
+    a (batch, states of var) array of P(var | parents) for every sample
+    '''
+    cpt = compiled.cpts[var]
+    if isinstance(cpt, NoisyOr):
+        parents = samples[:, list(cpt.parents)]
+        off = cpt.leak * np.where(parents == 1, cpt.inhibitors, 1.0).prod(axis=1)
+        return np.stack([off, 1-off], axis=1)
+    rows = np.zeros(len(samples), dtype=np.int64)
+    for i, parent in enumerate(compiled.parents[var]):
+        rows += samples[:, parent] * (cpt.strides[i] // compiled.cardinality[var])
+    return cpt.values.reshape(-1, compiled.cardinality[var])[rows]
+
+
+def draw(probabilities, rng):
+    #one state per row of probabilities, by inverting the cumulative distribution
+    cumulative = np.cumsum(probabilities, axis=1)
+    u = rng.random(len(probabilities)) * cumulative[:, -1]
+    return np.minimum((u[:, None] >= cumulative).sum(axis=1), probabilities.shape[1]-1)
+
+
+def likelihood_weighting(compiled, evidence_ids, variables, size, rng):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    evidence_ids: a dictionary of variable id -> observed state index
+    variables: the variables to sample, in topological order
+    size: the number of samples
+    rng: a numpy random generator
+    output:
+    (samples, weights): a (size, variables of the network) array of states and the weight of every sample
+    '''
+    samples = np.zeros((size, len(compiled)), dtype=np.int8)
+    weights = np.ones(size)
+    for var in variables:
+        probabilities = conditional(compiled, var, samples)
+        if var in evidence_ids:
+            samples[:, var] = evidence_ids[var]
+            weights *= probabilities[:, evidence_ids[var]]
+        else:
+            samples[:, var] = draw(probabilities, rng)
+    return samples, weights
+
+
+def gibbs_sweep(compiled, evidence_ids, variables, samples, rng):
+    #resample every unobserved variable from its distribution given its markov blanket
+    sampled = set(variables)
+    for var in variables:
+        if var in evidence_ids:
+            continue
+        scores = np.ones((len(samples), compiled.cardinality[var]))
+        for state in range(compiled.cardinality[var]):
+            samples[:, var] = state
+            scores[:, state] = conditional(compiled, var, samples)[:, state]
+            for child in compiled.children[var]:
+                if child in sampled:
+                    scores[:, state] *= conditional(compiled, child, samples)[np.arange(len(samples)), samples[:, child]]
+        #rows where every state is impossible (the chain is in a zero probability state) stay uniform
+        scores[scores.sum(axis=1) == 0] = 1
+        samples[:, var] = draw(scores, rng)
+
+
+def batch_size(size: int, drawn: int, start: float, time_budget=None):
+    '''
+    input:
+    size: the number of samples still wanted in one batch
+    drawn: the number of samples drawn since start
+    start: the time.perf_counter() of the start of the query
+    time_budget: a time limit in seconds, or None
+    output:
+    the size of the next batch: at most FIRST_BATCH for the first one, then as many samples as should fit
+    in the time left at the rate so far (0 once the budget has run out)
+    '''
+    if time_budget is None:
+        return size
+    if drawn == 0:
+        return min(size, FIRST_BATCH)
+    elapsed = time.perf_counter() - start
+    return max(0, min(size, int((time_budget - elapsed) * drawn / elapsed)))
+
+
+def estimate_evidence_probability(compiled, evidence_ids, n_samples=10000, seed=None):
+    '''
+    input:
+    compiled: a CompiledNetwork
+    evidence_ids: a dictionary of variable id -> observed state index
+    n_samples: the number of samples to draw
+    seed: seed of the random generator, for repeatable estimates
+    output:
+    an estimate of P(evidence): the mean likelihood weight of samples of the ancestors of the evidence
+    '''
+    rng = np.random.default_rng(seed)
+    variables = ancestors(compiled, list(evidence_ids))
+    weight_sum = 0.0
+    drawn = 0
+    while drawn < n_samples:
+        size = min(BATCH_SIZE, n_samples - drawn, max(1, MAX_BATCH_CELLS // len(compiled)))
+        weight_sum += likelihood_weighting(compiled, evidence_ids, variables, size, rng)[1].sum()
+        drawn += size
+    return weight_sum / n_samples
+
+
+def approximate_ask(query, evidence, bayes_network, n_samples=10000, method="lw", seed=None, time_budget=None):
+    '''
+    input:
+    query: a list of strings, each string is a query variable
+    evidence: a dictionary of strings, each string is an evidence variable
+    bayes_network: a DiGraph object created by create_bayes_network
+    n_samples: the number of samples to draw
+    method: "lw" for likelihood weighting, "gibbs" for gibbs sampling
+    seed: seed of the random generator, for repeatable estimates
+    time_budget: a time limit in seconds. the batches are sized to fit it and the burn-in and the gibbs sweeps
+    stop when it runs out, but one small batch (lw) or the starting states of the chains (gibbs) are always
+    drawn, so even a budget of 0 gives an estimate
+    output:
+    an Estimate of the distribution of the query variables with the standard error of every entry.
+    samples are drawn in numpy batches (likelihood weighting) or in side by side chains (gibbs),
+    only the ancestors of the query and evidence variables are sampled.
+    '''
+    if method not in ("lw", "gibbs"):
+        raise ValueError("unknown method "+str(method)+", expected 'lw' or 'gibbs'")
+    if n_samples <= 0:
+        raise ValueError("no samples were drawn, n_samples must be positive")
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    compiled = compile_network(bayes_network)
+    query_ids = [compiled.index[q] for q in query]
+    evidence_ids = compiled.evidence_ids(evidence)
+    #the ancestors of the query and evidence, the rest of the network can't change the weights
+    variables = ancestors(compiled, query_ids + list(evidence_ids))
+
+    #index of the joint state of the query variables, last variable fastest like compiled.keys
+    strides = np.ones(len(query_ids), dtype=np.int64)
+    for i in range(len(query_ids)-2, -1, -1):
+        strides[i] = strides[i+1] * compiled.cardinality[query_ids[i+1]]
+    states = int(np.prod(compiled.cardinality[query_ids])) if query_ids else 1
+
+    def joint_index(samples):
+        return samples[:, query_ids] @ strides
+
+    if method == "lw":
+        #sums of the weights, weights^2 and weights^2 * indicator per joint state give the ratio estimator and its error
+        totals = np.zeros(states)
+        squared_per_state = np.zeros(states)
+        weight_sum = 0.0
+        squared_sum = 0.0
+        drawn = 0
+        while drawn < n_samples:
+            size = batch_size(min(BATCH_SIZE, n_samples - drawn, max(1, MAX_BATCH_CELLS // len(compiled))), drawn, start, time_budget)
+            if size == 0:
+                break
+            samples, weights = likelihood_weighting(compiled, evidence_ids, variables, size, rng)
+            index = joint_index(samples)
+            totals += np.bincount(index, weights=weights, minlength=states)
+            weight_sum += weights.sum()
+            squared_sum += (weights**2).sum()
+            squared_per_state += np.bincount(index, weights=weights**2, minlength=states)
+            drawn += size
+        if weight_sum == 0:
+            raise ValueError("all the samples have weight 0, the evidence is too unlikely for likelihood weighting")
+        estimate = totals / weight_sum
+        #delta method for a ratio of weighted sums: sum of w^2 (1[x=s] - p)^2 / (sum of w)^2
+        variance = (squared_per_state * (1 - 2*estimate) + squared_sum * estimate**2) / weight_sum**2
+    else:
+        #start the chains from likelihood weighting samples resampled by their weights
+        seeds, seed_weights, seeded = [], [], 0
+        seed_start = time.perf_counter()
+        while seeded < 4*GIBBS_CHAINS:
+            size = batch_size(4*GIBBS_CHAINS - seeded, seeded, start, time_budget)
+            if size == 0:
+                break
+            batch, weights = likelihood_weighting(compiled, evidence_ids, variables, size, rng)
+            seeds.append(batch)
+            seed_weights.append(weights)
+            seeded += size
+        samples, weights = np.concatenate(seeds), np.concatenate(seed_weights)
+        if weights.sum() > 0:
+            samples = samples[rng.choice(len(samples), GIBBS_CHAINS, p=weights/weights.sum())]
+        else:
+            samples = samples[np.arange(GIBBS_CHAINS) % len(samples)]
+        #until a sweep is timed, guess its time from the seeding: likelihood weighting computes one conditional per
+        #sampled variable, a sweep one per state of every unobserved variable and of each of its sampled children
+        sampled = set(variables)
+        calls = sum(compiled.cardinality[var] * (1 + len(sampled.intersection(compiled.children[var])))
+                    for var in variables if var not in evidence_ids)
+        sweep_time = (time.perf_counter() - seed_start) / len(seeds) * calls / max(1, len(variables))
+
+        def sweep(budget):
+            #one more sweep only if it should still fit in the budget
+            nonlocal sweep_time
+            if budget is not None and time.perf_counter() - start + sweep_time >= budget:
+                return False
+            sweep_start = time.perf_counter()
+            gibbs_sweep(compiled, evidence_ids, variables, samples, rng)
+            sweep_time = time.perf_counter() - sweep_start
+            return True
+
+        #the burn-in gets at most half of the budget, so that some of it is left for the draws
+        burn_in = max(10, n_samples // GIBBS_CHAINS // 10)
+        for _ in range(burn_in):
+            if not sweep(None if time_budget is None else time_budget / 2):
+                break
+        counts = np.zeros((GIBBS_CHAINS, states))
+        drawn = 0
+        while drawn < n_samples and sweep(time_budget):
+            counts[np.arange(GIBBS_CHAINS), joint_index(samples)] += 1
+            drawn += GIBBS_CHAINS
+        if drawn == 0:
+            #the budget ran out before the first sweep, the starting states are the estimate
+            counts[np.arange(GIBBS_CHAINS), joint_index(samples)] += 1
+            drawn = GIBBS_CHAINS
+        #the chains are independent, so the spread of their means gives the error
+        chain_means = counts / counts.sum(axis=1, keepdims=True)
+        estimate = chain_means.mean(axis=0)
+        variance = chain_means.var(axis=0, ddof=1) / GIBBS_CHAINS
+
+    keys = compiled.keys(query)
+    distribution = {key: float(p) for key, p in zip(keys, estimate)}
+    stderr = {key: float(np.sqrt(max(v, 0))) for key, v in zip(keys, variance)}
+    return Estimate(distribution, stderr, drawn, time.perf_counter() - start)
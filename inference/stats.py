@@ -0,0 +1,92 @@
+import contextlib
+import time
+
+
+class InferenceStats:
+    """Counters and timings filled in by the inference routines that get it as their stats argument.
+
+    The same object can be passed to several queries, the counters add up. Routines that are not
+    given a stats object (or a trace) skip all the bookkeeping.
+
+    Attributes:
+        engine (str): the engine that answered the last query ("enumeration", "variable_elimination",
+            "factorized", "junction_tree", "batch", "map", "cache" or "approximate" when exact inference
+            did not fit the memory budget).
+        calls (int): nodes of the search tree of enumeration_all.
+        factor_products (int): factor multiplications.
+        factor_sums (int): variables summed out of a factor.
+        largest_factor (int): the number of entries of the largest intermediate factor.
+        width (int): the largest number of variables of an intermediate factor (clique), the elimination width + 1.
+        cache_hits (int), cache_misses (int): lookups in the query cache of the network.
+        phases (dict): phase name -> seconds spent in it ("compile", "order", "eliminate", "maximize", "normalize", ...).
+
+    Args:
+        trace (callable): called as trace(event, details) with a dictionary of details for every phase
+            ("phase": name, seconds), cache lookup ("cache": hit) and eliminated variable ("eliminate": variable, size, width).
+
+    Example:
+        stats = InferenceStats()
+        variable_elimination_ask(["W"], {"Ev(1)": "1"}, bayes_network, stats=stats)
+        print(stats.phases, stats.largest_factor)
+    """
+
+    def __init__(self, trace=None):
+        self.trace = trace
+        self.engine = None
+        self.calls = 0
+        self.factor_products = 0
+        self.factor_sums = 0
+        self.largest_factor = 0
+        self.width = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.phases = {}
+
+    def __repr__(self):
+        return "InferenceStats("+", ".join(key+"="+str(value) for key, value in self.as_dict().items())+")"
+
+    def as_dict(self):
+        return {"engine": self.engine, "calls": self.calls, "factor_products": self.factor_products,
+                "factor_sums": self.factor_sums, "largest_factor": self.largest_factor, "width": self.width,
+                "cache_hits": self.cache_hits, "cache_misses": self.cache_misses, "phases": dict(self.phases)}
+
+    def event(self, event: str, **details):
+        if self.trace is not None:
+            self.trace(event, details)
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.event("phase", name=name, seconds=seconds)
+
+    def cache(self, hit: bool):
+        if hit:
+            self.cache_hits += 1
+            self.engine = "cache"
+        else:
+            self.cache_misses += 1
+        self.event("cache", hit=hit)
+
+    def factor(self, factor):
+        """Record the size of an intermediate factor."""
+        self.largest_factor = max(self.largest_factor, int(factor.values.size))
+        self.width = max(self.width, len(factor.variables))
+
+
+def instrument(stats, trace):
+    """The stats object a routine should fill: stats itself, a new one if only a trace was given, or None."""
+    if stats is None and trace is not None:
+        return InferenceStats(trace)
+    if stats is not None and trace is not None:
+        stats.trace = trace
+    return stats
+
+
+def phase(stats, name: str):
+    #a context manager that times the phase, or does nothing if there is no stats object
+    return contextlib.nullcontext() if stats is None else stats.phase(name)
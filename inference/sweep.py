@@ -0,0 +1,294 @@
+import itertools
+import os
+
+import numpy as np
+
+from .batch import MAX_BATCH_ENTRIES, batch_distributions, eliminate_batch, largest_product
+from .elimination import elimination_order, evidence_factors
+from .factors import CompiledNetwork, Factor, NoisyOr, auxiliary_id, network_revision
+from .network_file import WEATHER_SCALE, PrebuiltNetwork, road_parents, weather_states
+from .parallel import worker_pool
+from .parser import parse_stream
+from .relevance import relevant_network
+
+
+#the parameters of a road network that a setting can change
+PARAMETERS = ("p1", "p2", "weather", "x")
+
+
+class ParameterizedNetwork(PrebuiltNetwork):
+    """A road network whose parameters (p1, p2, the weather prior and x(i)) can be changed without building it again.
+
+    The structure (the variables, their parents and the edge weights behind the noisy-OR inhibitors) is built once,
+    set_parameters only computes the tables again and bumps the revision, so the query cache and the junction tree
+    notice the change. Unlike create_bayes_network every B(i) is a parent of Ev(i), also when x(i) = 0 (B(i) is then
+    never blocked, so the distribution is the same), so changing x never changes the structure.
+
+    Args:
+        vertices, blockage, edges, weather: the arrays of parse_stream.
+        p1 (float): the inhibitor of a blocked neighbour is min(1, p1*w(i,j)).
+        p2 (float): the inhibitor of the node's own blockage.
+    """
+
+    def __init__(self, vertices, blockage, edges, weather: dict, p1: float = 0.2, p2: float = 0.3):
+        self.vertices = np.asarray(vertices, dtype=np.int64)
+        self.position = {vertex: i for i, vertex in enumerate(self.vertices.tolist())}
+        n = len(self.vertices)
+        self.indptr, parent_ids, self.weights = road_parents(self.vertices, edges, np.ones(n, dtype=bool))
+        names = ["W"] + ["B("+str(v)+")" for v in self.vertices.tolist()] + ["Ev("+str(v)+")" for v in self.vertices.tolist()]
+        states = [weather_states(weather)] + [("0", "1")] * (2*n)
+        bounds = self.indptr.tolist()
+        parent_lists = parent_ids.tolist()
+        parents = [()] + [(0,)] * n + [parent_lists[bounds[i]:bounds[i+1]] for i in range(n)]
+        self.structure = CompiledNetwork(names, states, parents, [None] * len(names))
+        self.parameters = {"p1": float(p1), "p2": float(p2), "weather": dict(weather),
+                           "x": np.array(blockage, dtype=np.float64)}
+        super().__init__(self.compile(self.parameters))
+
+    def __repr__(self):
+        return "ParameterizedNetwork(nodes="+str(self.number_of_nodes())+", p1="+str(self.parameters["p1"])+", p2="+str(self.parameters["p2"])+")"
+
+    @classmethod
+    def from_file(cls, path: str, p1: float = 0.2, p2: float = 0.3):
+        return cls(*parse_stream(path), p1=p1, p2=p2)
+
+    @classmethod
+    def from_graph(cls, graph, weather: dict, broken_given_weather: dict, p1: float = 0.2, p2: float = 0.3):
+        '''
+        input:
+        graph, weather, broken_given_weather: the arguments of create_bayes_network (the output of pirsur.parse)
+        p1, p2: the noisy-OR parameters
+        output:
+        the ParameterizedNetwork of the same model
+        '''
+        vertices = np.array(sorted(graph.nodes), dtype=np.int64)
+        edges = [(u, v, data["weight"]) for u, v, data in graph.edges(data=True)]
+        edges = (np.array([u for u, _, _ in edges], dtype=np.int64), np.array([v for _, v, _ in edges], dtype=np.int64),
+                 np.array([w for _, _, w in edges], dtype=np.float64))
+        blockage = [float(broken_given_weather[v]) for v in vertices.tolist()]
+        return cls(vertices, blockage, edges, weather, p1, p2)
+
+    def resolve(self, setting: dict) -> dict:
+        '''
+        input:
+        setting: a dictionary of the parameters to change, for example {"p1": 0.1, "x": {3: 0.05}}.
+        weather is a dictionary of all the weather states, x is a dictionary of vertex -> x(v) for the
+        vertices that change or an array of x for all the vertices
+        output:
+        the parameters of the network with the ones of setting replaced
+        '''
+        unknown = set(setting) - set(PARAMETERS)
+        if unknown:
+            raise ValueError("unknown parameters "+str(sorted(unknown))+", expected some of "+str(PARAMETERS))
+        parameters = dict(self.parameters)
+        for name in ("p1", "p2"):
+            if name in setting:
+                parameters[name] = float(setting[name])
+        if "weather" in setting:
+            if set(setting["weather"]) != set(self.structure.states[0]):
+                raise ValueError("the weather must give the states "+str(self.structure.states[0]))
+            parameters["weather"] = dict(setting["weather"])
+        if "x" in setting:
+            if isinstance(setting["x"], dict):
+                x = parameters["x"].copy()
+                for vertex, value in setting["x"].items():
+                    x[self.position[vertex]] = value
+            else:
+                x = np.array(setting["x"], dtype=np.float64)
+                if x.shape != parameters["x"].shape:
+                    raise ValueError("x must have one entry per vertex, got shape "+str(x.shape))
+            parameters["x"] = x
+        return parameters
+
+    def compile(self, parameters: dict) -> CompiledNetwork:
+        '''
+        input:
+        parameters: all the parameters (see resolve)
+        output:
+        a CompiledNetwork that shares the structure of the network and has the tables of the parameters
+        '''
+        n = len(self.vertices)
+        prior, blocked, inhibitors = (table[0] for table in self.tables([parameters]))
+        bounds = self.indptr.tolist()
+        cpts = [Factor((0,), (len(prior),), prior)]
+        cpts += [Factor((0, 1+i), (len(prior), 2), blocked[i]) for i in range(n)]
+        for i in range(n):
+            var = 1 + n + i
+            cpts.append(NoisyOr(var, self.structure.parents[var], inhibitors[bounds[i]:bounds[i+1]], auxiliary_id(var)))
+        return self.structure.with_tables(cpts)
+
+    def tables(self, parameters):
+        '''
+        input:
+        parameters: a list of parameter dictionaries (see resolve)
+        output:
+        (prior, blocked, inhibitors), the tables of all of them at once with a leading axis over the parameters:
+        prior[s, w] = P(W=w), blocked[s, i, w, b] = P(B(i)=b | W=w) and inhibitors[s, k] is the inhibitor of the
+        k'th noisy-OR parent (the parents of the i'th Ev node are indptr[i]:indptr[i+1])
+        '''
+        prior = np.array([[p["weather"][state] for state in self.structure.states[0]] for p in parameters], dtype=np.float64)
+        x = np.array([p["x"] for p in parameters], dtype=np.float64)
+        #P(B(i)=1 | W=w) = WEATHER_SCALE[w] * x(i)
+        on = x[:, :, np.newaxis] * np.array([WEATHER_SCALE[state] for state in self.structure.states[0]], dtype=np.float64)
+        blocked = np.stack([1 - on, on], axis=-1)
+        p1 = np.array([p["p1"] for p in parameters])[:, np.newaxis]
+        p2 = np.array([p["p2"] for p in parameters])[:, np.newaxis]
+        with np.errstate(invalid="ignore"):
+            inhibitors = np.where(np.isnan(self.weights), p2, np.minimum(1, p1 * self.weights))
+        return prior, blocked, inhibitors
+
+    def set_parameters(self, **setting):
+        """Change some of the parameters (see resolve), for example network.set_parameters(p1=0.1, p2=0.4)."""
+        self.parameters = self.resolve(setting)
+        self.graph["revision"] += 1
+        self.graph["compiled"] = (network_revision(self), self.compile(self.parameters))
+
+
+def parameter_grid(**values):
+    '''
+    input:
+    values: a list of values for every parameter to sweep, for example parameter_grid(p1=[0.1, 0.2], p2=[0.3, 0.4])
+    output:
+    a list of settings, one per combination of the values (the last parameter changes fastest)
+    '''
+    unknown = set(values) - set(PARAMETERS)
+    if unknown:
+        raise ValueError("unknown parameters "+str(sorted(unknown))+", expected some of "+str(PARAMETERS))
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*values.values())]
+
+
+class SweepPlan:
+    """What every setting of a sweep shares: the pruned network, the elimination order and the chunk size.
+
+    The structure of a ParameterizedNetwork does not depend on its parameters, so the requisite variables and
+    the elimination order are computed once. The tables of a chunk of settings are built together and
+    eliminated at once with a batch axis over the settings (see batch_ask).
+
+    Args:
+        network (ParameterizedNetwork): the network.
+        query (list): the query variables.
+        evidence (dict): the evidence, in the format of enumeration_ask.
+        max_entries (int): a chunk of settings has at most this many entries in its largest intermediate table.
+    """
+
+    def __init__(self, network, query, evidence: dict, max_entries: int = MAX_BATCH_ENTRIES):
+        self.network = network
+        compiled = network.graph["compiled"][1]
+        self.query_ids = [compiled.index[q] for q in query]
+        self.variables, self.evidence_ids = relevant_network(compiled, self.query_ids, compiled.evidence_ids(evidence))
+        factors = evidence_factors(compiled, self.query_ids, self.evidence_ids, self.variables)
+        hidden = {var for factor in factors for var in factor.variables if var not in self.query_ids}
+        self.order = elimination_order(factors, hidden)
+        self.cardinality = {var: int(card) for factor in factors for var, card in zip(factor.variables, factor.cardinality)}
+        self.cardinality.update({var: int(compiled.cardinality[var]) for var in self.query_ids})
+        self.chunk = max(1, max_entries // largest_product(factors, self.order))
+
+    def factors(self, settings):
+        '''
+        input:
+        settings: a list of settings (see ParameterizedNetwork.resolve)
+        output:
+        the factors of evidence_factors for all the settings at once, as (variables, table) pairs whose tables
+        have a leading axis over the settings. they are built from the tables of the road layout with numpy,
+        without a Factor object per setting.
+        '''
+        network = self.network
+        prior, blocked, inhibitors = network.tables([network.resolve(setting) for setting in settings])
+        structure = network.structure
+        n = len(network.vertices)
+        observed = {var: state for var, state in self.evidence_ids.items() if var not in self.query_ids}
+        ones = np.ones(len(settings))
+        factors = []
+        for var in self.variables:
+            if var == 0:
+                factors.append(((0,), prior) if 0 not in observed else ((), prior[:, observed[0]]))
+                continue
+            if var <= n:
+                variables, table = (0, var), blocked[:, var-1]
+                if var in observed:
+                    variables, table = (0,), table[:, :, observed[var]]
+                if 0 in observed:
+                    variables, table = variables[1:], table[:, observed[0]]
+                factors.append((variables, table))
+                continue
+            #a noisy-OR node, decomposed like NoisyOr.decompose with the observed parents moved into the leak
+            if var not in self.query_ids and var not in observed:
+                continue
+            aux = auxiliary_id(var)
+            start = network.indptr[var-1-n]
+            leak = ones
+            parents = []
+            for k, parent in enumerate(structure.parents[var]):
+                if parent not in observed:
+                    parents.append((parent, inhibitors[:, start+k]))
+                elif observed[parent] == 1:
+                    leak = leak * inhibitors[:, start+k]
+            if observed.get(var) == 0:
+                factors += [((parent, ), np.stack([ones, q], axis=1)) for parent, q in parents]
+                factors.append(((), leak))
+                continue
+            factors += [((parent, aux), np.stack([ones, ones, ones, q], axis=1).reshape(-1, 2, 2)) for parent, q in parents]
+            h = np.stack([0*leak, leak, ones, -leak], axis=1).reshape(-1, 2, 2)
+            factors.append(((var, aux), h) if var not in observed else ((aux,), h[:, observed[var]]))
+        for var in self.query_ids:
+            if var in self.evidence_ids:
+                indicator = np.zeros((1, structure.cardinality[var]))
+                indicator[0, self.evidence_ids[var]] = 1
+                factors.append(((var,), indicator))
+        return factors
+
+    def answer(self, settings):
+        '''
+        input:
+        settings: a list of settings (see ParameterizedNetwork.resolve)
+        output:
+        a (settings, joint query states) array of the distribution of the query under every setting
+        '''
+        factors = eliminate_batch(self.factors(settings), self.order, self.cardinality)
+        return batch_distributions(factors, self.query_ids, self.cardinality, len(settings))
+
+
+#the plan of a worker process, set once when the worker starts
+worker_plan = None
+
+
+def init_worker(plan):
+    global worker_plan
+    worker_plan = plan
+
+
+def run_chunk(settings):
+    return worker_plan.answer(settings)
+
+
+def parameter_sweep(query, evidence, network, settings, processes=None, max_entries=MAX_BATCH_ENTRIES):
+    '''
+    input:
+    query: a list of strings, each string is a query variable
+    evidence: a dictionary of strings, each string is an evidence variable
+    network: a ParameterizedNetwork
+    settings: a list of settings, for example parameter_grid(p1=[0.1, 0.2], p2=[0.3, 0.4])
+    processes: the number of worker processes, the number of cores if None
+    max_entries: see SweepPlan
+    output:
+    a (settings, joint query states) array, row s is the distribution of the query under settings[s], with the
+    columns in the order of the enumeration_ask keys. the parameters of network itself do not change.
+
+    the plan is computed once in this process and handed to every worker when it starts (as in parallel_ask).
+    the settings are split into chunks of at most max_entries, each answered with one batched elimination.
+    the workers are only started when there is more than one chunk, a single chunk is faster than starting them.
+    '''
+    settings = list(settings)
+    compiled = network.graph["compiled"][1]
+    if len(settings) == 0:
+        return np.zeros((0, int(np.prod([compiled.cardinality[compiled.index[q]] for q in query]))))
+    plan = SweepPlan(network, query, evidence, max_entries)
+    chunks = [settings[start:start+plan.chunk] for start in range(0, len(settings), plan.chunk)]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(chunks)))
+    if processes == 1:
+        return np.concatenate([plan.answer(chunk) for chunk in chunks])
+    with worker_pool(processes, init_worker, (plan,)) as pool:
+        return np.concatenate(pool.map(run_chunk, chunks))
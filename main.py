@@ -1,7 +1,4 @@
-import networkx as nx
-import matplotlib.pyplot as plt
-from networkx import DiGraph, Graph
-from typing import List, Dict
+from networkx import Graph
 from bayes import *
 from pirsur import *
 
@@ -0,0 +1,300 @@
+"""A local query service: evidence and queries arrive as JSON lines, answers go back as JSON lines.
+
+Messages (one JSON object per line):
+    {"type": "evidence", "graph": "roads", "variable": "Ev(3)", "value": "1"}   (value null retracts it)
+    {"type": "reset", "graph": "roads"}                                          (drops all the evidence)
+    {"type": "query", "graph": "roads", "id": 7, "variables": ["B(3)", "W"]}    (variables missing = all)
+A query is answered with {"id": 7, "graph": "roads", "version": 12, "marginals": {...}}, where version counts
+the evidence updates the answer includes, or with {"id": 7, "error": "..."}.
+
+Run it on stdio or on a localhost socket:
+    python service.py --graph roads=input.txt --stdio
+    python service.py --graph roads=input.txt --port 8765
+a network file written by inference/network_file.py (python -m inference.network_file input.txt roads.bnet) starts faster:
+    python service.py --graph roads=roads.bnet --port 8765
+and load test it with generated events:
+    python service.py --graph roads=input.txt --generate 10000 | python service.py --graph roads=input.txt --stdio
+    python service.py --graph roads=input.txt --load-test 10000 --port 8765
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from inference.factors import compile_network
+from inference.junction_tree import posterior_marginals
+from inference.network_file import read_network
+
+
+class GraphService:
+    """The evidence of one network and the queue of queries waiting for an answer.
+
+    Evidence is applied as soon as it arrives (a dictionary update), it never waits for inference.
+    Queries are answered by one worker per graph that runs the inference in a thread: all the queries
+    that are waiting when it starts are answered from the same computation, with all the evidence
+    that arrived until then, so a burst of updates costs one inference.
+
+    Args:
+        bayes_network (DiGraph): a bayes network created by create_bayes_network.
+    """
+
+    def __init__(self, bayes_network):
+        self.bayes_network = bayes_network
+        self.evidence = {}
+        self.version = 0
+        self.queries = asyncio.Queue()
+        self.worker = None
+
+    def update(self, variable: str, value):
+        """Set (or retract, if value is None) the evidence of a variable.
+
+        An unknown variable (KeyError) or state (ValueError) is refused and the evidence stays as it was,
+        so one bad report does not break the queries that follow it.
+        """
+        if variable not in self.bayes_network.nodes:
+            raise KeyError("unknown variable "+str(variable))
+        if value is not None:
+            compile_network(self.bayes_network).evidence_ids({variable: str(value)})
+        if value is None:
+            self.evidence.pop(variable, None)
+        else:
+            self.evidence[variable] = str(value)
+        self.version += 1
+
+    def reset(self):
+        self.evidence = {}
+        self.version += 1
+
+    async def ask(self, variables):
+        """The marginals of the variables given the latest evidence, and the version of that evidence."""
+        #a string would be read one character at a time
+        if variables is not None and not (isinstance(variables, list) and all(isinstance(name, str) for name in variables)):
+            raise TypeError("variables must be a list of variable names, got "+json.dumps(variables))
+        for name in variables or []:
+            if name not in self.bayes_network.nodes:
+                raise KeyError("unknown variable "+str(name))
+        if self.worker is None:
+            self.worker = asyncio.create_task(self.answer_queries())
+        answer = asyncio.get_running_loop().create_future()
+        await self.queries.put((variables, answer))
+        return await answer
+
+    async def answer_queries(self):
+        while True:
+            waiting = [await self.queries.get()]
+            while not self.queries.empty():
+                waiting.append(self.queries.get_nowait())
+            evidence = dict(self.evidence)
+            version = self.version
+            variables = None
+            if all(query_variables is not None for query_variables, _ in waiting):
+                variables = sorted({name for query_variables, _ in waiting for name in query_variables})
+            try:
+                marginals = await asyncio.to_thread(posterior_marginals, evidence, self.bayes_network, variables)
+            except Exception as error:
+                for _, answer in waiting:
+                    answer.set_exception(error)
+                continue
+            for query_variables, answer in waiting:
+                names = marginals if query_variables is None else query_variables
+                answer.set_result(({name: marginals[name] for name in names}, version))
+
+
+class FileWriter:
+    """The write and drain of a StreamWriter for a file, writing synchronously."""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data: bytes):
+        self.file.write(data)
+
+    async def drain(self):
+        self.file.flush()
+
+
+class Service:
+    """Routes the messages of a stream to the GraphService of their graph.
+
+    Args:
+        graphs (dict): graph name -> bayes network.
+    """
+
+    def __init__(self, graphs: dict):
+        self.graphs = {name: GraphService(bayes_network) for name, bayes_network in graphs.items()}
+
+    async def handle(self, line: str, respond):
+        '''
+        input:
+        line: one JSON message
+        respond: a coroutine function that sends one JSON answer back
+        output:
+        the task answering the message if it is a query, None otherwise
+        '''
+        try:
+            message = json.loads(line)
+            if not isinstance(message, dict):
+                raise ValueError("expected a JSON object")
+            #messages without a graph go to the first one
+            message.setdefault("graph", next(iter(self.graphs)))
+            graph = self.graphs[message["graph"]]
+            kind = message.get("type")
+            if kind == "evidence":
+                graph.update(message["variable"], message.get("value"))
+            elif kind == "reset":
+                graph.reset()
+            elif kind == "query":
+                #answering must not hold up the next messages of the stream
+                return asyncio.create_task(self.answer(graph, message, respond))
+            else:
+                await respond({"id": message.get("id"), "error": "unknown message type "+str(kind)})
+        except (ValueError, KeyError, TypeError) as error:
+            #only this message is refused, the stream goes on
+            await respond({"error": "bad message: "+str(error)})
+        return None
+
+    async def answer(self, graph, message, respond):
+        try:
+            marginals, version = await graph.ask(message.get("variables"))
+            await respond({"id": message.get("id"), "graph": message.get("graph"), "version": version, "marginals": marginals})
+        except Exception as error:
+            await respond({"id": message.get("id"), "error": str(error)})
+
+    async def serve_stream(self, reader, writer):
+        lock = asyncio.Lock()
+
+        async def respond(answer):
+            async with lock:
+                writer.write((json.dumps(answer)+"\n").encode())
+                await writer.drain()
+
+        answering = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                task = await self.handle(line.decode(), respond)
+                if task is not None:
+                    answering.add(task)
+                    task.add_done_callback(answering.discard)
+        #answer the queries that are still running before closing the stream
+        await asyncio.gather(*answering)
+
+    async def serve_stdio(self):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        try:
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        except ValueError:
+            #stdin is a regular file, it is all there already
+            reader.feed_data(sys.stdin.buffer.read())
+            reader.feed_eof()
+        try:
+            transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+            writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        except ValueError:
+            #stdout is a regular file, it can't be written asynchronously
+            writer = FileWriter(sys.stdout.buffer)
+        await self.serve_stream(reader, writer)
+
+    async def serve_socket(self, port: int, host: str = "127.0.0.1"):
+        server = await asyncio.start_server(self.serve_stream, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def generate_events(graph_name: str, vertices, count: int, query_every: int = 10, seed=None):
+    '''
+    input:
+    graph_name: the name of the graph in the service
+    vertices: the vertices of the graph
+    count: the number of messages
+    query_every: one message out of query_every is a query, the rest are sensor reports
+    seed: seed of the random generator
+    output:
+    a generator of JSON lines of random evidence events and queries, for load testing
+    '''
+    rng = random.Random(seed)
+    for i in range(count):
+        if i % query_every == query_every-1:
+            variables = ["W"] + ["B("+str(vertex)+")" for vertex in rng.sample(list(vertices), min(3, len(vertices)))]
+            yield json.dumps({"type": "query", "graph": graph_name, "id": i, "variables": variables})
+        else:
+            vertex = rng.choice(list(vertices))
+            value = rng.choice(["0", "0", "0", "1", None])
+            yield json.dumps({"type": "evidence", "graph": graph_name, "variable": "Ev("+str(vertex)+")", "value": value})
+
+
+async def load_test(graph_name: str, vertices, count: int, port: int, host: str = "127.0.0.1", query_every: int = 10):
+    """Send generated events to a running service and report the latency of the queries."""
+    reader, writer = await asyncio.open_connection(host, port)
+    sent = {}
+    latencies = []
+
+    async def read_answers():
+        while len(latencies) < len(sent) or not sending.done():
+            line = await reader.readline()
+            if not line:
+                break
+            answer = json.loads(line)
+            if answer.get("id") in sent:
+                latencies.append(time.perf_counter() - sent[answer["id"]])
+
+    async def send():
+        for line in generate_events(graph_name, vertices, count, query_every):
+            message = json.loads(line)
+            if message["type"] == "query":
+                sent[message["id"]] = time.perf_counter()
+            writer.write((line+"\n").encode())
+            await writer.drain()
+
+    start = time.perf_counter()
+    sending = asyncio.create_task(send())
+    await asyncio.gather(sending, read_answers())
+    elapsed = time.perf_counter() - start
+    writer.close()
+    latencies.sort()
+    report = {"messages": count, "queries": len(sent), "answered": len(latencies), "seconds": elapsed,
+              "messages_per_second": count / elapsed}
+    if latencies:
+        report["latency_median"] = latencies[len(latencies)//2]
+        report["latency_p99"] = latencies[min(len(latencies)-1, int(len(latencies)*0.99))]
+    return report
+
+
+def load_graphs(specs):
+    #specs are in the format name=file, an input file or a network file written by save_network (networkx is not needed)
+    graphs = {}
+    vertices = {}
+    for spec in specs:
+        name, _, path = spec.partition("=")
+        graphs[name] = read_network(path or name)
+        vertices[name] = [node[2:-1] for node in graphs[name].nodes if node.startswith("B(")]
+    return graphs, vertices
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer JSON lines evidence events and queries.")
+    parser.add_argument("--graph", action="append", required=True, help="name=input_file, can be given more than once")
+    parser.add_argument("--stdio", action="store_true", help="read messages from stdin and answer on stdout")
+    parser.add_argument("--port", type=int, help="serve on this localhost port")
+    parser.add_argument("--generate", type=int, metavar="COUNT", help="print COUNT generated messages for the first graph")
+    parser.add_argument("--load-test", type=int, metavar="COUNT", help="send COUNT generated messages to the service on --port")
+    args = parser.parse_args()
+
+    graphs, vertices = load_graphs(args.graph)
+    first = next(iter(graphs))
+    if args.generate:
+        for line in generate_events(first, vertices[first], args.generate):
+            print(line)
+    elif args.load_test:
+        print(json.dumps(asyncio.run(load_test(first, vertices[first], args.load_test, args.port))))
+    elif args.stdio:
+        asyncio.run(Service(graphs).serve_stdio())
+    elif args.port:
+        asyncio.run(Service(graphs).serve_socket(args.port))
+    else:
+        parser.error("choose one of --stdio, --port, --generate or --load-test")
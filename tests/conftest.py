@@ -0,0 +1,14 @@
+import pytest
+
+
+@pytest.fixture(params=["closed_form", "elimination"])
+def engine(request, monkeypatch):
+    #the closed form over W answers most of the small queries, without it the elimination or the junction tree do
+    if request.param == "elimination":
+        monkeypatch.setattr("inference.factorized.MAX_POSITIVE_REPORTS", -1)
+    return request.param
+
+
+@pytest.fixture
+def no_closed_form(monkeypatch):
+    monkeypatch.setattr("inference.factorized.MAX_POSITIVE_REPORTS", -1)
@@ -0,0 +1,85 @@
+"""Small random road networks and brute force answers to check the engines against enumeration_ask."""
+import os
+import random
+
+import networkx as nx
+
+from bayes import create_bayes_network, enumeration_all
+from inference.factors import compile_network
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUT = os.path.join(ROOT, "input.txt")
+WEATHER = {"mild": 0.5, "stormy": 0.3, "extreme": 0.2}
+
+
+def random_road_graph(seed: int, vertices: int = None, roads: int = None):
+    '''
+    input:
+    seed: seed of the random generator
+    vertices, roads: the size of the graph, random if None (at most 5 vertices, so enumeration stays fast)
+    output:
+    (graph, x): an undirected graph with weighted roads (self loops included) and x(i) of every vertex
+    '''
+    rng = random.Random(seed)
+    n = rng.randint(1, 5) if vertices is None else vertices
+    pairs = [(u, v) for u in range(1, n+1) for v in range(u, n+1)]
+    graph = nx.Graph()
+    graph.add_nodes_from(range(1, n+1))
+    for u, v in rng.sample(pairs, min(len(pairs), rng.randint(0, 2*n) if roads is None else roads)):
+        graph.add_edge(u, v, weight=rng.choice([1, 2, 3, 4, 6]))
+    x = {i: rng.choice([0, 0.1, 0.2, 0.3]) for i in range(1, n+1)}
+    return graph, x
+
+
+def random_network(seed: int, **kwargs):
+    graph, x = random_road_graph(seed, **kwargs)
+    return create_bayes_network(graph, WEATHER, x)
+
+
+def random_query(bayes_network, seed: int, size: int = 1):
+    #size random variables of the network
+    return random.Random(seed).sample(sorted(compile_network(bayes_network).names), size)
+
+
+def write_input(path: str, graph, x, weather=WEATHER):
+    #the graph in the #V/#E/#W format of pirsur.parse
+    lines = ["#V "+str(graph.number_of_nodes())]
+    lines += ["#V "+str(v)+" F "+str(x[v]) for v in sorted(graph.nodes)]
+    lines += ["#E"+str(i+1)+" "+str(u)+" "+str(v)+" W"+str(data["weight"]) for i, (u, v, data) in enumerate(graph.edges(data=True))]
+    lines.append("#W "+" ".join(str(weather[state]) for state in ("mild", "stormy", "extreme")))
+    with open(path, "w") as file:
+        file.write("\n".join(lines)+"\n")
+
+
+def brute_evidence_probability(evidence, bayes_network):
+    #P(evidence) by enumerating every variable of the network
+    compiled = compile_network(bayes_network)
+    assignment = [-1] * len(compiled)
+    for var, state in compiled.evidence_ids(evidence).items():
+        assignment[var] = state
+    return enumeration_all(compiled.order, assignment, compiled)
+
+
+def random_evidence(bayes_network, seed: int, variables=None):
+    '''
+    input:
+    bayes_network: a network created by create_bayes_network
+    seed: seed of the random generator
+    variables: the variables that can be observed, all of them if None
+    output:
+    evidence with a probability above 0, on a random subset of the variables
+    '''
+    rng = random.Random(seed)
+    compiled = compile_network(bayes_network)
+    names = list(compiled.names if variables is None else variables)
+    while True:
+        evidence = {name: rng.choice(compiled.states[compiled.index[name]]) for name in rng.sample(names, rng.randint(0, len(names)))}
+        if brute_evidence_probability(evidence, bayes_network) > 1e-12:
+            return evidence
+
+
+def assert_close(actual: dict, expected: dict, tolerance: float = 1e-9):
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        assert abs(actual[key] - expected[key]) <= tolerance, (key, actual[key], expected[key])
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.batch import batch_ask, evidence_matrix
+from inference.factors import compile_network
+from pirsur import parse
+from tests.networks import INPUT, random_evidence, random_network, random_query
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_batch(seed):
+    bayes_network = random_network(seed)
+    observed = sorted(name for name in bayes_network.nodes if name.startswith("Ev("))
+    query = random_query(bayes_network, seed)
+    scenarios = [random_evidence(bayes_network, seed+i, observed) for i in range(4)]
+    evidence = [[scenario.get(name) for name in observed] for scenario in scenarios]
+    result = batch_ask(query, observed, np.array(evidence, dtype=object), bayes_network)
+    for row, scenario in zip(result, scenarios):
+        expected = enumeration_ask(query, scenario, bayes_network)
+        assert np.allclose(row, list(expected.values()), atol=1e-9)
+
+
+def test_evidence_matrix_indices():
+    #integers are state indices, also in an object array with labels and None
+    graph, weather, blockage = parse(INPUT)
+    compiled = compile_network(create_bayes_network(graph, weather, blockage))
+    evidence = np.array([[1, None], [None, "1"], ["extreme", 0]], dtype=object)
+    assert evidence_matrix(compiled, ["W", "Ev(1)"], evidence).tolist() == [[1, -1], [-1, 1], [2, 0]]
@@ -0,0 +1,72 @@
+import random
+import warnings
+
+import networkx as nx
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.elimination import MemoryBudgetExceeded, evidence_probability, variable_elimination_ask
+from inference.joint import joint_ask
+from inference.junction_tree import junction_tree
+from inference.mpe import mpe_ask
+from inference.stats import InferenceStats
+from tests.networks import WEATHER, assert_close, brute_evidence_probability
+
+
+def dense_network(seed: int):
+    #every pair of the 7 vertices is a road, so the elimination builds big factors
+    rng = random.Random(seed)
+    graph = nx.complete_graph(range(1, 8))
+    nx.set_edge_attributes(graph, {edge: rng.choice([1, 2, 3]) for edge in graph.edges}, "weight")
+    return create_bayes_network(graph, WEATHER, {i: rng.choice([0.1, 0.2, 0.3]) for i in graph.nodes})
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_cutset_conditioning(seed, no_closed_form):
+    bayes_network = dense_network(seed)
+    evidence = {"Ev("+str(i)+")": "1" for i in range(1, 8)}
+    evidence["Ev(1)"] = "0"
+    unlimited = InferenceStats()
+    expected = variable_elimination_ask(["W"], evidence, bayes_network, unlimited, max_entries=2**40)
+    assert unlimited.engine == "variable_elimination"
+    assert_close(expected, enumeration_ask(["W"], evidence, bayes_network))
+    budget = unlimited.largest_factor // 4
+    bayes_network.graph["query_cache"].clear()
+    stats = InferenceStats()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert_close(variable_elimination_ask(["W"], evidence, bayes_network, stats, max_entries=budget), expected)
+        assert stats.largest_factor <= budget
+        assert abs(evidence_probability(evidence, bayes_network, max_entries=budget) - brute_evidence_probability(evidence, bayes_network)) <= 1e-12
+        assert_close(joint_ask(["W"], evidence, bayes_network, max_factor_entries=budget).to_dict(), expected)
+
+
+def test_budget_fallback(no_closed_form):
+    bayes_network = dense_network(0)
+    evidence = {"Ev("+str(i)+")": "1" for i in range(1, 8)}
+    expected = enumeration_ask(["W"], evidence, bayes_network)
+    stats = InferenceStats()
+    with pytest.warns(RuntimeWarning):
+        estimate = variable_elimination_ask(["W"], evidence, bayes_network, stats, max_entries=2)
+    assert stats.engine == "approximate"
+    assert_close(estimate, expected, 0.02)
+    with pytest.raises(MemoryBudgetExceeded):
+        joint_ask(["W"], evidence, bayes_network, max_factor_entries=2)
+    with pytest.raises(MemoryBudgetExceeded):
+        mpe_ask({"Ev(1)": "1"}, bayes_network, max_entries=2)
+    #a cached junction tree is checked against the budget of every call
+    junction_tree(bayes_network)
+    with pytest.raises(MemoryBudgetExceeded):
+        junction_tree(bayes_network, 2)
+
+
+def test_deep_enumeration():
+    #a chain longer than the recursion limit of Python, everything but W observed
+    graph = nx.path_graph(range(1, 1201))
+    nx.set_edge_attributes(graph, 1, "weight")
+    bayes_network = create_bayes_network(graph, WEATHER, {i: 0.1 for i in graph.nodes})
+    evidence = {}
+    for i in graph.nodes:
+        evidence["B("+str(i)+")"] = "1" if i == 7 else "0"
+        evidence["Ev("+str(i)+")"] = "1" if i == 8 else "0"
+    assert_close(enumeration_ask(["W"], evidence, bayes_network), variable_elimination_ask(["W"], evidence, bayes_network))
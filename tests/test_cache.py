@@ -0,0 +1,38 @@
+import pytest
+
+from bayes import Table, create_bayes_network, enumeration_ask
+from inference.elimination import variable_elimination_ask
+from inference.factors import compile_network, network_revision
+from tests.networks import WEATHER, assert_close, random_road_graph
+
+
+def test_table_pop():
+    #a pop that changes nothing keeps the revision, and the caches with it
+    graph, x = random_road_graph(0)
+    bayes_network = create_bayes_network(graph, WEATHER, x)
+    revision = network_revision(bayes_network)
+    table = bayes_network.nodes["W"]["probabilities"]
+    assert isinstance(table, Table)
+    with pytest.raises(KeyError):
+        table.pop("foggy")
+    assert table.pop("foggy", None) is None
+    with pytest.raises(KeyError):
+        Table({}).popitem()
+    assert network_revision(bayes_network) == revision
+    table.pop("mild")
+    assert network_revision(bayes_network) != revision
+
+
+def test_table_ior():
+    #an update with |= drops the compiled network and the cached answers like any other change
+    graph, x = random_road_graph(1)
+    bayes_network = create_bayes_network(graph, WEATHER, x)
+    compiled = compile_network(bayes_network)
+    variable_elimination_ask(["W"], {}, bayes_network)
+    table = bayes_network.nodes["W"]["probabilities"]
+    table |= {"mild": 0.2, "extreme": 0.5}
+    assert bayes_network.nodes["W"]["probabilities"] is table
+    assert compile_network(bayes_network) is not compiled
+    expected = {"['W=mild']": 0.2, "['W=stormy']": 0.3, "['W=extreme']": 0.5}
+    assert_close(variable_elimination_ask(["W"], {}, bayes_network), expected)
+    assert_close(enumeration_ask(["W"], {}, bayes_network), expected)
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+from bayes import add_vertex, create_bayes_network, enumeration_ask, remove_road, remove_vertex, set_blockage, set_road
+from inference.elimination import variable_elimination_ask
+from inference.junction_tree import posterior_marginals
+from tests.networks import WEATHER, assert_close, random_evidence, random_road_graph
+
+
+def edit(graph, x, bayes_network, rng):
+    #one random edit, applied to the network and to the graph it was built from
+    vertices = sorted(graph.nodes)
+    kind = rng.choice(["set_road", "remove_road", "set_blockage", "add_vertex", "remove_vertex"])
+    if kind == "set_road":
+        u, v, weight = rng.choice(vertices), rng.choice(vertices), rng.choice([1, 2, 5])
+        set_road(bayes_network, u, v, weight)
+        graph.add_edge(u, v, weight=weight)
+    elif kind == "remove_road" and graph.number_of_edges():
+        u, v = rng.choice(list(graph.edges))
+        remove_road(bayes_network, u, v)
+        graph.remove_edge(u, v)
+    elif kind == "set_blockage":
+        node, xi = rng.choice(vertices), rng.choice([0, 0.1, 0.3])
+        set_blockage(bayes_network, node, xi)
+        x[node] = xi
+    elif kind == "add_vertex":
+        node = max(vertices) + 1
+        roads = {neighbor: rng.choice([1, 3]) for neighbor in rng.sample(vertices, min(2, len(vertices)))}
+        add_vertex(bayes_network, node, 0.2, roads)
+        graph.add_node(node)
+        graph.add_edges_from((node, neighbor, {"weight": weight}) for neighbor, weight in roads.items())
+        x[node] = 0.2
+    elif kind == "remove_vertex" and len(vertices) > 1:
+        node = rng.choice(vertices)
+        remove_vertex(bayes_network, node)
+        graph.remove_node(node)
+        del x[node]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_edits(seed):
+    rng = random.Random(seed)
+    graph, x = random_road_graph(seed)
+    bayes_network = create_bayes_network(graph, WEATHER, x)
+    for step in range(4):
+        #answers cached before the edit must not survive it when they depend on it
+        posterior_marginals({}, bayes_network)
+        variable_elimination_ask(["W"], {}, bayes_network)
+        edit(graph, x, bayes_network, rng)
+        rebuilt = create_bayes_network(graph, WEATHER, x)
+        evidence = random_evidence(rebuilt, seed+step)
+        assert sorted(bayes_network.nodes) == sorted(rebuilt.nodes)
+        for name in rebuilt.nodes:
+            expected = enumeration_ask([name], evidence, rebuilt)
+            assert_close(variable_elimination_ask([name], evidence, bayes_network), expected)
+            assert_close(enumeration_ask([name], evidence, bayes_network), expected)
+        marginals = posterior_marginals(evidence, bayes_network)
+        for name in rebuilt.nodes:
+            assert_close(marginals[name], enumeration_ask([name], evidence, rebuilt))
+
@@ -0,0 +1,34 @@
+import networkx as nx
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.elimination import evidence_probability, variable_elimination_ask
+from tests.networks import WEATHER, assert_close, brute_evidence_probability, random_evidence, random_network, random_query
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_variable_elimination(seed, engine):
+    bayes_network = random_network(seed)
+    evidence = random_evidence(bayes_network, seed)
+    for size in (1, 2):
+        query = random_query(bayes_network, seed+size, min(size, len(bayes_network)))
+        assert_close(variable_elimination_ask(query, evidence, bayes_network), enumeration_ask(query, evidence, bayes_network))
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_evidence_probability(seed, engine):
+    bayes_network = random_network(seed)
+    evidence = random_evidence(bayes_network, seed)
+    assert abs(evidence_probability(evidence, bayes_network) - brute_evidence_probability(evidence, bayes_network)) <= 1e-12
+
+
+def test_impossible_evidence(engine):
+    #B(1) is never blocked when x(1) = 0
+    graph = nx.Graph()
+    graph.add_edge(1, 2, weight=1)
+    bayes_network = create_bayes_network(graph, WEATHER, {1: 0, 2: 0.2})
+    evidence = {"B(1)": "1"}
+    for ask in (variable_elimination_ask, enumeration_ask):
+        with pytest.raises(ValueError):
+            ask(["W"], evidence, bayes_network)
+    assert len(bayes_network.graph["query_cache"]) == 0
@@ -0,0 +1,13 @@
+import pytest
+
+from bayes import enumeration_ask
+from inference.joint import joint_ask
+from tests.networks import assert_close, random_evidence, random_network, random_query
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_joint_table(seed, engine):
+    bayes_network = random_network(seed)
+    evidence = random_evidence(bayes_network, seed)
+    query = random_query(bayes_network, seed, min(3, len(bayes_network)))
+    assert_close(joint_ask(query, evidence, bayes_network).to_dict(), enumeration_ask(query, evidence, bayes_network))
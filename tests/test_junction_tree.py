@@ -0,0 +1,45 @@
+import networkx as nx
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.junction_tree import InferenceSession, posterior_marginals
+from tests.networks import WEATHER, assert_close, random_evidence, random_network
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_marginals(seed, engine):
+    bayes_network = random_network(seed)
+    evidence = random_evidence(bayes_network, seed)
+    expected = {name: enumeration_ask([name], evidence, bayes_network) for name in bayes_network.nodes}
+    #the closed form over W or the junction tree, whichever posterior_marginals picks
+    marginals = posterior_marginals(evidence, bayes_network)
+    #the junction tree, always
+    session = InferenceSession(bayes_network, evidence)
+    for name in expected:
+        assert_close(marginals[name], expected[name])
+        assert_close(session.marginal(name), expected[name])
+
+
+def test_impossible_evidence(engine):
+    #B(1) is never blocked when x(1) = 0
+    graph = nx.Graph()
+    graph.add_edge(1, 2, weight=1)
+    bayes_network = create_bayes_network(graph, WEATHER, {1: 0, 2: 0.2})
+    evidence = {"B(1)": "1"}
+    with pytest.raises(ValueError):
+        posterior_marginals(evidence, bayes_network)
+    with pytest.raises(ValueError):
+        InferenceSession(bayes_network, evidence).marginal("W")
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_session_updates(seed):
+    bayes_network = random_network(seed)
+    first, second = random_evidence(bayes_network, seed), random_evidence(bayes_network, seed+100)
+    session = InferenceSession(bayes_network, first)
+    for name in first:
+        session.retract(name)
+    for name, state in second.items():
+        session.observe(name, state)
+    for name in bayes_network.nodes:
+        assert_close(session.marginal(name), enumeration_ask([name], second, bayes_network))
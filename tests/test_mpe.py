@@ -0,0 +1,80 @@
+import random
+
+import numpy as np
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.elimination import evidence_probability
+from inference.factors import compile_network
+from inference.mpe import explained_variables, map_ask, mpe_ask, top_map_ask
+from pirsur import parse
+from tests.networks import INPUT, random_evidence, random_network
+
+
+def network():
+    graph, weather, blockage = parse(INPUT)
+    return create_bayes_network(graph, weather, blockage)
+
+
+def ranked(query, evidence, bayes_network):
+    #the joint states of the query by enumeration, from the most probable one
+    distribution = enumeration_ask(query, evidence, bayes_network)
+    return sorted(distribution.items(), key=lambda item: -item[1])
+
+
+def key(query, assignment):
+    return str([name+"="+assignment[name] for name in query])
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_top_map(seed):
+    bayes_network = random_network(seed)
+    evidence = random_evidence(bayes_network, seed)
+    names = sorted(name for name in bayes_network.nodes if name not in evidence)
+    query = random.Random(seed).sample(names, min(2, len(names)))
+    if len(query) == 0:
+        return
+    expected = ranked(query, evidence, bayes_network)
+    distribution = dict(expected)
+    assignment, probability = map_ask(query, evidence, bayes_network)
+    assert abs(probability - expected[0][1]) <= 1e-9
+    assert abs(distribution[key(query, assignment)] - probability) <= 1e-9
+    explanations = top_map_ask(query, evidence, bayes_network, 3)
+    assert [round(p, 9) for _, p in explanations] == [round(p, 9) for _, p in expected[:3] if p > 0]
+    for assignment, probability in explanations:
+        assert abs(distribution[key(query, assignment)] - probability) <= 1e-9
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_mpe(seed):
+    bayes_network = random_network(seed)
+    evidence = random_evidence(bayes_network, seed)
+    compiled = compile_network(bayes_network)
+    query = explained_variables(compiled, compiled.evidence_ids(evidence))
+    explanations = mpe_ask(evidence, bayes_network, k=2)
+    if len(query) == 0:
+        assert explanations == [({}, pytest.approx(evidence_probability(evidence, bayes_network)))]
+        return
+    expected = ranked(query, evidence, bayes_network)
+    assert [round(p, 9) for _, p in explanations] == [round(p, 9) for _, p in expected[:2] if p > 0]
+
+
+def test_everything_observed():
+    #W and every B(i) observed leave nothing to explain
+    bayes_network = network()
+    evidence = {"W": "mild", "B(1)": "0", "B(2)": "1", "B(3)": "0", "B(4)": "0", "Ev(1)": "1"}
+    probability = evidence_probability(evidence, bayes_network)
+    assert mpe_ask(evidence, bayes_network, k=3) == [({}, probability)]
+    assert map_ask([], evidence, bayes_network) == ({}, probability)
+    assert top_map_ask([], evidence, bayes_network, 0) == []
+
+
+def test_tables_unchanged():
+    #the max-product clips its factors without touching the tables of the compiled network
+    bayes_network = network()
+    compiled = compile_network(bayes_network)
+    tables = [cpt.values for cpt in compiled.cpts if hasattr(cpt, "values")]
+    before = [table.copy() for table in tables]
+    mpe_ask({"Ev(1)": "1"}, bayes_network, k=2)
+    assert all(np.array_equal(table, copy) for table, copy in zip(tables, before))
+
@@ -0,0 +1,57 @@
+import networkx as nx
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.elimination import variable_elimination_ask
+from inference.network_file import build_network_file, load_network, read_network, save_network
+from pirsur import parse
+from tests.networks import assert_close, random_evidence, random_road_graph, write_input
+
+
+def instance(tmp_path, seed: int, **kwargs):
+    #an input file and the network create_bayes_network builds from it
+    graph, x = random_road_graph(seed, **kwargs)
+    path = str(tmp_path / "input.txt")
+    write_input(path, graph, x)
+    graph, weather, blockage = parse(path)
+    return path, create_bayes_network(graph, weather, blockage)
+
+
+def names(bayes_network):
+    return sorted(bayes_network.nodes)
+
+
+@pytest.mark.parametrize("seed", range(15))
+def test_read_network(tmp_path, seed):
+    path, bayes_network = instance(tmp_path, seed)
+    build_network_file(path, str(tmp_path / "network.bnet"))
+    save_network(bayes_network, str(tmp_path / "saved.bnet"))
+    networks = [read_network(path), load_network(str(tmp_path / "network.bnet")), load_network(str(tmp_path / "saved.bnet"), mmap=False)]
+    evidence = random_evidence(bayes_network, seed)
+    for name in names(bayes_network):
+        expected = enumeration_ask([name], evidence, bayes_network)
+        for network in networks:
+            assert_close(variable_elimination_ask([name], evidence, network), expected)
+
+
+def test_no_roads(tmp_path):
+    #a file without #E lines, every Ev(i) only has B(i) as a parent
+    path, bayes_network = instance(tmp_path, 0, vertices=3, roads=0)
+    build_network_file(path, str(tmp_path / "network.bnet"))
+    networks = [read_network(path), load_network(str(tmp_path / "network.bnet"))]
+    evidence = {"Ev(1)": "1", "Ev(2)": "0"}
+    for name in names(bayes_network):
+        expected = enumeration_ask([name], evidence, bayes_network)
+        for network in networks:
+            assert_close(variable_elimination_ask([name], evidence, network), expected)
+
+
+def test_self_loop(tmp_path):
+    graph = nx.Graph()
+    graph.add_edge(1, 1, weight=2)
+    graph.add_edge(1, 2, weight=3)
+    path = str(tmp_path / "input.txt")
+    write_input(path, graph, {1: 0.2, 2: 0.0})
+    bayes_network = create_bayes_network(*parse(path))
+    evidence = {"Ev(1)": "1", "Ev(2)": "1"}
+    assert_close(variable_elimination_ask(["W"], evidence, read_network(path)), enumeration_ask(["W"], evidence, bayes_network))
@@ -0,0 +1,21 @@
+import pytest
+
+from bayes import enumeration_ask
+from inference.elimination import variable_elimination_ask
+from inference.parallel import parallel_ask
+from tests.networks import assert_close, random_evidence, random_network, random_query
+
+
+@pytest.mark.parametrize("ask", [variable_elimination_ask, enumeration_ask])
+def test_parallel_ask(ask):
+    #the answers of the workers, in the order of the jobs, are the serial ones
+    bayes_network = random_network(3, vertices=5)
+    jobs = [(random_query(bayes_network, seed, 1 + seed % 2), random_evidence(bayes_network, seed)) for seed in range(12)]
+    #the serial answers come from a copy of the network, so the workers do not inherit them in the query cache
+    serial = random_network(3, vertices=5)
+    expected = [enumeration_ask(query, evidence, serial) for query, evidence in jobs]
+    for processes in (1, 3):
+        answers = parallel_ask(jobs, bayes_network, processes, ask, chunksize=2)
+        assert len(answers) == len(jobs)
+        for answer, distribution in zip(answers, expected):
+            assert_close(answer, distribution)
@@ -0,0 +1,53 @@
+import random
+
+import networkx as nx
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.paths import most_probably_free_paths, path_free_probability
+from tests.networks import (WEATHER, brute_evidence_probability, random_evidence, random_network,
+                            random_road_graph)
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_path_free_probability(seed, engine):
+    bayes_network = random_network(seed)
+    evidence = random_evidence(bayes_network, seed, [name for name in bayes_network.nodes if name.startswith("Ev(")])
+    vertices = [name[2:-1] for name in bayes_network.nodes if name.startswith("B(")]
+    path = random.Random(seed).sample(vertices, min(2, len(vertices)))
+    query = ["B("+vertex+")" for vertex in path]
+    expected = enumeration_ask(query, evidence, bayes_network)[str([name+"=0" for name in query])]
+    assert abs(path_free_probability([int(vertex) for vertex in path], evidence, bayes_network) - expected) <= 1e-9
+
+
+def test_impossible_evidence(engine):
+    #B(1) is never blocked when x(1) = 0
+    graph = nx.Graph()
+    graph.add_edge(1, 2, weight=1)
+    bayes_network = create_bayes_network(graph, WEATHER, {1: 0, 2: 0.2})
+    with pytest.raises(ValueError):
+        path_free_probability([1, 2], {"B(1)": "1"}, bayes_network)
+
+
+#71, 140 and 158 are networks where the product of the marginals given W ranks a route of probability 0 first
+@pytest.mark.parametrize("seed", list(range(40)) + [71, 140, 158])
+def test_most_probably_free_paths(seed, engine):
+    #the search against every simple path from 1 to 6, scored exactly
+    rng = random.Random(seed)
+    graph, x = random_road_graph(seed, vertices=6, roads=rng.randint(6, 12))
+    bayes_network = create_bayes_network(graph, WEATHER, x)
+    #mostly Ev(i)=1 reports, they couple the blockages of the neighbours of i
+    evidence = {"Ev("+str(i)+")": rng.choice("011") for i in rng.sample(sorted(graph.nodes), 3)}
+    if brute_evidence_probability(evidence, bayes_network) <= 1e-12:
+        evidence = {}
+    source, target, k = 1, 6, 3
+    expected = sorted((path_free_probability(path, evidence, bayes_network) for path in nx.all_simple_paths(graph, source, target)), reverse=True)
+    paths = most_probably_free_paths(graph, source, target, evidence, bayes_network, k)
+    for path, probability in paths:
+        assert path[0] == source and path[-1] == target and len(set(path)) == len(path)
+        assert all(graph.has_edge(u, v) for u, v in zip(path, path[1:]))
+        assert abs(probability - path_free_probability(path, evidence, bayes_network)) <= 1e-12
+    #paths with probability 0 are left out, up to the rounding of the noisy-OR decomposition
+    found = [probability for _, probability in paths if probability > 1e-9]
+    assert len(found) == len([probability for probability in expected[:k] if probability > 1e-9])
+    assert all(abs(a - b) <= 1e-9 for a, b in zip(found, expected))
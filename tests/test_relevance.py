@@ -0,0 +1,78 @@
+import random
+
+import networkx as nx
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.factors import compile_network
+from inference.relevance import ancestors, bayes_ball, relevant_network
+from tests.networks import WEATHER, assert_close, random_evidence, random_network, random_query
+
+
+def road_network():
+    #the roads 1 - 2 - 3
+    graph = nx.Graph()
+    graph.add_edge(1, 2, weight=1)
+    graph.add_edge(2, 3, weight=1)
+    return create_bayes_network(graph, WEATHER, {1: 0.1, 2: 0.2, 3: 0.3})
+
+
+def names(compiled, ids):
+    return {compiled.names[var] for var in ids}
+
+
+def test_ancestors():
+    compiled = compile_network(road_network())
+    found = ancestors(compiled, [compiled.index["Ev(1)"]])
+    assert names(compiled, found) == {"W", "B(1)", "B(2)", "Ev(1)"}
+    #in topological order
+    assert found == [var for var in compiled.order if var in found]
+    assert names(compiled, ancestors(compiled, [compiled.index["W"]])) == {"W"}
+
+
+def test_bayes_ball():
+    compiled = compile_network(road_network())
+    index = compiled.index
+    #without evidence every report is barren
+    requisite, visited = bayes_ball(compiled, [index["B(1)"]], {})
+    assert names(compiled, requisite) == {"W", "B(1)"} and visited == set()
+    #an observed W d-separates B(1) from the rest, its table is not needed but its evidence is
+    requisite, visited = bayes_ball(compiled, [index["B(1)"]], {index["W"]: 0, index["Ev(3)"]: 1})
+    assert names(compiled, requisite) == {"B(1)"} and names(compiled, visited) == {"W"}
+    #a report of 1 couples B(1) and B(2), the report of 3 only matters through W and B(2)
+    requisite, visited = bayes_ball(compiled, [index["B(1)"]], {index["Ev(1)"]: 1, index["Ev(3)"]: 1})
+    assert names(compiled, requisite) == {"W", "B(1)", "B(2)", "B(3)", "Ev(1)", "Ev(3)"}
+    assert names(compiled, visited) == {"Ev(1)", "Ev(3)"}
+    #an observed query variable keeps its evidence in relevant_network
+    variables, evidence = relevant_network(compiled, [index["B(1)"]], {index["B(1)"]: 0, index["W"]: 1})
+    assert names(compiled, variables) == {"B(1)"} and evidence == {index["B(1)"]: 0, index["W"]: 1}
+
+
+def random_tables(bayes_network, names, rng):
+    #new tables for the W and B variables among names
+    for name in names:
+        table = bayes_network.nodes[name]["probabilities"]
+        if name == "W":
+            weights = [rng.random() for _ in WEATHER]
+            table |= {state: weight / sum(weights) for state, weight in zip(WEATHER, weights)}
+        elif name.startswith("B("):
+            blocked = {state: rng.random() for state in WEATHER}
+            table |= {name+"=1": blocked, name+"=0": {state: 1 - p for state, p in blocked.items()}}
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_relevant_network(seed):
+    #the tables outside the requisite variables and the evidence outside the requisite observations
+    #do not change the answer
+    rng = random.Random(seed)
+    bayes_network = random_network(seed)
+    evidence = random_evidence(bayes_network, seed)
+    query = random_query(bayes_network, seed, min(2, len(bayes_network)))
+    expected = enumeration_ask(query, evidence, bayes_network)
+    compiled = compile_network(bayes_network)
+    variables, kept = relevant_network(compiled, [compiled.index[q] for q in query], compiled.evidence_ids(evidence))
+    assert set(kept) <= set(compiled.evidence_ids(evidence))
+    kept = {name: evidence[name] for name in names(compiled, kept)}
+    random_tables(bayes_network, set(bayes_network.nodes) - names(compiled, variables), rng)
+    assert_close(enumeration_ask(query, evidence, bayes_network), expected)
+    assert_close(enumeration_ask(query, kept, bayes_network), expected)
@@ -0,0 +1,53 @@
+import time
+
+import networkx as nx
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.factors import compile_network
+from inference.sampling import approximate_ask
+from pirsur import parse
+from tests.networks import INPUT, WEATHER
+
+
+def network():
+    graph, weather, blockage = parse(INPUT)
+    return create_bayes_network(graph, weather, blockage)
+
+
+@pytest.mark.parametrize("method", ["lw", "gibbs"])
+def test_estimate(method):
+    bayes_network = network()
+    evidence = {"Ev(1)": "1", "Ev(3)": "0"}
+    expected = enumeration_ask(["W", "B(2)"], evidence, bayes_network)
+    estimate = approximate_ask(["W", "B(2)"], evidence, bayes_network, n_samples=40000, method=method, seed=1)
+    for key, probability in expected.items():
+        assert abs(estimate.distribution[key] - probability) <= 0.03
+
+
+@pytest.mark.parametrize("method", ["lw", "gibbs"])
+def test_no_time(method):
+    #a budget that runs out before sampling starts still gives an estimate of the first batch (or of the chain seeds)
+    estimate = approximate_ask(["W"], {"Ev(1)": "1"}, network(), method=method, seed=1, time_budget=0)
+    assert estimate.n_samples > 0
+    assert abs(sum(estimate.distribution.values()) - 1) <= 1e-9
+
+
+def test_no_samples():
+    with pytest.raises(ValueError, match="no samples"):
+        approximate_ask(["W"], {}, network(), n_samples=0)
+
+
+@pytest.mark.parametrize("method", ["lw", "gibbs"])
+def test_time_budget(method):
+    #a 40x40 grid where a full batch of likelihood weighting or a gibbs sweep takes longer than the budget
+    graph = nx.convert_node_labels_to_integers(nx.grid_2d_graph(40, 40), 1)
+    nx.set_edge_attributes(graph, 1, "weight")
+    bayes_network = create_bayes_network(graph, WEATHER, {i: 0.1 for i in graph.nodes})
+    compile_network(bayes_network)
+    evidence = {"Ev("+str(i)+")": "0" for i in graph.nodes if i % 3 == 0}
+    start = time.perf_counter()
+    estimate = approximate_ask(["W"], evidence, bayes_network, method=method, seed=1, time_budget=0.05)
+    assert time.perf_counter() - start < 0.75
+    assert estimate.n_samples > 0
+    assert abs(sum(estimate.distribution.values()) - 1) <= 1e-9
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import service as service_module
+from bayes import enumeration_ask
+from inference.network_file import read_network
+from service import Service
+from tests.networks import INPUT, assert_close
+
+
+def run(service, lines):
+    #the answers of the service to the lines, each query answered before the next line is sent
+    answers = []
+
+    async def respond(answer):
+        answers.append(json.loads(json.dumps(answer)))
+
+    async def send():
+        for line in lines:
+            task = await service.handle(line, respond)
+            if task is not None:
+                await task
+
+    asyncio.run(send())
+    return answers
+
+
+def test_bad_messages():
+    #every bad line gets an error, the stream and the evidence go on
+    service = Service({"roads": read_network(INPUT)})
+    answers = run(service, [
+        "[1, 2]",
+        "not json",
+        '{"type": "evidence", "graph": "roads"}',
+        '{"type": "evidence", "variable": "Ev(1)", "value": "yes"}',
+        '{"type": "evidence", "variable": "Ev(99)", "value": "1"}',
+        '{"type": "evidence", "graph": "nowhere", "variable": "Ev(1)", "value": "1"}',
+        '{"type": "evidence", "variable": "Ev(1)", "value": "1"}',
+        '{"type": "query", "id": 1, "variables": ["W"]}',
+        '{"type": "query", "id": 2, "variables": ["X"]}',
+    ])
+    assert all("error" in answer for answer in answers[:6])
+    assert service.graphs["roads"].evidence == {"Ev(1)": "1"}
+    assert answers[6]["id"] == 1 and answers[6]["version"] == 1
+    assert abs(sum(answers[6]["marginals"]["W"].values()) - 1) <= 1e-9
+    assert answers[7]["id"] == 2 and "error" in answers[7]
+
+
+
+def test_variables_not_a_list():
+    service = Service({"roads": read_network(INPUT)})
+    answers = run(service, [
+        '{"type": "query", "id": 1, "variables": "W"}',
+        '{"type": "query", "id": 2, "variables": "B(1)"}',
+        '{"type": "query", "id": 3, "variables": [1]}',
+        '{"type": "query", "id": 4, "variables": {"W": 1}}',
+    ])
+    assert [answer["id"] for answer in answers] == [1, 2, 3, 4]
+    for answer in answers:
+        assert "list of variable names" in answer["error"]
+
+
+def test_coalesced_queries(monkeypatch):
+    #the queries waiting together are answered by one inference, with all the evidence sent before them
+    calls = []
+
+    def counted(evidence, bayes_network, variables=None):
+        calls.append(variables)
+        return posterior_marginals(evidence, bayes_network, variables)
+
+    posterior_marginals = service_module.posterior_marginals
+    monkeypatch.setattr(service_module, "posterior_marginals", counted)
+    bayes_network = read_network(INPUT)
+    service = Service({"roads": bayes_network})
+    first = [
+        '{"type": "evidence", "variable": "Ev(1)", "value": "1"}',
+        '{"type": "query", "id": 1, "variables": ["W"]}',
+        '{"type": "evidence", "variable": "Ev(2)", "value": "0"}',
+        '{"type": "evidence", "variable": "Ev(2)", "value": null}',
+        '{"type": "evidence", "variable": "Ev(3)", "value": "0"}',
+        '{"type": "query", "id": 2, "variables": ["B(2)", "W"]}',
+    ]
+    #sent after the answers to the first lines
+    second = ['{"type": "reset"}', '{"type": "query", "id": 3}']
+    answers = []
+
+    async def respond(answer):
+        answers.append(json.loads(json.dumps(answer)))
+
+    async def send():
+        for lines in (first, second):
+            tasks = [await service.handle(line, respond) for line in lines]
+            await asyncio.gather(*[task for task in tasks if task is not None])
+
+    asyncio.run(send())
+    #the first two queries were answered together, with the union of their variables
+    assert calls == [["B(2)", "W"], None]
+    answered = {answer["id"]: answer for answer in answers}
+    assert len(answers) == 3 and answers[2]["id"] == 3
+    assert set(answered[1]["marginals"]) == {"W"} and set(answered[2]["marginals"]) == {"B(2)", "W"}
+    evidence = {"Ev(1)": "1", "Ev(3)": "0"}
+    for answer in (answered[1], answered[2]):
+        assert answer["version"] == 4
+        for name, marginal in answer["marginals"].items():
+            assert_close(marginal, enumeration_ask([name], evidence, bayes_network))
+    assert answered[3]["version"] == 5 and set(answered[3]["marginals"]) == set(bayes_network.nodes)
@@ -0,0 +1,42 @@
+from bayes import enumeration_ask
+from inference.elimination import variable_elimination_ask
+from inference.stats import InferenceStats
+from tests.networks import random_network
+
+
+def test_elimination_stats(no_closed_form):
+    bayes_network = random_network(4, vertices=5, roads=6)
+    evidence = {"Ev(1)": "1", "Ev(2)": "1"}
+    events = []
+    stats = InferenceStats()
+    variable_elimination_ask(["W"], evidence, bayes_network, stats, trace=lambda event, details: events.append((event, details)))
+    assert stats.engine == "variable_elimination"
+    assert stats.cache_misses == 1 and stats.cache_hits == 0
+    eliminated = [details for event, details in events if event == "eliminate"]
+    #one sum per eliminated variable, and every product it builds is recorded
+    assert eliminated and stats.factor_sums == len(eliminated)
+    assert stats.factor_products >= len(eliminated)
+    assert stats.largest_factor == max(details["size"] for details in eliminated)
+    assert stats.width == max(details["width"] for details in eliminated)
+    assert len({details["variable"] for details in eliminated}) == len(eliminated)
+    #every timed phase is traced with the time it took
+    phases = [details for event, details in events if event == "phase"]
+    assert {details["name"] for details in phases} == set(stats.phases)
+    assert {"compile", "prune", "eliminate", "normalize"} <= set(stats.phases)
+    assert abs(sum(details["seconds"] for details in phases) - sum(stats.phases.values())) <= 1e-9
+    assert [details for event, details in events if event == "cache"] == [{"hit": False}]
+
+    #the same stats object adds up the counters of the next queries, a cached answer is a hit
+    products = stats.factor_products
+    variable_elimination_ask(["W"], evidence, bayes_network, stats)
+    assert stats.engine == "cache" and stats.cache_hits == 1 and stats.factor_products == products
+    enumeration_ask(["W"], evidence, bayes_network, stats)
+    assert stats.engine == "enumeration" and stats.calls > 0 and stats.cache_misses == 2
+
+
+def test_trace_only():
+    #a trace without a stats object still gets the events
+    bayes_network = random_network(4)
+    events = []
+    enumeration_ask(["W"], {}, bayes_network, trace=lambda event, details: events.append(event))
+    assert "cache" in events and "phase" in events
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from bayes import create_bayes_network, enumeration_ask
+from inference.elimination import variable_elimination_ask
+from inference.network_file import PrebuiltNetwork, compile_road_network
+from inference.parser import parse_stream
+from inference.sweep import ParameterizedNetwork, parameter_grid, parameter_sweep
+from tests.networks import WEATHER, assert_close, random_evidence, random_road_graph, write_input
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_parameter_sweep(seed):
+    graph, x = random_road_graph(seed)
+    network = ParameterizedNetwork.from_graph(graph, WEATHER, x)
+    bayes_network = create_bayes_network(graph, WEATHER, x)
+    evidence = random_evidence(bayes_network, seed, [name for name in bayes_network.nodes if name.startswith("Ev(")])
+    settings = parameter_grid(p1=[0.1, 0.25], p2=[0.2, 0.5])
+    result = parameter_sweep(["W"], evidence, network, settings, processes=1)
+    for row, setting in zip(result, settings):
+        expected = enumeration_ask(["W"], evidence, create_bayes_network(graph, WEATHER, x, **setting))
+        assert np.allclose(row, list(expected.values()), atol=1e-9)
+
+
+def test_no_roads(tmp_path):
+    #a file without #E lines, every Ev(i) only has B(i) as a parent
+    graph, x = random_road_graph(0, vertices=3, roads=0)
+    path = str(tmp_path / "input.txt")
+    write_input(path, graph, x)
+    network = ParameterizedNetwork.from_file(path)
+    bayes_network = create_bayes_network(graph, WEATHER, x)
+    evidence = {"Ev(1)": "1", "Ev(2)": "0"}
+    for name in bayes_network.nodes:
+        assert_close(variable_elimination_ask([name], evidence, network), enumeration_ask([name], evidence, bayes_network))
+
+
+def test_weather_order(tmp_path):
+    #the weather states are mapped to the tables by name, not by the order of the dictionary
+    graph, x = random_road_graph(2, vertices=3, roads=3)
+    weather = {"extreme": 0.2, "stormy": 0.3, "mild": 0.5}
+    bayes_network = create_bayes_network(graph, weather, x)
+    path = str(tmp_path / "input.txt")
+    write_input(path, graph, x, weather)
+    vertices, blockage, edges, _ = parse_stream(path)
+    networks = [ParameterizedNetwork.from_graph(graph, weather, x),
+                PrebuiltNetwork(compile_road_network(vertices, blockage, edges, weather))]
+    evidence = {"Ev(1)": "1"}
+    for name in bayes_network.nodes:
+        expected = enumeration_ask([name], evidence, bayes_network)
+        for network in networks:
+            assert_close(variable_elimination_ask([name], evidence, network), expected)
+    with pytest.raises(ValueError):
+        ParameterizedNetwork.from_graph(graph, {"mild": 0.5, "foggy": 0.5}, x)